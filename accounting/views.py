@@ -6,6 +6,7 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from .models import CashUpReport, Remittance
 from .serializers import CashUpReportSerializer, RemittanceSerializer
 from core.permissions import IsTenantMember, IsAccountant, IsShopManager
+from core.idempotency import idempotent
 from notifications.services import NotificationService
 
 
@@ -59,6 +60,11 @@ class RemittanceViewSet(viewsets.ModelViewSet):
     serializer_class = RemittanceSerializer
     permission_classes = [permissions.IsAuthenticated, IsTenantMember]
     
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Create remittance (replayable with an Idempotency-Key header)"""
+        return super().create(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         """Create remittance and send notification"""
         remittance = serializer.save(submitted_by=self.request.user)
@@ -9,7 +9,8 @@ class SystemConfigurationAdmin(admin.ModelAdmin):
     raw_id_fields = ['tenant']
     fieldsets = (
         ('Inventory', {
-            'fields': ('allow_negative_stock', 'negative_stock_behavior', 'track_batches', 'track_expiry')
+            'fields': ('allow_negative_stock', 'negative_stock_behavior', 'track_batches', 'track_expiry',
+                       'batch_allocation_strategy')
         }),
         ('Pricing', {
             'fields': ('require_margin_check', 'margin_check_behavior')
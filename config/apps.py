@@ -5,3 +5,6 @@ class ConfigConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'config'
 
+    
+    def ready(self):
+        import config.signals  # noqa
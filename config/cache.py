@@ -0,0 +1,142 @@
+"""
+Process-local cache of tenant and location configuration
+"""
+import time
+from django.conf import settings
+from django.core.cache import caches
+from core.cache_versions import bump_version, current_version
+from core.models import Location
+from .models import SystemConfiguration, WorkflowConfiguration
+
+
+class ConfigCache:
+    """
+    Versioned, process-local cache for configuration read on hot paths
+    
+    Entries live in this process and are tagged with the version counter of
+    their tenant or location. Saving a configuration bumps the counter. With
+    CONFIG_CACHE_ALIAS set, counters are kept in that shared cache so every
+    worker sees the bump within CONFIG_CACHE_CHECK_INTERVAL seconds; without
+    it, counters are process-local and other workers only pick changes up
+    once their copy is older than CONFIG_CACHE_TIMEOUT.
+    Cached model instances are shared between callers and must not be modified.
+    """
+    
+    _entries = {}
+    _versions = {}
+    
+    @staticmethod
+    def system(tenant_id):
+        """
+        SystemConfiguration of a tenant, or None
+        """
+        return ConfigCache._get(
+            ('system', tenant_id),
+            ConfigCache._tenant_version_key(tenant_id),
+            lambda: SystemConfiguration.objects.filter(tenant_id=tenant_id).first()
+        )
+    
+    @staticmethod
+    def workflow(tenant_id, workflow_name):
+        """
+        config_data of an active WorkflowConfiguration, or None
+        """
+        workflows = ConfigCache._get(
+            ('workflow', tenant_id),
+            ConfigCache._tenant_version_key(tenant_id),
+            lambda: dict(WorkflowConfiguration.objects.filter(
+                tenant_id=tenant_id,
+                is_active=True
+            ).values_list('workflow_name', 'config_data'))
+        )
+        return workflows.get(workflow_name)
+    
+    @staticmethod
+    def location(location_id):
+        """
+        Location by id, or None
+        """
+        return ConfigCache._get(
+            ('location', str(location_id)),
+            ConfigCache._location_version_key(location_id),
+            lambda: Location.objects.filter(id=location_id).first()
+        )
+    
+    @staticmethod
+    def invalidate_tenant(tenant_id):
+        """
+        Drop cached system and workflow configuration of a tenant
+        """
+        ConfigCache._bump(ConfigCache._tenant_version_key(tenant_id))
+        ConfigCache._entries.pop(('system', tenant_id), None)
+        ConfigCache._entries.pop(('workflow', tenant_id), None)
+    
+    @staticmethod
+    def invalidate_location(location_id):
+        """
+        Drop a cached location
+        """
+        ConfigCache._bump(ConfigCache._location_version_key(location_id))
+        ConfigCache._entries.pop(('location', str(location_id)), None)
+    
+    @staticmethod
+    def clear():
+        """
+        Drop every entry cached by this process
+        """
+        ConfigCache._entries.clear()
+        ConfigCache._versions.clear()
+    
+    @staticmethod
+    def _get(key, version_key, loader):
+        """Cached value of a key, loaded again when stale or invalidated"""
+        now = time.monotonic()
+        entry = ConfigCache._entries.get(key)
+        if entry is not None:
+            version, value, loaded_at, checked_at = entry
+            if now - loaded_at < settings.CONFIG_CACHE_TIMEOUT:
+                if now - checked_at < settings.CONFIG_CACHE_CHECK_INTERVAL:
+                    return value
+                if ConfigCache._version(version_key) == version:
+                    ConfigCache._entries[key] = (version, value, loaded_at, now)
+                    return value
+        
+        # Read the version before loading so a concurrent bump is never masked
+        version = ConfigCache._version(version_key)
+        value = loader()
+        ConfigCache._entries[key] = (version, value, now, now)
+        return value
+    
+    @staticmethod
+    def _tenant_version_key(tenant_id):
+        """Cache key of the tenant invalidation counter"""
+        return f'config:tenant:{tenant_id}'
+    
+    @staticmethod
+    def _location_version_key(location_id):
+        """Cache key of the location invalidation counter"""
+        return f'config:location:{location_id}'
+    
+    @staticmethod
+    def _backend():
+        """Shared cache holding invalidation counters, if configured"""
+        if settings.CONFIG_CACHE_ALIAS:
+            return caches[settings.CONFIG_CACHE_ALIAS]
+        return None
+    
+    @staticmethod
+    def _version(key):
+        """Current value of an invalidation counter"""
+        backend = ConfigCache._backend()
+        if backend is None:
+            return ConfigCache._versions.get(key, 0)
+        return current_version(backend, key)
+    
+    @staticmethod
+    def _bump(key):
+        """Advance an invalidation counter"""
+        backend = ConfigCache._backend()
+        if backend is None:
+            ConfigCache._versions[key] = ConfigCache._versions.get(key, 0) + 1
+            return
+        bump_version(backend, key)
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemconfiguration',
+            name='batch_allocation_strategy',
+            field=models.CharField(choices=[('fefo', 'First expiry, first out'), ('fifo', 'First produced, first out')], default='fefo', help_text='How batches are picked for sale lines scanned without a batch', max_length=10),
+        ),
+    ]
@@ -17,6 +17,12 @@ class SystemConfiguration(models.Model):
     )
     track_batches = models.BooleanField(default=True)
     track_expiry = models.BooleanField(default=False)
+    batch_allocation_strategy = models.CharField(
+        max_length=10,
+        choices=[('fefo', 'First expiry, first out'), ('fifo', 'First produced, first out')],
+        default='fefo',
+        help_text="How batches are picked for sale lines scanned without a batch"
+    )
     
     # Pricing settings
     require_margin_check = models.BooleanField(default=True)
@@ -0,0 +1,26 @@
+"""
+Signal handlers for config app
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import Location
+from .models import SystemConfiguration, WorkflowConfiguration
+from .cache import ConfigCache
+
+
+@receiver([post_save, post_delete], sender=SystemConfiguration)
+@receiver([post_save, post_delete], sender=WorkflowConfiguration)
+def invalidate_tenant_config(sender, instance, **kwargs):
+    """
+    Drop cached configuration of the tenant once the change is committed
+    """
+    transaction.on_commit(lambda: ConfigCache.invalidate_tenant(instance.tenant_id))
+
+
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_location_config(sender, instance, **kwargs):
+    """
+    Drop the cached location once the change is committed
+    """
+    transaction.on_commit(lambda: ConfigCache.invalidate_location(instance.id))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import Tenant, Location, Role, User, UserLocationRole
+from .models import Tenant, Location, Role, User, UserLocationRole, IdempotencyKey
 
 
 @admin.register(Tenant)
@@ -57,3 +57,11 @@ class UserLocationRoleAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'assigned_at']
     raw_id_fields = ['user', 'location', 'role', 'assigned_by']
 
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'method', 'path', 'response_status', 'created_at', 'expires_at']
+    list_filter = ['method', 'response_status']
+    search_fields = ['key', 'user__username', 'path']
+    readonly_fields = ['id', 'created_at']
+    raw_id_fields = ['user']
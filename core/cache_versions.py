@@ -0,0 +1,36 @@
+"""
+Invalidation counters kept in a Django cache backend
+"""
+import time
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(backend):
+    """Whether every worker process sees the same entries of a backend"""
+    return not isinstance(backend, (LocMemCache, DummyCache))
+
+
+def current_version(backend, key):
+    """
+    Current value of an invalidation counter
+    
+    Missing counters (never set or evicted) start from a fresh timestamp so
+    entries cached under an older counter can never be matched again.
+    """
+    value = backend.get(key)
+    if value is None:
+        value = time.time_ns()
+        if not backend.add(key, value, None):
+            value = backend.get(key, value)
+    return value
+
+
+def bump_version(backend, key):
+    """
+    Advance an invalidation counter
+    """
+    try:
+        backend.incr(key)
+    except ValueError:
+        backend.set(key, time.time_ns(), None)
@@ -0,0 +1,142 @@
+"""
+Idempotency-Key support for retried POST requests
+"""
+import functools
+import hashlib
+import json
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+    """
+    Hash of the parts of a request that must match for a key to be replayed
+    """
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f"{request.method}\n{request.path}\n{body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def idempotent(view_method):
+    """
+    Make a DRF view method replay its stored response for a repeated Idempotency-Key
+    
+    The first request with a given key reserves it, runs the view and stores
+    the response. Replays within IDEMPOTENCY_KEY_TTL return the stored
+    response without running the view again. Server errors are not stored,
+    so the client may retry them with the same key. A reservation holds
+    for IDEMPOTENCY_KEY_LEASE seconds; a retry of a request that has not
+    finished by then (its worker died) takes the key over and runs the view
+    again, so views should tolerate repeating work that committed just
+    before its worker died (a repeated client_sale_id returns the sale).
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        
+        if len(key) > 255:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        now = timezone.now()
+        fingerprint = request_fingerprint(request)
+        
+        # Expired keys behave as if they were never used
+        IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).delete()
+        
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    method=request.method,
+                    path=request.path[:255],
+                    request_hash=fingerprint,
+                    locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE),
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+                )
+        except IntegrityError:
+            record = _take_over(request, key, fingerprint, now)
+            if record is None:
+                return _replay(request, key, fingerprint)
+        
+        # Only while the lease is still ours, so a request that was taken
+        # over cannot overwrite or release the key of the one that took it
+        held = IdempotencyKey.objects.filter(id=record.id, locked_until=record.locked_until)
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            held.delete()
+            raise
+        
+        if response.status_code >= 500:
+            held.delete()
+            return response
+        
+        held.update(response_status=response.status_code, response_body=response.data)
+        return response
+    
+    return wrapper
+
+
+def _take_over(request, key, fingerprint, now):
+    """
+    Reserve a key whose request never finished within its lease, or None
+    """
+    locked_until = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE)
+    taken = IdempotencyKey.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lte=now),
+        user=request.user,
+        key=key,
+        request_hash=fingerprint,
+        response_status__isnull=True
+    ).update(locked_until=locked_until, expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL))
+    if not taken:
+        return None
+    return IdempotencyKey.objects.filter(user=request.user, key=key, locked_until=locked_until).first()
+
+
+def _replay(request, key, fingerprint):
+    """
+    Response for a request whose key has already been reserved
+    """
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+    
+    if record is None:
+        # Reservation was released by a failed request in the meantime
+        return Response(
+            {'error': 'Request with this Idempotency-Key failed, please retry'},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    if record.request_hash != fingerprint:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    
+    if record.response_status is None:
+        response = Response(
+            {'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed'},
+            status=status.HTTP_409_CONFLICT
+        )
+        if record.locked_until:
+            response['Retry-After'] = str(max(1, math.ceil((record.locked_until - timezone.now()).total_seconds())))
+        return response
+    
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.validators import MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 
 
@@ -174,4 +175,31 @@ class UserLocationRole(models.Model):
         return f"{self.user.username} - {self.location.name} - {self.role.name}"
 
 
-
+class IdempotencyKey(models.Model):
+    """Stored response for a POST request sent with an Idempotency-Key header"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    
+    # Request fingerprint (a key may only be replayed for the same request)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    
+    # Stored response (status is null while the original request is in progress)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField(null=True, blank=True)  # a retry may take over an unfinished request after this
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        unique_together = [['user', 'key']]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} - {self.method} {self.path}"
@@ -0,0 +1,15 @@
+"""
+Periodic tasks for core
+"""
+from celery import shared_task
+from django.utils import timezone
+from .models import IdempotencyKey
+
+
+@shared_task(ignore_result=True)
+def purge_expired_idempotency_keys():
+    """
+    Delete stored idempotent responses whose TTL has passed
+    """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -4,9 +4,10 @@ Validation utilities for the POS system
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 from .models import Location
-from inventory.models import StockBalance, Product, Batch
-from sales.models import MarginRule, ShopProductCost, CreditAccount
-from config.models import SystemConfiguration
+from inventory.models import StockBalance
+from sales.models import CreditAccount
+from sales.pricing import MarginIndex
+from config.cache import ConfigCache
 
 
 class InventoryValidator:
@@ -19,7 +20,7 @@ class InventoryValidator:
         """
         Validate negative stock based on location configuration
         """
-        config = SystemConfiguration.objects.filter(tenant=location.tenant).first()
+        config = ConfigCache.system(location.tenant_id)
         if not config:
             return True, None
         
@@ -33,6 +34,16 @@ class InventoryValidator:
         except StockBalance.DoesNotExist:
             available = Decimal('0')
         
+        return InventoryValidator.check_negative_stock(location, config, available, quantity_out)
+    
+    @staticmethod
+    def check_negative_stock(location, config, available, quantity_out):
+        """
+        Apply negative stock rules to an already known available quantity
+        """
+        if not config:
+            return True, None
+        
         if available < quantity_out:
             behavior = location.negative_stock_behavior or config.negative_stock_behavior
             
@@ -71,48 +82,30 @@ class PricingValidator:
         """
         Validate margin rules for a product
         """
-        # Get highest batch unit cost for this product
-        if batch:
-            highest_cost = batch.unit_cost
-        else:
-            # Get highest batch cost for this product
-            batches = Batch.objects.filter(
-                product=product,
-                tenant=shop.tenant,
-                is_active=True
-            )
-            if batches.exists():
-                highest_cost = max(b.unit_cost for b in batches)
-            else:
-                # No batches, check shop cost
-                shop_cost = ShopProductCost.objects.filter(
-                    shop=shop,
-                    product=product,
-                    is_active=True
-                ).first()
-                if shop_cost:
-                    highest_cost = shop_cost.unit_cost
-                else:
-                    return True, None  # No cost data, allow
-        
-        # Get margin rule
-        margin_rule = MarginRule.objects.filter(
-            tenant=shop.tenant,
-            shop=shop,
-            product=product,
-            is_active=True
-        ).first()
-        
-        if not margin_rule:
-            # Check for shop-level rule
-            margin_rule = MarginRule.objects.filter(
-                tenant=shop.tenant,
-                shop=shop,
-                product__isnull=True,
-                is_active=True
-            ).first()
+        entry = MarginIndex.entry(shop, product.id)
+        return PricingValidator.check_margin_entry(entry, unit_price, batch)
+    
+    @staticmethod
+    def check_margin_entry(entry, unit_price, batch=None):
+        """
+        Validate a price against a compiled MarginIndex entry
         
-        if margin_rule:
+        Prices at or above the precomputed minimum pass without any arithmetic.
+        A batch-specific sale is checked against that batch's cost instead of
+        the highest cost.
+        """
+        if batch:
+            return PricingValidator.check_margin(entry.rule, batch.unit_cost, unit_price)
+        if entry.minimum_price is None or unit_price >= entry.minimum_price:
+            return True, None
+        return PricingValidator.check_margin(entry.rule, entry.highest_cost, unit_price)
+    
+    @staticmethod
+    def check_margin(margin_rule, highest_cost, unit_price):
+        """
+        Apply a resolved margin rule to a price and cost
+        """
+        if margin_rule and highest_cost is not None:
             # Calculate margin
             if highest_cost > 0:
                 margin_percent = ((unit_price - highest_cost) / highest_cost) * 100
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import ProductCategory, Product, Batch, InventoryLedger, StockBalance, ExpiryAlert
+from .models import (
+    ProductCategory, Product, ProductSearchToken, Batch, InventoryLedger, StockBalance,
+    ReorderPoint, StockCheckpoint, LedgerArchive, StockCount, StockCountLine, ProductImport, ExpiryAlert
+)
 
 
 @admin.register(ProductCategory)
@@ -20,6 +23,14 @@ class ProductAdmin(admin.ModelAdmin):
     raw_id_fields = ['tenant', 'category']
 
 
+@admin.register(ProductSearchToken)
+class ProductSearchTokenAdmin(admin.ModelAdmin):
+    list_display = ['token', 'kind', 'product', 'tenant']
+    list_filter = ['kind', 'tenant']
+    search_fields = ['token', 'product__name', 'product__sku']
+    raw_id_fields = ['tenant', 'product']
+
+
 @admin.register(Batch)
 class BatchAdmin(admin.ModelAdmin):
     list_display = ['batch_number', 'product', 'production_date', 'expiry_date', 'quantity', 'unit_cost', 'is_active']
@@ -49,6 +60,63 @@ class StockBalanceAdmin(admin.ModelAdmin):
     raw_id_fields = ['tenant', 'location', 'product', 'batch']
 
 
+@admin.register(ReorderPoint)
+class ReorderPointAdmin(admin.ModelAdmin):
+    list_display = ['product', 'location', 'reorder_point', 'max_level', 'quantity_on_hand', 'is_below', 'is_active']
+    list_filter = ['is_below', 'is_active', 'location']
+    search_fields = ['product__name', 'product__sku']
+    readonly_fields = ['id', 'quantity_on_hand', 'is_below', 'below_since', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'location', 'product']
+
+
+@admin.register(StockCheckpoint)
+class StockCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['product', 'location', 'batch', 'taken_at', 'quantity_on_hand', 'average_cost', 'stock_value']
+    list_filter = ['location', 'taken_at']
+    search_fields = ['product__name', 'product__sku', 'batch__batch_number']
+    readonly_fields = ['id', 'created_at']
+    raw_id_fields = ['tenant', 'location', 'product', 'batch']
+    date_hierarchy = 'taken_at'
+
+
+@admin.register(LedgerArchive)
+class LedgerArchiveAdmin(admin.ModelAdmin):
+    list_display = ['tenant', 'period_start', 'row_count', 'archived_at', 'restored_at']
+    list_filter = ['tenant', 'period_start']
+    readonly_fields = ['id', 'archived_at', 'restored_at', 'file_path', 'row_count', 'sha256']
+    raw_id_fields = ['tenant']
+
+
+@admin.register(ProductImport)
+class ProductImportAdmin(admin.ModelAdmin):
+    list_display = ['file', 'tenant', 'status', 'processed_rows', 'total_rows', 'created_count',
+                    'updated_count', 'error_count', 'created_at']
+    list_filter = ['status', 'tenant', 'created_at']
+    readonly_fields = ['id', 'total_rows', 'processed_rows', 'created_count', 'updated_count',
+                       'categories_created', 'error_count', 'errors', 'last_error', 'started_at',
+                       'finished_at', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'created_by']
+
+
+@admin.register(StockCount)
+class StockCountAdmin(admin.ModelAdmin):
+    list_display = ['count_number', 'location', 'is_full_count', 'state', 'adjusted_items', 'variance_value', 'created_at']
+    list_filter = ['state', 'is_full_count', 'location', 'created_at']
+    search_fields = ['count_number', 'notes']
+    readonly_fields = ['id', 'adjusted_items', 'variance_value', 'reconciled_at', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'location', 'created_by', 'reconciled_by']
+    date_hierarchy = 'created_at'
+
+
+@admin.register(StockCountLine)
+class StockCountLineAdmin(admin.ModelAdmin):
+    list_display = ['count', 'product', 'batch', 'quantity', 'damaged_quantity', 'line_number', 'counted_by']
+    list_filter = ['count__location']
+    search_fields = ['count__count_number', 'product__name', 'product__sku']
+    readonly_fields = ['id', 'created_at']
+    raw_id_fields = ['count', 'product', 'batch', 'counted_by']
+
+
 @admin.register(ExpiryAlert)
 class ExpiryAlertAdmin(admin.ModelAdmin):
     list_display = ['product', 'location', 'batch', 'expiry_date', 'days_until_expiry', 'quantity', 'alert_sent']
@@ -0,0 +1,209 @@
+"""
+Move old inventory ledger months out of the database
+
+A month of a tenant's ledger is written to a gzip-compressed NDJSON file
+(one ledger row per line) and deleted from inventory_ledger, keeping the
+table and its indexes sized to recent history. Months are only archived
+once every location they touch has a stock checkpoint taken after its
+last row in them, so balances, rebuilds and point-in-time queries from
+the checkpoints on never need the archived rows. restore_archive() puts
+a month back.
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import InventoryLedger, LedgerArchive, StockCheckpoint
+
+
+def month_start(day):
+    """First day of the month of a date"""
+    return day.replace(day=1)
+
+
+def next_month(day):
+    """First day of the month after a date"""
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _json_value(value):
+    # Full precision: DjangoJSONEncoder truncates datetimes to milliseconds
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)  # UUID, Decimal
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def archive_path(tenant_id, period_start):
+    """File holding a tenant's archived ledger month"""
+    return Path(settings.LEDGER_ARCHIVE_DIR) / str(tenant_id) / f'inventory_ledger_{period_start:%Y-%m}.ndjson.gz'
+
+
+def archivable_months(tenant_id, before):
+    """
+    Months with ledger rows of a tenant that end on or before a date
+    """
+    return [
+        timezone.localtime(month).date()
+        for month in InventoryLedger.objects.filter(
+            tenant_id=tenant_id, created_at__lt=_midnight(month_start(before))
+        ).datetimes('created_at', 'month')
+    ]
+
+
+def month_rows(tenant_id, period_start):
+    """Ledger rows of a tenant's month"""
+    return InventoryLedger.objects.filter(
+        tenant_id=tenant_id,
+        created_at__gte=_midnight(period_start),
+        created_at__lt=_midnight(next_month(period_start)),
+    )
+
+
+def uncovered_locations(tenant_id, period_start):
+    """
+    Locations with rows in the month but no stock checkpoint taken after
+    their last row of it
+    """
+    last_rows = month_rows(tenant_id, period_start).values('location_id').annotate(last=Max('created_at'))
+    return {
+        row['location_id'] for row in last_rows
+        if not StockCheckpoint.objects.filter(location_id=row['location_id'], taken_at__gt=row['last']).exists()
+    }
+
+
+def archive_month(tenant_id, period_start, chunk_size=None):
+    """
+    Write a tenant's ledger month to its archive file and delete the rows
+    
+    The file is completely written and synced before any row is deleted,
+    and the deletion only commits if it removed exactly the rows written.
+    Returns the LedgerArchive.
+    """
+    period_start = month_start(period_start)
+    missing = uncovered_locations(tenant_id, period_start)
+    if missing:
+        raise ValueError(
+            f"{len(missing)} location(s) have no stock checkpoint after {period_start:%Y-%m}; "
+            f"take checkpoints before archiving"
+        )
+    
+    rows = month_rows(tenant_id, period_start)
+    path = archive_path(tenant_id, period_start)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+    fields = [field.attname for field in InventoryLedger._meta.concrete_fields]
+    
+    digest = hashlib.sha256()
+    row_count = 0
+    with open(partial, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+            for values in rows.order_by('created_at', 'id').values_list(*fields).iterator(
+                chunk_size=chunk_size or settings.STOCK_REBUILD_CHUNK_SIZE
+            ):
+                out.write(json.dumps(dict(zip(fields, values)), default=_json_value).encode() + b'\n')
+                row_count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    with open(partial, 'rb') as archived:
+        for block in iter(lambda: archived.read(1 << 20), b''):
+            digest.update(block)
+    
+    try:
+        with transaction.atomic():
+            deleted, _ = rows.delete()
+            if deleted != row_count:
+                raise ValueError(
+                    f"Ledger {period_start:%Y-%m} changed while archiving ({row_count} written, {deleted} deleted)"
+                )
+            os.replace(partial, path)
+            archive, _ = LedgerArchive.objects.update_or_create(
+                tenant_id=tenant_id,
+                period_start=period_start,
+                defaults={
+                    'period_end': next_month(period_start),
+                    'file_path': str(path),
+                    'row_count': row_count,
+                    'sha256': digest.hexdigest(),
+                    'archived_at': timezone.now(),
+                    'restored_at': None,
+                },
+            )
+    finally:
+        if partial.exists():
+            partial.unlink()
+    return archive
+
+
+def read_archive(archive):
+    """
+    Iterate over the rows (dicts of column values) of an archive file
+    """
+    digest = hashlib.sha256()
+    with open(archive.file_path, 'rb') as archived:
+        for block in iter(lambda: archived.read(1 << 20), b''):
+            digest.update(block)
+    if digest.hexdigest() != archive.sha256:
+        raise ValueError(f"Archive file {archive.file_path} does not match its checksum")
+    
+    with gzip.open(archive.file_path, 'rt') as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def restore_archive(archive, batch_size=1000):
+    """
+    Put an archived ledger month back into inventory_ledger
+    
+    Rows keep their original ids and created_at, which bulk_create would
+    overwrite (auto_now_add), so they are inserted directly.
+    """
+    if archive.is_restored:
+        raise ValueError(f"Ledger {archive.period_start:%Y-%m} is already restored")
+    
+    fields = InventoryLedger._meta.concrete_fields
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(InventoryLedger._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    
+    def prepare(row):
+        return [
+            field.get_db_prep_save(field.to_python(row[field.attname]), connection)
+            for field in fields
+        ]
+    
+    with transaction.atomic(), connection.cursor() as cursor:
+        batch = []
+        for row in read_archive(archive):
+            batch.append(prepare(row))
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+        archive.restored_at = timezone.now()
+        archive.save(update_fields=['restored_at'])
+    return archive
+
+
+def archived_between(tenant_id, since, until):
+    """
+    Archived (not restored) months of a tenant overlapping [since, until)
+    """
+    if since is not None and since >= until:
+        return []
+    return [
+        archive for archive in LedgerArchive.objects.filter(tenant_id=tenant_id, restored_at__isnull=True)
+        if _midnight(archive.period_start) < until and (since is None or _midnight(archive.period_end) > since)
+    ]
@@ -0,0 +1,389 @@
+"""
+Bulk product catalog import
+
+A CSV with a header row is read PRODUCT_IMPORT_CHUNK_SIZE rows at a time.
+For each chunk, categories are resolved by code in one query (unknown codes
+that come with a category_name are created and linked to their
+parent_category_code), the products already holding the chunk's skus and
+barcodes are fetched in one query, and the valid rows are written: the
+tenant's existing products are updated by id and tenant, and new ones
+inserted with one bulk_create that never touches an existing row, so no
+import can change another tenant's product. Rows with problems are
+reported by line number and skipped; the rest of the file still goes in.
+
+Columns: sku (required), name (required for new products), barcode,
+category_code, category_name, parent_category_code, unit_of_measure,
+description, track_batches, track_expiry, is_active. Only the columns
+present in the file are written to existing products; blank cells take the
+field's default.
+"""
+import csv
+import io
+import logging
+from dataclasses import dataclass, field
+from itertools import islice
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.models import Tenant
+from .models import Product, ProductCategory, ProductImport
+from .search import index_products
+
+logger = logging.getLogger(__name__)
+
+
+# Product columns an import can set, besides sku and category
+PRODUCT_COLUMNS = ['name', 'barcode', 'unit_of_measure', 'description', 'track_batches', 'track_expiry', 'is_active']
+BOOLEAN_COLUMNS = {'track_batches', 'track_expiry', 'is_active'}
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+
+
+@dataclass
+class ImportResult:
+    """Running totals of an import"""
+    processed_rows: int = 0
+    created_count: int = 0
+    updated_count: int = 0
+    categories_created: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < settings.PRODUCT_IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _boolean(value, column):
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"{column} must be true or false")
+
+
+def _product_values(row, columns):
+    """
+    Field values of a row for the columns in the file; raises ValueError
+    """
+    values = {}
+    for column in PRODUCT_COLUMNS:
+        if column not in columns:
+            continue
+        value = _text(row.get(column))
+        model_field = Product._meta.get_field(column)
+        if not value:
+            if column == 'name':
+                raise ValueError('name is required')
+            values[column] = None if model_field.null else model_field.get_default()
+        elif column in BOOLEAN_COLUMNS:
+            values[column] = _boolean(value, column)
+        else:
+            if model_field.max_length and len(value) > model_field.max_length:
+                raise ValueError(f"{column} is longer than {model_field.max_length} characters")
+            values[column] = value
+    return values
+
+
+def _resolve_categories(tenant_id, rows, result):
+    """
+    Category ids by code for the codes used in rows, creating the unknown
+    ones that come with a category_name
+    
+    Parents are linked when a category is created; existing categories are
+    left as they are.
+    """
+    wanted = {}
+    for _, row in rows:
+        code = _text(row.get('category_code'))
+        if code and (code not in wanted or _text(row.get('category_name'))):
+            wanted[code] = (_text(row.get('category_name')), _text(row.get('parent_category_code')))
+    codes = set(wanted) | {parent for _, parent in wanted.values() if parent}
+    if not codes:
+        return {}
+    
+    categories = dict(
+        ProductCategory.objects.filter(tenant_id=tenant_id, code__in=codes).values_list('code', 'id')
+    )
+    new = {code: (name, parent) for code, (name, parent) in wanted.items() if code not in categories and name}
+    if new:
+        created = [ProductCategory(tenant_id=tenant_id, code=code, name=name) for code, (name, _) in new.items()]
+        ProductCategory.objects.bulk_create(created, ignore_conflicts=True)
+        categories.update(
+            ProductCategory.objects.filter(tenant_id=tenant_id, code__in=new).values_list('code', 'id')
+        )
+        # Codes another import created meanwhile kept their own row
+        created_codes = {category.code for category in created if categories.get(category.code) == category.id}
+        result.categories_created += len(created_codes)
+        ProductCategory.objects.bulk_update([
+            ProductCategory(id=categories[code], parent_id=categories[parent])
+            for code, (_, parent) in new.items()
+            if code in created_codes and parent in categories and parent != code
+        ], ['parent'])
+    return categories
+
+
+def _import_chunk(tenant_id, chunk, columns, result):
+    """
+    Validate and upsert one chunk of (line_number, row) pairs
+    """
+    # The last row of a sku wins
+    latest = {}
+    for line_number, row in chunk:
+        sku = _text(row.get('sku'))
+        if not sku:
+            result.add_error(line_number, 'sku is required')
+        elif len(sku) > Product._meta.get_field('sku').max_length:
+            result.add_error(line_number, 'sku is too long')
+        else:
+            if sku in latest:
+                result.add_error(latest[sku][0], f"sku {sku} appears again on line {line_number}; that row is used")
+            latest[sku] = (line_number, row)
+    rows = list(latest.values())
+    
+    has_category = 'category_code' in columns
+    categories = _resolve_categories(tenant_id, rows, result) if has_category else {}
+    
+    # Barcodes of other tenants' products are only known to be taken
+    barcodes = {_text(row.get('barcode')) for _, row in rows} - {''}
+    owners_by_sku = {}
+    ids_by_sku = {}
+    skus_by_barcode = {}
+    taken_barcodes = set()
+    for product_id, sku, barcode, owner_id in Product.objects.filter(
+        Q(sku__in=latest) | Q(barcode__in=barcodes)
+    ).values_list('id', 'sku', 'barcode', 'tenant_id'):
+        if sku in latest:
+            owners_by_sku[sku] = owner_id
+            ids_by_sku[sku] = product_id
+        if barcode in barcodes:
+            if owner_id == tenant_id:
+                skus_by_barcode[barcode] = sku
+            else:
+                taken_barcodes.add(barcode)
+    
+    products = []
+    lines = []
+    seen_barcodes = {}
+    for line_number, row in rows:
+        sku = _text(row.get('sku'))
+        owner_id = owners_by_sku.get(sku)
+        if owner_id is not None and owner_id != tenant_id:
+            result.add_error(line_number, f"sku {sku} is used by another tenant")
+            continue
+        try:
+            values = _product_values(row, columns)
+        except ValueError as e:
+            result.add_error(line_number, str(e))
+            continue
+        if owner_id is None and 'name' not in values:
+            result.add_error(line_number, 'name is required for new products')
+            continue
+        
+        barcode = values.get('barcode')
+        if barcode:
+            if barcode in taken_barcodes:
+                result.add_error(line_number, f"barcode {barcode} is already in use")
+                continue
+            if skus_by_barcode.get(barcode, sku) != sku:
+                result.add_error(line_number, f"barcode {barcode} belongs to sku {skus_by_barcode[barcode]}")
+                continue
+            if barcode in seen_barcodes:
+                result.add_error(line_number, f"barcode {barcode} is also given on line {seen_barcodes[barcode]}")
+                continue
+            seen_barcodes[barcode] = line_number
+        
+        if has_category:
+            code = _text(row.get('category_code'))
+            if code and code not in categories:
+                result.add_error(line_number, f"Unknown category_code {code} (give a category_name to create it)")
+                continue
+            values['category_id'] = categories.get(code)
+        
+        if owner_id is not None:
+            values['id'] = ids_by_sku[sku]
+        products.append(Product(tenant_id=tenant_id, sku=sku, **values))
+        lines.append((line_number, owner_id is None))
+    
+    update_fields = [column for column in PRODUCT_COLUMNS if column in columns] + ['updated_at']
+    if has_category:
+        update_fields.append('category')
+    
+    failed = set()
+    try:
+        with transaction.atomic():
+            saved_ids = _write(tenant_id, products, lines, update_fields)
+    except IntegrityError:
+        # Something in the chunk clashed after all (e.g. a barcode taken
+        # meanwhile); find the offending rows one at a time
+        saved_ids = set()
+        for product, line in zip(products, lines):
+            try:
+                with transaction.atomic():
+                    saved_ids |= _write(tenant_id, [product], [line], update_fields)
+            except IntegrityError as e:
+                result.add_error(line[0], f"Could not save: {e}")
+                failed.add(product.id)
+    
+    saved = []
+    for product, line in zip(products, lines):
+        if product.id in saved_ids:
+            saved.append(line)
+        elif product.id not in failed:
+            # Inserted by someone else between the ownership check and the write
+            result.add_error(line[0], f"sku {product.sku} or its barcode was taken meanwhile")
+    
+    # Raw writes send no post_save, so the search index is updated here
+    if saved_ids:
+        index_products(saved_ids)
+    
+    for _, is_new in saved:
+        if is_new:
+            result.created_count += 1
+        else:
+            result.updated_count += 1
+    result.processed_rows += len(chunk)
+
+
+def _write(tenant_id, products, lines, update_fields):
+    """
+    Update the tenant's existing products and insert the new ones; returns
+    the ids of the products written
+    
+    Updates are plain UPDATEs by id and tenant and inserts ignore
+    conflicts, so a sku another tenant took after the ownership check is
+    left alone (and reported by the caller) instead of overwritten.
+    """
+    now = timezone.now()
+    existing = [product for product, (_, is_new) in zip(products, lines) if not is_new]
+    new = [product for product, (_, is_new) in zip(products, lines) if is_new]
+    
+    if existing:
+        pk = Product._meta.pk
+        tenant_field = Product._meta.get_field('tenant')
+        fields = [Product._meta.get_field(name) for name in update_fields]
+        sql = 'UPDATE {} SET {} WHERE {} = %s AND {} = %s'.format(
+            connection.ops.quote_name(Product._meta.db_table),
+            ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields),
+            connection.ops.quote_name(pk.column),
+            connection.ops.quote_name(tenant_field.column),
+        )
+        for product in existing:
+            product.updated_at = now
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields]
+                + [pk.get_db_prep_save(product.id, connection), tenant_field.get_db_prep_save(tenant_id, connection)]
+                for product in existing
+            ])
+    if new:
+        Product.objects.bulk_create(new, ignore_conflicts=True)
+    
+    return set(Product.objects.filter(
+        id__in=[product.id for product in products], tenant_id=tenant_id
+    ).values_list('id', flat=True))
+
+
+def import_products(tenant_id, text_lines, chunk_size=None, on_chunk=None):
+    """
+    Import a catalog CSV (an iterable of text lines) for a tenant
+    
+    on_chunk(result) is called after every chunk, e.g. to record progress.
+    Returns the ImportResult. Raises ValueError when the file has no sku
+    column.
+    """
+    tenant_id = Tenant._meta.pk.to_python(tenant_id)
+    chunk_size = chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE
+    reader = csv.DictReader(text_lines)
+    columns = {_text(name).lower() for name in reader.fieldnames or []}
+    if 'sku' not in columns:
+        raise ValueError('The file needs a header row with a sku column')
+    
+    def rows():
+        for row in reader:
+            row = {_text(key).lower(): value for key, value in row.items() if key}
+            if any(_text(value) for value in row.values()):
+                yield reader.line_num, row
+    
+    result = ImportResult()
+    rows = rows()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(tenant_id, chunk, columns, result)
+        if on_chunk:
+            on_chunk(result)
+    return result
+
+
+def count_rows(binary_file):
+    """Data lines in a CSV file (lines after the header), read in blocks"""
+    lines = sum(block.count(b'\n') for block in iter(lambda: binary_file.read(1 << 20), b''))
+    return max(lines - 1, 0)
+
+
+def run_product_import(import_id):
+    """
+    Run a pending ProductImport, recording progress after every chunk
+    
+    Claimed with a conditional update, so a job queued twice runs once.
+    """
+    claimed = ProductImport.objects.filter(id=import_id, status='pending').update(
+        status='running', started_at=timezone.now(), updated_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    product_import = ProductImport.objects.get(id=import_id)
+    
+    def save_progress(result, **extra):
+        ProductImport.objects.filter(id=import_id).update(
+            processed_rows=result.processed_rows,
+            created_count=result.created_count,
+            updated_count=result.updated_count,
+            categories_created=result.categories_created,
+            error_count=result.error_count,
+            errors=result.errors,
+            updated_at=timezone.now(),
+            **extra
+        )
+    
+    result = ImportResult()
+    try:
+        with product_import.file.open('rb') as binary_file:
+            total_rows = count_rows(binary_file)
+        ProductImport.objects.filter(id=import_id).update(total_rows=total_rows)
+        
+        with product_import.file.open('rb') as binary_file:
+            text_lines = io.TextIOWrapper(binary_file, encoding='utf-8-sig', errors='replace', newline='')
+            result = import_products(product_import.tenant_id, text_lines, on_chunk=save_progress)
+    except Exception as e:
+        logger.exception("Product import %s failed", import_id)
+        save_progress(result, status='failed', last_error=str(e), finished_at=timezone.now())
+    else:
+        save_progress(result, status='completed', finished_at=timezone.now())
+    return ProductImport.objects.get(id=import_id)
+
+
+def schedule_import(product_import):
+    """
+    Queue a ProductImport once the current transaction commits
+    
+    If the broker is unreachable the periodic sweep picks it up instead.
+    """
+    from .tasks import run_product_import as run_product_import_task
+    
+    def queue():
+        try:
+            run_product_import_task.apply_async((str(product_import.id),), retry=False)
+        except Exception as e:
+            logger.warning("Could not queue product import: %s", e)
+    
+    transaction.on_commit(queue)
@@ -0,0 +1,366 @@
+"""
+Stock counts: importing counted lines and reconciling them
+
+Uploads are read line by line and written in chunks, so a file of tens of
+thousands of lines never sits in memory or in one statement. Reconciling
+compares the summed count of every (product, batch) with the location's
+stock balances as NumPy arrays of thousandths (quantities have three
+decimal places, so the arithmetic stays exact) and posts every variance
+in one create_ledger_entries call.
+"""
+import csv
+import json
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from .models import Batch, Product, StockBalance, StockCount, StockCountLine, StockCountState
+from .services import InventoryService
+
+
+# Quantities are stored with three decimal places
+SCALE = 1000
+
+
+@dataclass
+class CountVariance:
+    """Difference between the counted and recorded stock of one (product, batch)"""
+    product_id: object
+    batch_id: object
+    expected: Decimal
+    counted: Decimal
+    damaged: Decimal
+    variance: Decimal  # counted + damaged - expected
+    average_cost: Decimal = None
+    
+    @property
+    def variance_value(self):
+        return (self.variance * (self.average_cost or Decimal('0'))).quantize(Decimal('0.0001'))
+
+
+def new_count_number():
+    return f"CNT-{timezone.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+
+
+def upload_format(content_type, name=''):
+    """'ndjson' or 'csv', from a content type or file name"""
+    if 'json' in (content_type or '') or name.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def _text_lines(byte_lines):
+    for number, line in enumerate(byte_lines):
+        text = line.decode('utf-8', errors='replace')
+        yield text.lstrip('\ufeff') if number == 0 else text
+
+
+def parse_rows(byte_lines, fmt):
+    """
+    Parse an upload lazily into (line_number, row dict) pairs
+    
+    CSV files need a header row; NDJSON lines are objects. Blank lines are
+    skipped. Rows that cannot be parsed come back as (line_number, None);
+    malformed CSV ends the upload there.
+    """
+    lines = _text_lines(byte_lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        try:
+            for row in reader:
+                if any(value for value in row.values() if isinstance(value, str)):
+                    yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+        except csv.Error:
+            yield reader.line_num + 1, None
+        return
+    
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def _reference(field, value):
+    """Normalised product or batch reference of a row, or None"""
+    if value in (None, ''):
+        return None
+    value = str(value).strip()
+    if field == 'product_id':
+        try:
+            return str(uuid.UUID(value))
+        except ValueError:
+            return None
+    return value
+
+
+def _quantity(value, field):
+    try:
+        quantity = Decimal(str(value).strip() or '0')
+    except InvalidOperation:
+        raise ValueError(f"{field} is not a number")
+    if not quantity.is_finite() or quantity < 0:
+        raise ValueError(f"{field} must be zero or more")
+    if quantity != quantity.quantize(Decimal('0.001')):
+        raise ValueError(f"{field} has more than 3 decimal places")
+    return quantity
+
+
+def import_count_lines(count, rows, counted_by=None, chunk_size=None):
+    """
+    Add parsed rows to an open stock count
+    
+    Each row names a product by sku, barcode or product_id, optionally a
+    batch_number, and gives quantity and optionally damaged_quantity.
+    Products and batches are resolved with one query per chunk. Bad rows
+    are reported and skipped without stopping the import. Returns
+    (lines imported, error count, first STOCK_COUNT_MAX_ERRORS errors as
+    {'line', 'error'} dicts).
+    """
+    chunk_size = chunk_size or settings.STOCK_COUNT_CHUNK_SIZE
+    imported = 0
+    error_count = 0
+    errors = []
+    
+    def reject(line_number, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < settings.STOCK_COUNT_MAX_ERRORS:
+            errors.append({'line': line_number, 'error': message})
+    
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        
+        parsed = [(line_number, row) for line_number, row in chunk if row is not None]
+        for line_number, row in chunk:
+            if row is None:
+                reject(line_number, 'Line could not be parsed')
+        
+        references = {
+            field: {_reference(field, row.get(field)) for _, row in parsed} - {None}
+            for field in ('sku', 'barcode', 'product_id', 'batch_number')
+        }
+        product_filter = (
+            Q(sku__in=references['sku']) | Q(barcode__in=references['barcode']) | Q(id__in=references['product_id'])
+        )
+        products = {}
+        for product_id, sku, barcode in Product.objects.filter(product_filter, tenant_id=count.tenant_id).values_list(
+            'id', 'sku', 'barcode'
+        ):
+            products[('sku', sku)] = product_id
+            products[('product_id', str(product_id))] = product_id
+            if barcode:
+                products[('barcode', barcode)] = product_id
+        batches = {
+            (product_id, batch_number): batch_id
+            for batch_id, product_id, batch_number in Batch.objects.filter(
+                tenant_id=count.tenant_id, batch_number__in=references['batch_number']
+            ).values_list('id', 'product_id', 'batch_number')
+        }
+        
+        lines = []
+        for line_number, row in parsed:
+            product_id = None
+            for field in ('sku', 'barcode', 'product_id'):
+                if row.get(field) not in (None, ''):
+                    product_id = products.get((field, _reference(field, row[field])))
+                    if product_id is None:
+                        reject(line_number, f"Unknown {field} {row[field]}")
+                    break
+            else:
+                reject(line_number, 'Row needs a sku, barcode or product_id')
+            if product_id is None:
+                continue
+            
+            batch_id = None
+            if row.get('batch_number') not in (None, ''):
+                batch_id = batches.get((product_id, _reference('batch_number', row['batch_number'])))
+                if batch_id is None:
+                    reject(line_number, f"Unknown batch {row['batch_number']} for this product")
+                    continue
+            
+            try:
+                if row.get('quantity') in (None, ''):
+                    raise ValueError('quantity is required')
+                quantity = _quantity(row['quantity'], 'quantity')
+                damaged_quantity = _quantity(row.get('damaged_quantity') or '0', 'damaged_quantity')
+            except ValueError as e:
+                reject(line_number, str(e))
+                continue
+            
+            lines.append(StockCountLine(
+                count=count,
+                product_id=product_id,
+                batch_id=batch_id,
+                quantity=quantity,
+                damaged_quantity=damaged_quantity,
+                line_number=line_number,
+                counted_by=counted_by,
+            ))
+        
+        StockCountLine.objects.bulk_create(lines)
+        imported += len(lines)
+    
+    return imported, error_count, errors
+
+
+def _scaled(quantities):
+    return np.fromiter((round(quantity * SCALE) for quantity in quantities), dtype=np.int64, count=len(quantities))
+
+
+def count_variances(count, stock_balances):
+    """
+    Variances of a stock count against the given balances of its location
+    
+    The counted quantities are summed per (product, batch) in the database.
+    Full counts also cover every balance that was not counted (as counted
+    zero); cycle counts adjust only the lines counted. Returns CountVariance
+    for each (product, batch) whose variance or damaged quantity is not
+    zero.
+    """
+    counted_rows = list(
+        count.lines.values('product_id', 'batch_id').annotate(
+            quantity=Sum('quantity'), damaged=Sum('damaged_quantity')
+        ).values_list('product_id', 'batch_id', 'quantity', 'damaged')
+    )
+    stored = {(b.product_id, b.batch_id): b for b in stock_balances}
+    keys = [(product_id, batch_id) for product_id, batch_id, _, _ in counted_rows]
+    if count.is_full_count:
+        seen = set(keys)
+        keys += [key for key, stock_balance in stored.items() if key not in seen and stock_balance.quantity_on_hand]
+    if not keys:
+        return []
+    
+    missing = [Decimal('0')] * (len(keys) - len(counted_rows))
+    expected = _scaled([stored[key].quantity_on_hand if key in stored else Decimal('0') for key in keys])
+    counted = _scaled([row[2] for row in counted_rows] + missing)
+    damaged = _scaled([row[3] for row in counted_rows] + missing)
+    variance = counted + damaged - expected
+    
+    scale = Decimal(SCALE)
+    variances = []
+    for i in np.flatnonzero((variance != 0) | (damaged != 0)).tolist():
+        stock_balance = stored.get(keys[i])
+        variances.append(CountVariance(
+            product_id=keys[i][0],
+            batch_id=keys[i][1],
+            expected=Decimal(int(expected[i])) / scale,
+            counted=Decimal(int(counted[i])) / scale,
+            damaged=Decimal(int(damaged[i])) / scale,
+            variance=Decimal(int(variance[i])) / scale,
+            average_cost=stock_balance.average_cost if stock_balance else None,
+        ))
+    return variances
+
+
+def _lock_balances(location, keys):
+    """
+    Lock the location's balances of (product_id, batch_id) keys, creating
+    missing ones, in primary key order like every other stock posting
+    
+    Returns a dict keyed by (location_id, product_id, batch_id).
+    """
+    def ids():
+        return {
+            (product_id, batch_id): balance_id
+            for balance_id, product_id, batch_id in StockBalance.objects.filter(location=location).values_list(
+                'id', 'product_id', 'batch_id'
+            )
+            if (product_id, batch_id) in keys
+        }
+    
+    balance_ids = ids()
+    if len(balance_ids) < len(keys):
+        StockBalance.objects.bulk_create([
+            StockBalance(tenant_id=location.tenant_id, location=location, product_id=product_id, batch_id=batch_id)
+            for product_id, batch_id in keys
+            if (product_id, batch_id) not in balance_ids
+        ], ignore_conflicts=True)
+        balance_ids = ids()
+    balance_ids = sorted(balance_ids.values())
+    
+    balances = {}
+    chunk_size = settings.STOCK_COUNT_CHUNK_SIZE
+    for start in range(0, len(balance_ids), chunk_size):
+        for stock_balance in StockBalance.objects.select_for_update().filter(
+            id__in=balance_ids[start:start + chunk_size]
+        ).order_by('id'):
+            balances[(stock_balance.location_id, stock_balance.product_id, stock_balance.batch_id)] = stock_balance
+    return balances
+
+
+@transaction.atomic
+def reconcile_count(count, reconciled_by):
+    """
+    Post the variances of an open stock count to the ledger
+    
+    Variances are computed from a snapshot of the location's balances and
+    only the balances with a variance are locked, for the posting alone, so
+    sales of everything else carry on. Variances are posted as movements
+    relative to the balance, so a sale made between the snapshot and the
+    lock still applies on top of the counted figure. Surpluses and
+    shortfalls become one adjustment entry each and counted damaged stock
+    a damage entry moving it out of on hand, all posted with a single
+    create_ledger_entries call. Returns the variances.
+    """
+    count = StockCount.objects.select_for_update().select_related('tenant', 'location').get(id=count.id)
+    if count.state != StockCountState.OPEN:
+        raise ValueError(f"Cannot reconcile stock count in state: {count.state}")
+    location = count.location
+    
+    variances = count_variances(count, StockBalance.objects.filter(location=location))
+    balances = _lock_balances(location, {(v.product_id, v.batch_id) for v in variances})
+    products = Product.objects.in_bulk({v.product_id for v in variances})
+    batches = Batch.objects.in_bulk({v.batch_id for v in variances if v.batch_id})
+    
+    movements = []
+    reference = {
+        'reference_id': count.id,
+        'reference_type': 'stock_count',
+        'created_by': reconciled_by,
+    }
+    for v in variances:
+        stock = {'location': location, 'product': products[v.product_id], 'batch': batches.get(v.batch_id)}
+        if v.variance > 0:
+            movements.append({
+                **stock, **reference,
+                'transaction_type': 'adjustment',
+                'quantity_in': v.variance,
+                'unit_cost': v.average_cost,
+                'notes': f'Stock count {count.count_number}: counted {v.counted + v.damaged}, recorded {v.expected}',
+            })
+        elif v.variance < 0:
+            movements.append({
+                **stock, **reference,
+                'transaction_type': 'adjustment',
+                'quantity_out': -v.variance,
+                'notes': f'Stock count {count.count_number}: counted {v.counted + v.damaged}, recorded {v.expected}',
+            })
+        if v.damaged:
+            movements.append({
+                **stock, **reference,
+                'transaction_type': 'damage',
+                'quantity_out': v.damaged,
+                'quantity_damaged': v.damaged,
+                'notes': f'Stock count {count.count_number}: damaged',
+            })
+    
+    if movements:
+        InventoryService.create_ledger_entries(count.tenant, movements, balances=balances)
+    
+    count.adjusted_items = len(variances)
+    count.variance_value = sum((v.variance_value for v in variances), Decimal('0'))
+    count.reconcile(reconciled_by)
+    count.save()
+    return variances
@@ -0,0 +1,75 @@
+"""
+Archive old inventory ledger months to compressed files, or restore them
+"""
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import Tenant
+from inventory.archive import archivable_months, archive_month, month_rows, restore_archive, uncovered_locations
+from inventory.models import LedgerArchive
+
+
+class Command(BaseCommand):
+    help = 'Move inventory ledger months older than a cutoff to gzip NDJSON files (or restore one)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='Only this tenant (id)')
+        parser.add_argument(
+            '--before', type=date.fromisoformat,
+            help='Archive months ending on or before this date (default: LEDGER_ARCHIVE_AFTER_MONTHS ago)'
+        )
+        parser.add_argument('--restore', metavar='YYYY-MM', help='Restore this archived month instead (needs --tenant)')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Ledger rows fetched per round trip')
+        parser.add_argument('--dry-run', action='store_true', help='List the months that would be archived')
+    
+    def handle(self, *args, **options):
+        if options['restore']:
+            return self._restore(options)
+        
+        before = options['before']
+        if before is None:
+            today = timezone.localdate()
+            months = today.year * 12 + today.month - 1 - settings.LEDGER_ARCHIVE_AFTER_MONTHS
+            before = date(months // 12, months % 12 + 1, 1)
+        
+        tenants = Tenant.objects.all()
+        if options['tenant']:
+            tenants = tenants.filter(id=options['tenant'])
+        
+        archived = 0
+        for tenant in tenants:
+            for period_start in archivable_months(tenant.id, before):
+                label = f'{tenant.name} {period_start:%Y-%m}'
+                if options['dry_run']:
+                    missing = uncovered_locations(tenant.id, period_start)
+                    note = f' (blocked: {len(missing)} location(s) without a later checkpoint)' if missing else ''
+                    self.stdout.write(f'{label}: {month_rows(tenant.id, period_start).count()} rows{note}')
+                    continue
+                try:
+                    archive = archive_month(tenant.id, period_start, chunk_size=options['chunk_size'])
+                except ValueError as e:
+                    self.stderr.write(f'{label}: skipped, {e}')
+                    continue
+                archived += archive.row_count
+                self.stdout.write(f'{label}: {archive.row_count} rows -> {archive.file_path}')
+        
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{archived} ledger rows archived'))
+    
+    def _restore(self, options):
+        if not options['tenant']:
+            raise CommandError('--restore needs --tenant')
+        try:
+            period_start = date.fromisoformat(f"{options['restore']}-01")
+        except ValueError:
+            raise CommandError('--restore takes a month as YYYY-MM')
+        
+        archive = LedgerArchive.objects.filter(tenant_id=options['tenant'], period_start=period_start).first()
+        if archive is None:
+            raise CommandError(f"No archive for {options['restore']}")
+        try:
+            restore_archive(archive)
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'{archive.row_count} ledger rows restored from {archive.file_path}'))
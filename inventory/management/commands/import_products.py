@@ -0,0 +1,42 @@
+"""
+Import or update products from a catalog CSV
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Tenant
+from inventory.catalog_import import import_products
+
+
+class Command(BaseCommand):
+    help = 'Upsert products (on sku) and their categories from a CSV file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row (see inventory.catalog_import)')
+        parser.add_argument('--tenant', required=True, help='Tenant the products belong to (id)')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows upserted per statement')
+    
+    def handle(self, *args, **options):
+        tenant = Tenant.objects.filter(id=options['tenant']).first()
+        if tenant is None:
+            raise CommandError(f"Tenant {options['tenant']} not found")
+        
+        def report(result):
+            if options['verbosity'] >= 1:
+                self.stdout.write(
+                    f'{result.processed_rows} rows: {result.created_count} created, '
+                    f'{result.updated_count} updated, {result.error_count} errors'
+                )
+        
+        try:
+            with open(options['path'], encoding='utf-8-sig', errors='replace', newline='') as text_lines:
+                result = import_products(tenant.id, text_lines, chunk_size=options['chunk_size'], on_chunk=report)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.created_count} products created, {result.updated_count} updated, '
+            f'{result.categories_created} categories created, {result.error_count} rows rejected'
+        ))
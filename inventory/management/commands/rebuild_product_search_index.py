@@ -0,0 +1,19 @@
+"""
+Rebuild the product search index used by the till typeahead
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the search tokens of every product'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='Only reindex products of this tenant (id)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Products reindexed per transaction')
+    
+    def handle(self, *args, **options):
+        from inventory.search import rebuild_index
+        
+        total = rebuild_index(tenant_id=options['tenant'], chunk_size=options['chunk_size'])
+        if options['verbosity'] >= 1:
+            self.stdout.write(self.style.SUCCESS(f'{total} products reindexed'))
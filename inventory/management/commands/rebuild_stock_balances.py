@@ -0,0 +1,126 @@
+"""
+Rebuild StockBalance rows from the InventoryLedger
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _init_worker(settings_module):
+    """
+    Prepare a pool process: set Django up (spawned processes) and drop
+    database connections inherited from the parent (forked processes)
+    """
+    import django
+    from django.db import connections
+    
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+    connections.close_all()
+
+
+def _rebuild(location_id, dry_run, chunk_size, from_checkpoint):
+    """
+    Rebuild one location; returns the differences in a picklable form
+    """
+    from inventory.replay import REPLAYED_FIELDS, rebuild_location
+    
+    changes = rebuild_location(
+        location_id, dry_run=dry_run, chunk_size=chunk_size, from_checkpoint=from_checkpoint
+    )
+    return location_id, [
+        (
+            product_id,
+            batch_id,
+            {field: getattr(stock_balance, field) for field in REPLAYED_FIELDS} if stock_balance else None,
+            {field: getattr(balance, field) for field in REPLAYED_FIELDS},
+        )
+        for (product_id, batch_id), stock_balance, balance in changes
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Recompute stock balances and average costs by replaying the inventory ledger'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='Only rebuild locations of this tenant (id)')
+        parser.add_argument('--location', action='append', default=[], help='Only rebuild this location (id); repeatable')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes rebuilding locations in parallel')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Ledger rows fetched per round trip')
+        parser.add_argument('--dry-run', action='store_true', help='Report differences without writing them')
+        parser.add_argument('--ignore-checkpoints', action='store_true', help='Replay the whole ledger instead of starting from the latest stock checkpoint')
+    
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from django.db import connections
+        from core.models import Location
+        from inventory.models import InventoryLedger, LedgerArchive, ReorderPoint, StockBalance
+        from inventory.services import ReorderService
+        
+        locations = Location.objects.all()
+        if options['tenant']:
+            locations = locations.filter(tenant_id=options['tenant'])
+        if options['location']:
+            locations = locations.filter(id__in=options['location'])
+        names = dict(locations.values_list('id', 'name'))
+        
+        # Only locations holding stock or ledger history need work
+        location_ids = set(
+            InventoryLedger.objects.filter(location_id__in=names).values_list('location_id', flat=True).distinct()
+        ) | set(
+            StockBalance.objects.filter(location_id__in=names).values_list('location_id', flat=True).distinct()
+        )
+        if not location_ids:
+            raise CommandError('No matching locations with stock or ledger entries')
+        if options['ignore_checkpoints'] and LedgerArchive.objects.filter(restored_at__isnull=True).exists():
+            raise CommandError('Archived ledger months must be restored before replaying the whole ledger')
+        
+        dry_run = options['dry_run']
+        workers = max(1, min(options['workers'], len(location_ids)))
+        jobs = [
+            (location_id, dry_run, options['chunk_size'], not options['ignore_checkpoints'])
+            for location_id in sorted(location_ids, key=str)
+        ]
+        
+        if workers == 1:
+            results = (_rebuild(*job) for job in jobs)
+        else:
+            # Children must not share the parent's database connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE),),
+            )
+            futures = [pool.submit(_rebuild, *job) for job in jobs]
+            results = (future.result() for future in as_completed(futures))
+        
+        total = 0
+        try:
+            for location_id, changes in results:
+                total += len(changes)
+                self._report(names[location_id], changes, dry_run, options['verbosity'])
+        finally:
+            if workers > 1:
+                pool.shutdown(cancel_futures=True)
+        
+        if total and not dry_run:
+            ReorderService.refresh(ReorderPoint.objects.filter(location_id__in=location_ids))
+        
+        verb = 'differ' if dry_run else 'rebuilt'
+        if options['verbosity'] >= 1:
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} stock balances {verb} across {len(location_ids)} locations'
+            ))
+    
+    def _report(self, location_name, changes, dry_run, verbosity):
+        if verbosity < 1 or not changes:
+            return
+        self.stdout.write(f'{location_name}: {len(changes)} balances {"differ" if dry_run else "rebuilt"}')
+        if not dry_run and verbosity < 2:
+            return
+        for product_id, batch_id, stored, replayed in changes:
+            for field, value in replayed.items():
+                before = stored[field] if stored else None
+                if before != value:
+                    self.stdout.write(f'  product {product_id} batch {batch_id or "-"} {field}: {before} -> {value}')
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:57
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def merge_duplicate_balances(apps, schema_editor):
+    """
+    Fold duplicate unbatched balances of a (location, product) into the
+    newest one: quantities are summed and the average cost is weighted by
+    quantity on hand
+    """
+    StockBalance = apps.get_model('inventory', 'StockBalance')
+    groups = {}
+    for stock_balance in StockBalance.objects.filter(batch__isnull=True).order_by('-updated_at'):
+        groups.setdefault((stock_balance.location_id, stock_balance.product_id), []).append(stock_balance)
+    
+    duplicates = []
+    for kept, *others in groups.values():
+        if not others:
+            continue
+        rows = [kept] + others
+        on_hand = sum(row.quantity_on_hand for row in rows)
+        costed = [row for row in rows if row.average_cost is not None]
+        costed_on_hand = sum(row.quantity_on_hand for row in costed)
+        if costed_on_hand:
+            kept.average_cost = (
+                sum(row.quantity_on_hand * row.average_cost for row in costed) / costed_on_hand
+            ).quantize(Decimal('0.0001'))
+        elif costed:
+            kept.average_cost = costed[0].average_cost
+        kept.quantity_on_hand = on_hand
+        kept.quantity_reserved = sum(row.quantity_reserved for row in rows)
+        kept.quantity_in_transit = sum(row.quantity_in_transit for row in rows)
+        kept.quantity_damaged = sum(row.quantity_damaged for row in rows)
+        moved_at = [row.last_transaction_at for row in rows if row.last_transaction_at]
+        kept.last_transaction_at = max(moved_at) if moved_at else None
+        kept.save()
+        duplicates += [row.id for row in others]
+    StockBalance.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_balances, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stockbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('batch__isnull', True)), fields=('location', 'product'), name='unique_stock_balance_without_batch'),
+        ),
+    ]
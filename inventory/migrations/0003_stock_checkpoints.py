@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:13
+
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0002_stock_balance_unique_without_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('taken_at', models.DateTimeField()),
+                ('quantity_on_hand', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15)),
+                ('quantity_reserved', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15)),
+                ('quantity_in_transit', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15)),
+                ('quantity_damaged', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15)),
+                ('average_cost', models.DecimalField(blank=True, decimal_places=4, max_digits=15, null=True)),
+                ('stock_value', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=18)),
+                ('last_transaction_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='inventory.batch')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='core.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='inventory.product')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='core.tenant')),
+            ],
+            options={
+                'db_table': 'stock_checkpoints',
+                'ordering': ['-taken_at'],
+                'indexes': [models.Index(fields=['location', 'taken_at'], name='stock_check_locatio_c74799_idx'), models.Index(fields=['tenant', 'taken_at'], name='stock_check_tenant__d9249f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockcheckpoint',
+            constraint=models.UniqueConstraint(condition=models.Q(('batch__isnull', True)), fields=('location', 'product', 'taken_at'), name='unique_stock_checkpoint_without_batch'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockcheckpoint',
+            unique_together={('location', 'product', 'batch', 'taken_at')},
+        ),
+    ]
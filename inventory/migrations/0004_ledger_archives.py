@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:15
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0003_stock_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerArchive',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('file_path', models.CharField(max_length=500)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('sha256', models.CharField(max_length=64)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('restored_at', models.DateTimeField(blank=True, null=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_archives', to='core.tenant')),
+            ],
+            options={
+                'db_table': 'ledger_archives',
+                'ordering': ['-period_start'],
+                'unique_together': {('tenant', 'period_start')},
+            },
+        ),
+    ]
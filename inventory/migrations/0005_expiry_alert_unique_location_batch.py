@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:20
+
+from django.db import migrations, models
+
+
+def remove_duplicate_alerts(apps, schema_editor):
+    """Keep the newest alert of each (location, batch)"""
+    ExpiryAlert = apps.get_model('inventory', 'ExpiryAlert')
+    seen = set()
+    duplicates = []
+    for alert_id, location_id, batch_id in ExpiryAlert.objects.order_by('-created_at').values_list(
+        'id', 'location_id', 'batch_id'
+    ):
+        if (location_id, batch_id) in seen:
+            duplicates.append(alert_id)
+        else:
+            seen.add((location_id, batch_id))
+    ExpiryAlert.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0004_ledger_archives'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_alerts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='expiryalert',
+            constraint=models.UniqueConstraint(fields=('location', 'batch'), name='unique_expiry_alert_per_location_batch'),
+        ),
+    ]
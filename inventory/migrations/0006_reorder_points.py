@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:21
+
+import django.core.validators
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0005_expiry_alert_unique_location_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderPoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('reorder_point', models.DecimalField(decimal_places=3, max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+                ('max_level', models.DecimalField(blank=True, decimal_places=3, help_text='Level to replenish up to', max_digits=15, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+                ('quantity_on_hand', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15)),
+                ('is_below', models.BooleanField(default=False)),
+                ('below_since', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_points', to='core.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_points', to='inventory.product')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_points', to='core.tenant')),
+            ],
+            options={
+                'db_table': 'reorder_points',
+                'ordering': ['location', 'product'],
+                'indexes': [models.Index(fields=['tenant', 'is_below'], name='reorder_poi_tenant__b6dfa7_idx'), models.Index(fields=['location', 'is_below'], name='reorder_poi_locatio_f0f574_idx')],
+                'unique_together': {('location', 'product')},
+            },
+        ),
+    ]
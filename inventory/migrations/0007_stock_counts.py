@@ -0,0 +1,74 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:35
+
+import django.core.validators
+import django.db.models.deletion
+import django_fsm
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0006_reorder_points'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCount',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('count_number', models.CharField(max_length=100, unique=True)),
+                ('is_full_count', models.BooleanField(default=False)),
+                ('state', django_fsm.FSMField(choices=[('open', 'Open'), ('reconciled', 'Reconciled'), ('cancelled', 'Cancelled')], default='open', max_length=50, protected=True)),
+                ('adjusted_items', models.PositiveIntegerField(default=0)),
+                ('variance_value', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=18)),
+                ('notes', models.TextField(blank=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_counts', to=settings.AUTH_USER_MODEL)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_counts', to='core.location')),
+                ('reconciled_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reconciled_stock_counts', to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_counts', to='core.tenant')),
+            ],
+            options={
+                'db_table': 'stock_counts',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockCountLine',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+                ('damaged_quantity', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+                ('line_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='stock_count_lines', to='inventory.batch')),
+                ('count', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='inventory.stockcount')),
+                ('counted_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_count_lines', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_count_lines', to='inventory.product')),
+            ],
+            options={
+                'db_table': 'stock_count_lines',
+                'ordering': ['count', 'line_number'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockcount',
+            index=models.Index(fields=['tenant', 'state'], name='stock_count_tenant__36ea46_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockcount',
+            index=models.Index(fields=['location', 'state'], name='stock_count_locatio_6dbe69_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockcountline',
+            index=models.Index(fields=['count', 'product', 'batch'], name='stock_count_count_i_8f8ab1_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_products(apps, schema_editor):
+    """Tokenise the products that already exist"""
+    from inventory.search import product_tokens
+    
+    Product = apps.get_model('inventory', 'Product')
+    ProductSearchToken = apps.get_model('inventory', 'ProductSearchToken')
+    tokens = []
+    for product_id, tenant_id, sku, barcode, name in Product.objects.filter(is_active=True).values_list(
+        'id', 'tenant_id', 'sku', 'barcode', 'name'
+    ).iterator():
+        tokens += [
+            ProductSearchToken(tenant_id=tenant_id, product_id=product_id, kind=kind, token=token)
+            for kind, token in product_tokens(sku, barcode, name)
+        ]
+        if len(tokens) >= 5000:
+            ProductSearchToken.objects.bulk_create(tokens)
+            tokens = []
+    ProductSearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0008_product_imports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('code', 'Sku or barcode'), ('first_word', 'First word of the name'), ('word', 'Other word of the name')], max_length=10)),
+                ('token', models.CharField(max_length=100)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='inventory.product')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_search_tokens', to='core.tenant')),
+            ],
+            options={
+                'db_table': 'product_search_tokens',
+                'indexes': [models.Index(fields=['tenant', 'kind', 'token', 'product'], name='product_sea_tenant__757c2c_idx')],
+            },
+        ),
+        migrations.RunPython(index_products, migrations.RunPython.noop),
+    ]
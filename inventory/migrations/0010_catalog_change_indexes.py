@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0009_product_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['tenant', 'updated_at'], name='batches_tenant__5b2247_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['tenant', 'updated_at'], name='products_tenant__838fb6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockbalance',
+            index=models.Index(fields=['location', 'updated_at'], name='stock_balan_locatio_e8eb0c_idx'),
+        ),
+    ]
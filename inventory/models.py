@@ -1,6 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils import timezone
+from django_fsm import FSMField, transition
 from core.models import Tenant, Location
 import uuid
 from decimal import Decimal
@@ -66,12 +67,41 @@ class Product(models.Model):
             models.Index(fields=['tenant', 'is_active']),
             models.Index(fields=['sku']),
             models.Index(fields=['barcode']),
+            models.Index(fields=['tenant', 'updated_at']),
         ]
     
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
 
+class ProductSearchToken(models.Model):
+    """
+    Normalised search token of an active product, for typeahead lookups
+    Codes (sku, barcode) are stored whole, names word by word; rows are
+    derived from the product and rewritten whenever it is saved
+    """
+    KIND_CHOICES = [
+        ('code', 'Sku or barcode'),
+        ('first_word', 'First word of the name'),
+        ('word', 'Other word of the name'),
+    ]
+    
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='product_search_tokens')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    token = models.CharField(max_length=100)
+    
+    class Meta:
+        db_table = 'product_search_tokens'
+        indexes = [
+            # Covers the typeahead's ordered range scans
+            models.Index(fields=['tenant', 'kind', 'token', 'product']),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} ({self.kind})"
+
+
 class Batch(models.Model):
     """Production batches"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -107,6 +137,7 @@ class Batch(models.Model):
             models.Index(fields=['product', 'is_active']),
             models.Index(fields=['production_date']),
             models.Index(fields=['expiry_date']),
+            models.Index(fields=['tenant', 'updated_at']),
         ]
     
     def __str__(self):
@@ -217,7 +248,7 @@ class InventoryLedger(models.Model):
 class StockBalance(models.Model):
     """
     Materialized view / cache of current stock balances
-    Updated via triggers or signals from InventoryLedger
+    Updated by InventoryService in the same transaction as each InventoryLedger entry
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_balances')
@@ -261,10 +292,19 @@ class StockBalance(models.Model):
     class Meta:
         db_table = 'stock_balances'
         unique_together = [['location', 'product', 'batch']]
+        constraints = [
+            # unique_together does not cover rows without a batch (NULLs are distinct)
+            models.UniqueConstraint(
+                fields=['location', 'product'],
+                condition=models.Q(batch__isnull=True),
+                name='unique_stock_balance_without_batch'
+            ),
+        ]
         indexes = [
             models.Index(fields=['tenant', 'location', 'product']),
             models.Index(fields=['product', 'batch']),
             models.Index(fields=['quantity_on_hand']),
+            models.Index(fields=['location', 'updated_at']),
         ]
     
     def __str__(self):
@@ -276,6 +316,281 @@ class StockBalance(models.Model):
         return max(Decimal('0'), self.quantity_on_hand - self.quantity_reserved)
 
 
+class ReorderPoint(models.Model):
+    """
+    Reorder point and maximum level of a product at a location
+    quantity_on_hand (all batches) and is_below are kept current by
+    InventoryService as stock moves, so low-stock lists are plain reads
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='reorder_points')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='reorder_points')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reorder_points')
+    
+    reorder_point = models.DecimalField(max_digits=15, decimal_places=3, validators=[MinValueValidator(Decimal('0'))])
+    max_level = models.DecimalField(
+        max_digits=15,
+        decimal_places=3,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(Decimal('0'))],
+        help_text="Level to replenish up to"
+    )
+    
+    # Maintained from the stock balances
+    quantity_on_hand = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'))
+    is_below = models.BooleanField(default=False)  # on hand at or below the reorder point
+    below_since = models.DateTimeField(null=True, blank=True)
+    
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'reorder_points'
+        unique_together = [['location', 'product']]
+        ordering = ['location', 'product']
+        indexes = [
+            models.Index(fields=['tenant', 'is_below']),
+            models.Index(fields=['location', 'is_below']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} @ {self.location.name}: reorder at {self.reorder_point}"
+    
+    @property
+    def suggested_quantity(self):
+        """Quantity bringing stock back up to the max level (or the reorder point)"""
+        target = self.max_level if self.max_level is not None else self.reorder_point
+        return max(Decimal('0'), target - self.quantity_on_hand)
+
+
+class StockCheckpoint(models.Model):
+    """
+    Stock balance of a location as of a point in time
+    Taken periodically from the ledger so point-in-time queries only replay
+    the ledger written after the nearest checkpoint
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_checkpoints')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='stock_checkpoints')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_checkpoints')
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, null=True, blank=True, related_name='stock_checkpoints')
+    
+    # Covers every ledger entry created before this instant
+    taken_at = models.DateTimeField()
+    
+    quantity_on_hand = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'))
+    quantity_reserved = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'))
+    quantity_in_transit = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'))
+    quantity_damaged = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'))
+    average_cost = models.DecimalField(max_digits=15, decimal_places=4, null=True, blank=True)
+    stock_value = models.DecimalField(max_digits=18, decimal_places=4, default=Decimal('0'))  # on hand x average cost
+    
+    last_transaction_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'stock_checkpoints'
+        ordering = ['-taken_at']
+        unique_together = [['location', 'product', 'batch', 'taken_at']]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['location', 'product', 'taken_at'],
+                condition=models.Q(batch__isnull=True),
+                name='unique_stock_checkpoint_without_batch'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['location', 'taken_at']),
+            models.Index(fields=['tenant', 'taken_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} @ {self.location.name} as of {self.taken_at}: {self.quantity_on_hand}"
+
+
+class LedgerArchive(models.Model):
+    """
+    A month of a tenant's inventory ledger moved out of the database
+    Rows live in a gzip-compressed NDJSON file until restored
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='ledger_archives')
+    period_start = models.DateField()  # first day of the month
+    period_end = models.DateField()  # first day of the following month
+    
+    file_path = models.CharField(max_length=500)
+    row_count = models.PositiveIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    
+    archived_at = models.DateTimeField(auto_now_add=True)
+    restored_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'ledger_archives'
+        unique_together = [['tenant', 'period_start']]
+        ordering = ['-period_start']
+    
+    def __str__(self):
+        return f"{self.tenant.name} ledger {self.period_start:%Y-%m} ({self.row_count} rows)"
+    
+    @property
+    def is_restored(self):
+        return self.restored_at is not None
+
+
+class ProductImport(models.Model):
+    """
+    A catalog CSV imported in the background
+    Products are upserted on sku in chunks; progress and row errors are
+    recorded as it runs
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='product_imports')
+    file = models.FileField(upload_to='product_imports/%Y/%m/')
+    
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('running', 'Running'),
+            ('completed', 'Completed'),
+            ('failed', 'Failed')
+        ],
+        default='pending'
+    )
+    
+    # Progress
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    categories_created = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # first PRODUCT_IMPORT_MAX_ERRORS of {'line', 'error'}
+    last_error = models.TextField(blank=True)  # why a failed import stopped
+    
+    created_by = models.ForeignKey('core.User', on_delete=models.SET_NULL, null=True, related_name='product_imports')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'product_imports'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Product import {self.file.name} ({self.status})"
+    
+    @property
+    def progress(self):
+        """Share of rows processed, 0-100 (None until the file was measured)"""
+        if not self.total_rows:
+            return None if self.total_rows is None else 100
+        return min(100, round(self.processed_rows * 100 / self.total_rows))
+
+
+class StockCountState(models.TextChoices):
+    OPEN = 'open', 'Open'
+    RECONCILED = 'reconciled', 'Reconciled'
+    CANCELLED = 'cancelled', 'Cancelled'
+
+
+class StockCount(models.Model):
+    """
+    A stock take at a location
+    Counted lines are uploaded while open; reconciling posts the variances
+    against the stock balances as adjustment and damage ledger entries
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_counts')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='stock_counts')
+    count_number = models.CharField(max_length=100, unique=True)
+    
+    # Full counts treat stock that was not counted as gone; cycle counts leave it alone
+    is_full_count = models.BooleanField(default=False)
+    
+    state = FSMField(default=StockCountState.OPEN, choices=StockCountState.choices, protected=True)
+    
+    # Set on reconciliation
+    adjusted_items = models.PositiveIntegerField(default=0)
+    variance_value = models.DecimalField(max_digits=18, decimal_places=4, default=Decimal('0'))  # at average cost
+    
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey('core.User', on_delete=models.SET_NULL, null=True, related_name='stock_counts')
+    reconciled_by = models.ForeignKey(
+        'core.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reconciled_stock_counts'
+    )
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'stock_counts'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', 'state']),
+            models.Index(fields=['location', 'state']),
+        ]
+    
+    def __str__(self):
+        return f"{self.count_number} @ {self.location.name}"
+    
+    @transition(field=state, source=StockCountState.OPEN, target=StockCountState.RECONCILED)
+    def reconcile(self, reconciled_by_user):
+        """Mark the count as posted to the ledger"""
+        self.reconciled_by = reconciled_by_user
+        self.reconciled_at = timezone.now()
+    
+    @transition(field=state, source=StockCountState.OPEN, target=StockCountState.CANCELLED)
+    def cancel(self):
+        """Cancel the count"""
+        pass
+
+
+class StockCountLine(models.Model):
+    """
+    A counted quantity of a product (and batch) in a stock count
+    Lines for the same stock add up, so several people can count it
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    count = models.ForeignKey(StockCount, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='stock_count_lines')
+    batch = models.ForeignKey(Batch, on_delete=models.PROTECT, null=True, blank=True, related_name='stock_count_lines')
+    
+    quantity = models.DecimalField(max_digits=15, decimal_places=3, validators=[MinValueValidator(Decimal('0'))])
+    damaged_quantity = models.DecimalField(
+        max_digits=15,
+        decimal_places=3,
+        default=Decimal('0'),
+        validators=[MinValueValidator(Decimal('0'))]
+    )
+    
+    line_number = models.PositiveIntegerField(null=True, blank=True)  # in the uploaded file
+    counted_by = models.ForeignKey('core.User', on_delete=models.SET_NULL, null=True, related_name='stock_count_lines')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'stock_count_lines'
+        ordering = ['count', 'line_number']
+        indexes = [
+            models.Index(fields=['count', 'product', 'batch']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity} ({self.count.count_number})"
+
+
 class ExpiryAlert(models.Model):
     """Track products approaching expiry"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -295,6 +610,9 @@ class ExpiryAlert(models.Model):
     
     class Meta:
         db_table = 'expiry_alerts'
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'batch'], name='unique_expiry_alert_per_location_batch'),
+        ]
         indexes = [
             models.Index(fields=['tenant', 'expiry_date']),
             models.Index(fields=['alert_sent']),
@@ -0,0 +1,285 @@
+"""
+Recompute stock balances by replaying the inventory ledger
+
+StockBalance is a cache of InventoryLedger. The functions here fold ledger
+rows back into balances with the same arithmetic InventoryService applies
+when posting, so a rebuilt balance matches one maintained incrementally.
+"""
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from core.models import Location
+from .models import InventoryLedger, StockBalance, StockCheckpoint
+
+
+# Ledger columns read while replaying, in order
+LEDGER_FIELDS = [
+    'product_id', 'batch_id', 'quantity_in', 'quantity_out', 'unit_cost',
+    'quantity_reserved', 'quantity_in_transit', 'quantity_damaged', 'created_at',
+]
+
+# Balance columns a rebuild compares and writes
+REPLAYED_FIELDS = [
+    'quantity_on_hand', 'quantity_reserved', 'quantity_in_transit', 'quantity_damaged', 'average_cost',
+]
+
+
+def weighted_average_cost(quantity_on_hand, average_cost, quantity_in, unit_cost):
+    """
+    Average cost after receiving quantity_in at unit_cost
+    """
+    previous_quantity = max(quantity_on_hand, Decimal('0'))
+    previous_cost = average_cost if average_cost is not None else unit_cost
+    return (
+        (previous_cost * previous_quantity + unit_cost * quantity_in)
+        / (previous_quantity + quantity_in)
+    ).quantize(Decimal('0.0001'))
+
+
+@dataclass
+class ReplayedBalance:
+    """Balance of one (product, batch) at a location, as the ledger says"""
+    quantity_on_hand: Decimal = Decimal('0')
+    quantity_reserved: Decimal = Decimal('0')
+    quantity_in_transit: Decimal = Decimal('0')
+    quantity_damaged: Decimal = Decimal('0')
+    average_cost: Decimal = None
+    last_transaction_at: object = None
+    
+    def apply(self, quantity_in, quantity_out, unit_cost, quantity_reserved,
+              quantity_in_transit, quantity_damaged, created_at):
+        """
+        Fold one ledger row into the balance
+        
+        Ledger rows record the reserved, in-transit and damaged totals after
+        the movement, so those are taken as they are.
+        """
+        if unit_cost is not None and quantity_in > 0:
+            self.average_cost = weighted_average_cost(
+                self.quantity_on_hand, self.average_cost, quantity_in, unit_cost
+            )
+        self.quantity_on_hand += quantity_in - quantity_out
+        self.quantity_reserved = quantity_reserved
+        self.quantity_in_transit = quantity_in_transit
+        self.quantity_damaged = quantity_damaged
+        self.last_transaction_at = created_at
+    
+    @property
+    def is_empty(self):
+        """Nothing on hand or tracked and no cost history"""
+        return self.average_cost is None and not any((
+            self.quantity_on_hand, self.quantity_reserved, self.quantity_in_transit, self.quantity_damaged
+        ))
+    
+    @property
+    def stock_value(self):
+        """On hand quantity valued at the average cost"""
+        return (self.quantity_on_hand * (self.average_cost or Decimal('0'))).quantize(Decimal('0.0001'))
+
+
+def replay(rows, balances=None):
+    """
+    Fold ledger rows (tuples of LEDGER_FIELDS, oldest first) into balances
+    
+    balances: dict of {(product_id, batch_id): ReplayedBalance} to continue
+    from; updated in place and returned.
+    """
+    if balances is None:
+        balances = {}
+    for product_id, batch_id, *movement in rows:
+        key = (product_id, batch_id)
+        balance = balances.get(key)
+        if balance is None:
+            balance = balances[key] = ReplayedBalance()
+        balance.apply(*movement)
+    return balances
+
+
+def ledger_rows(location_id, since=None, until=None, chunk_size=None):
+    """
+    Stream a location's ledger rows oldest first without loading them all
+    """
+    queryset = InventoryLedger.objects.filter(location_id=location_id)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+    return queryset.order_by('created_at', 'id').values_list(*LEDGER_FIELDS).iterator(
+        chunk_size=chunk_size or settings.STOCK_REBUILD_CHUNK_SIZE
+    )
+
+
+def diff_balances(replayed, stock_balances):
+    """
+    Compare replayed balances with stored ones
+    
+    Returns a list of (key, stored StockBalance or None, ReplayedBalance)
+    for every balance that differs. Stored balances the ledger knows
+    nothing about are compared with an empty balance.
+    """
+    changes = []
+    stored = {(b.product_id, b.batch_id): b for b in stock_balances}
+    for key in stored.keys() | replayed.keys():
+        stock_balance = stored.get(key)
+        balance = replayed.get(key) or ReplayedBalance(
+            average_cost=stock_balance.average_cost,
+            last_transaction_at=stock_balance.last_transaction_at,
+        )
+        if stock_balance is None or any(
+            getattr(stock_balance, field) != getattr(balance, field) for field in REPLAYED_FIELDS
+        ):
+            changes.append((key, stock_balance, balance))
+    return changes
+
+
+def rebuild_location(location_id, dry_run=False, chunk_size=None, from_checkpoint=True):
+    """
+    Rebuild the stock balances of one location from its ledger
+    
+    The bulk of the ledger is streamed without locks, up to a cutoff old
+    enough that every transaction writing before it has committed. The
+    location's balances are then locked, the few rows posted since the
+    cutoff replayed on top, and the differences written in one transaction.
+    Replay starts from the latest checkpoint unless from_checkpoint is
+    False. With dry_run nothing is written. Returns the list of differences.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.STOCK_REBUILD_SETTLE_SECONDS)
+    since, replayed = latest_checkpoint(location_id, cutoff) if from_checkpoint else (None, {})
+    replay(ledger_rows(location_id, since=since, until=cutoff, chunk_size=chunk_size), replayed)
+    
+    with transaction.atomic():
+        stock_balances = list(
+            StockBalance.objects.select_for_update().filter(location_id=location_id).order_by('id')
+        )
+        replay(ledger_rows(location_id, since=cutoff, chunk_size=chunk_size), replayed)
+        changes = diff_balances(replayed, stock_balances)
+        if not dry_run and changes:
+            _write_changes(location_id, changes)
+    return changes
+
+
+def _write_changes(location_id, changes):
+    """
+    Write replayed balances over the stored ones
+    """
+    tenant_id = Location.objects.values_list('tenant_id', flat=True).get(id=location_id)
+    
+    now = timezone.now()
+    updated = []
+    created = []
+    for (product_id, batch_id), stock_balance, balance in changes:
+        if stock_balance is None:
+            stock_balance = StockBalance(
+                tenant_id=tenant_id, location_id=location_id, product_id=product_id, batch_id=batch_id
+            )
+            created.append(stock_balance)
+        else:
+            updated.append(stock_balance)
+        for field in REPLAYED_FIELDS:
+            setattr(stock_balance, field, getattr(balance, field))
+        stock_balance.last_transaction_at = balance.last_transaction_at
+        stock_balance.updated_at = now
+    
+    StockBalance.objects.bulk_update(updated, REPLAYED_FIELDS + ['last_transaction_at', 'updated_at'])
+    StockBalance.objects.bulk_create(created)
+
+
+def latest_checkpoint(location_id, at):
+    """
+    Nearest checkpoint of a location taken at or before a point in time
+    
+    Returns (taken_at, balances) with balances as replay() takes them, or
+    (None, {}) when the location has no checkpoint that old.
+    """
+    taken_at = latest_checkpoint_at(location_id, at)
+    if taken_at is None:
+        return None, {}
+    return taken_at, _load_checkpoint(location_id, taken_at)
+
+
+def latest_checkpoint_at(location_id, at):
+    """When the nearest checkpoint at or before a point in time was taken"""
+    return StockCheckpoint.objects.filter(
+        location_id=location_id, taken_at__lte=at
+    ).aggregate(taken_at=Max('taken_at'))['taken_at']
+
+
+def _load_checkpoint(location_id, taken_at):
+    balances = {}
+    for checkpoint in StockCheckpoint.objects.filter(location_id=location_id, taken_at=taken_at):
+        balances[(checkpoint.product_id, checkpoint.batch_id)] = ReplayedBalance(
+            quantity_on_hand=checkpoint.quantity_on_hand,
+            quantity_reserved=checkpoint.quantity_reserved,
+            quantity_in_transit=checkpoint.quantity_in_transit,
+            quantity_damaged=checkpoint.quantity_damaged,
+            average_cost=checkpoint.average_cost,
+            last_transaction_at=checkpoint.last_transaction_at,
+        )
+    return balances
+
+
+def balances_as_of(location_id, at, chunk_size=None):
+    """
+    Stock balances of a location just before a point in time
+    
+    Starts from the nearest checkpoint and replays only the ledger written
+    between it and `at`. Returns {(product_id, batch_id): ReplayedBalance}.
+    """
+    since, balances = latest_checkpoint(location_id, at)
+    return replay(ledger_rows(location_id, since=since, until=at, chunk_size=chunk_size), balances)
+
+
+def checkpoint_boundary(day, frequency=None):
+    """
+    Start (local midnight) of the checkpoint period a day falls in
+    """
+    frequency = frequency or settings.STOCK_CHECKPOINT_FREQUENCY
+    if frequency == 'monthly':
+        day = day.replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def take_checkpoint(location_id, taken_at, chunk_size=None):
+    """
+    Record the balances of a location as of taken_at
+    
+    Skipped (returning 0) when a checkpoint already exists at that instant
+    or nothing was posted since the previous one, which still answers
+    queries just as well. Returns the number of rows written.
+    """
+    since = latest_checkpoint_at(location_id, taken_at)
+    if since == taken_at:
+        return 0
+    tail = InventoryLedger.objects.filter(location_id=location_id, created_at__lt=taken_at)
+    if since is not None:
+        tail = tail.filter(created_at__gte=since)
+    if not tail.exists():
+        return 0
+    
+    balances = _load_checkpoint(location_id, since) if since is not None else {}
+    replay(ledger_rows(location_id, since=since, until=taken_at, chunk_size=chunk_size), balances)
+    tenant_id = Location.objects.values_list('tenant_id', flat=True).get(id=location_id)
+    checkpoints = [
+        StockCheckpoint(
+            tenant_id=tenant_id,
+            location_id=location_id,
+            product_id=product_id,
+            batch_id=batch_id,
+            taken_at=taken_at,
+            quantity_on_hand=balance.quantity_on_hand,
+            quantity_reserved=balance.quantity_reserved,
+            quantity_in_transit=balance.quantity_in_transit,
+            quantity_damaged=balance.quantity_damaged,
+            average_cost=balance.average_cost,
+            stock_value=balance.stock_value,
+            last_transaction_at=balance.last_transaction_at,
+        )
+        for (product_id, batch_id), balance in balances.items()
+        if not balance.is_empty
+    ]
+    StockCheckpoint.objects.bulk_create(checkpoints, batch_size=1000, ignore_conflicts=True)
+    return len(checkpoints)
@@ -0,0 +1,182 @@
+"""
+Product search for the till typeahead
+
+Every active product is broken into normalised tokens (lower case, accents
+and punctuation removed) held in ProductSearchToken: its sku and barcode
+whole, its name word by word. A query is answered from the token index
+alone: exact code hits, then names with words starting with every word
+typed, then codes starting with what was typed, each group an ordered
+index range scan (which works the same on SQLite and PostgreSQL) that
+stops once enough products are found. Only the fields the till needs are
+fetched for the winners.
+"""
+import re
+import unicodedata
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from .models import Product, ProductSearchToken
+
+
+# Fields returned to the till
+RESULT_FIELDS = ['id', 'sku', 'barcode', 'name', 'unit_of_measure', 'track_batches', 'track_expiry']
+NAME_KINDS = ['first_word', 'word']
+TOKEN_LENGTH = ProductSearchToken._meta.get_field('token').max_length
+WORD = re.compile(r'[^\W_]+')
+
+
+def normalise(text):
+    """Lower case text with accents stripped"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def words(text):
+    return [word[:TOKEN_LENGTH] for word in WORD.findall(normalise(text))]
+
+
+def code(text):
+    """A sku or barcode as one token: letters and digits only"""
+    return ''.join(words(text))[:TOKEN_LENGTH]
+
+
+def product_tokens(sku, barcode, name):
+    """Distinct (kind, token) pairs of a product"""
+    tokens = {('code', code(value)) for value in (sku, barcode) if code(value)}
+    for position, word in enumerate(words(name)):
+        tokens.add(('first_word' if position == 0 else 'word', word))
+    return sorted(tokens)
+
+
+def index_products(product_ids):
+    """
+    Rewrite the search tokens of the given products
+    
+    Inactive and deleted products end up with no tokens. A catalog has
+    several tokens per product, so they are inserted directly rather than
+    through bulk_create, whose per-field work would dominate a bulk import.
+    """
+    product_ids = list(product_ids)
+    opts = ProductSearchToken._meta
+    tenant_field = opts.get_field('tenant')
+    product_field = opts.get_field('product')
+    sql = 'INSERT INTO {} ({}) VALUES (%s, %s, %s, %s)'.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in ('tenant_id', 'product_id', 'kind', 'token')),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        ProductSearchToken.objects.filter(product_id__in=product_ids).delete()
+        rows = []
+        for product_id, tenant_id, sku, barcode, name in Product.objects.filter(
+            id__in=product_ids, is_active=True
+        ).values_list('id', 'tenant_id', 'sku', 'barcode', 'name'):
+            tenant_id = tenant_field.get_db_prep_save(tenant_id, connection)
+            product_id = product_field.get_db_prep_save(product_id, connection)
+            rows += [(tenant_id, product_id, kind, token) for kind, token in product_tokens(sku, barcode, name)]
+        if rows:
+            cursor.executemany(sql, rows)
+    return len(rows)
+
+
+def rebuild_index(tenant_id=None, chunk_size=2000):
+    """
+    Reindex every product (of a tenant), chunk by chunk; returns the
+    number of products indexed
+    """
+    products = Product.objects.order_by('id')
+    if tenant_id:
+        products = products.filter(tenant_id=tenant_id)
+    product_ids = list(products.values_list('id', flat=True))
+    for start in range(0, len(product_ids), chunk_size):
+        index_products(product_ids[start:start + chunk_size])
+    return len(product_ids)
+
+
+def _prefix(term):
+    """Index range of tokens starting with term"""
+    return Q(token__gte=term, token__lt=term[:-1] + chr(ord(term[-1]) + 1))
+
+
+def _terms(query):
+    """
+    Distinct words of a query, longest first, dropping words that are the
+    start of a longer one (a token matching the longer word matches both)
+    """
+    kept = []
+    for term in sorted(dict.fromkeys(words(query)), key=len, reverse=True):
+        if not any(other.startswith(term) for other in kept):
+            kept.append(term)
+    return kept
+
+
+def _name_matches(tokens, kind, terms):
+    """
+    Tokens of the given kind starting with the first (longest) term, of
+    names with a word starting with each of the others
+    """
+    matches = tokens.filter(_prefix(terms[0]), kind=kind)
+    for term in terms[1:]:
+        matches = matches.filter(Exists(
+            ProductSearchToken.objects.filter(_prefix(term), product_id=OuterRef('product_id'), kind__in=NAME_KINDS)
+        ))
+    return matches
+
+
+def _extend(ranked, matches, limit):
+    """
+    Append the products of matching tokens not ranked yet, in (token,
+    product) order, until limit is reached. Read a page at a time, each
+    starting after the last row of the one before (a product can match on
+    several tokens, so a page may add fewer products than it has rows)
+    """
+    page_size = limit * 2
+    rows = matches.order_by('token', 'product_id').values_list('token', 'product_id')
+    page = list(rows[:page_size]) if len(ranked) < limit else []
+    while page:
+        for token, product_id in page:
+            if product_id not in ranked:
+                ranked.append(product_id)
+                if len(ranked) == limit:
+                    return
+        if len(page) < page_size:
+            return
+        token, product_id = page[-1]
+        page = list(rows.filter(Q(token__gt=token) | Q(token=token, product_id__gt=product_id))[:page_size])
+
+
+def search_product_ids(tenant_id, query, limit):
+    """
+    Ids of the best matching active products of a tenant, best first
+    
+    Exact sku/barcode hits come first, then names starting with the query's
+    longest word (with a word starting with each other word typed), then
+    other names matching every word, then codes starting with the query.
+    Within each group matches come in alphabetical order of the matched
+    token. Every group is an ordered range scan of the token index that
+    stops once enough products are found, so broad prefixes cost no more
+    than narrow ones.
+    """
+    compact = code(query)
+    if not compact:
+        return []
+    tokens = ProductSearchToken.objects.filter(tenant_id=tenant_id)
+    ranked = []
+    _extend(ranked, tokens.filter(kind='code', token=compact), limit)
+    terms = _terms(query)
+    for kind in NAME_KINDS:
+        _extend(ranked, _name_matches(tokens, kind, terms), limit)
+    if len(compact) >= settings.PRODUCT_SEARCH_MIN_CODE_PREFIX:
+        _extend(ranked, tokens.filter(_prefix(compact), kind='code'), limit)
+    return ranked
+
+
+def search_products(tenant_id, query, limit=None):
+    """
+    Lean rows (RESULT_FIELDS) of the best matching active products
+    """
+    limit = min(limit or settings.PRODUCT_SEARCH_LIMIT, settings.PRODUCT_SEARCH_MAX_LIMIT)
+    product_ids = search_product_ids(tenant_id, query, limit)
+    if not product_ids:
+        return []
+    rows = {row['id']: row for row in Product.objects.filter(id__in=product_ids).values(*RESULT_FIELDS)}
+    return [rows[product_id] for product_id in product_ids if product_id in rows]
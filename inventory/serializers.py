@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from .models import (
     ProductCategory, Product, Batch, InventoryLedger,
-    StockBalance, ExpiryAlert
+    StockBalance, ReorderPoint, StockCheckpoint, StockCount, ProductImport, ExpiryAlert
 )
 from core.models import Location
 
@@ -30,6 +30,21 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class ProductImportSerializer(serializers.ModelSerializer):
+    progress = serializers.IntegerField(read_only=True, allow_null=True)
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = ProductImport
+        fields = ['id', 'tenant', 'file', 'status', 'total_rows', 'processed_rows', 'progress',
+                  'created_count', 'updated_count', 'categories_created', 'error_count', 'errors',
+                  'last_error', 'created_by', 'created_by_username', 'started_at', 'finished_at',
+                  'created_at', 'updated_at']
+        read_only_fields = ['id', 'tenant', 'status', 'total_rows', 'processed_rows', 'created_count',
+                           'updated_count', 'categories_created', 'error_count', 'errors', 'last_error',
+                           'created_by', 'started_at', 'finished_at', 'created_at', 'updated_at']
+
+
 class BatchSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_sku = serializers.CharField(source='product.sku', read_only=True)
@@ -79,6 +94,88 @@ class StockBalanceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'available_quantity', 'updated_at']
 
 
+class ReorderPointSerializer(serializers.ModelSerializer):
+    location_name = serializers.CharField(source='location.name', read_only=True)
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+    suggested_quantity = serializers.DecimalField(max_digits=15, decimal_places=3, read_only=True)
+    
+    class Meta:
+        model = ReorderPoint
+        fields = ['id', 'tenant', 'location', 'location_name', 'product', 'product_name',
+                  'product_sku', 'reorder_point', 'max_level', 'quantity_on_hand', 'is_below',
+                  'below_since', 'suggested_quantity', 'is_active', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'quantity_on_hand', 'is_below', 'below_since', 'created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        reorder_point = attrs.get('reorder_point', getattr(self.instance, 'reorder_point', None))
+        max_level = attrs.get('max_level', getattr(self.instance, 'max_level', None))
+        if max_level is not None and reorder_point is not None and max_level < reorder_point:
+            raise serializers.ValidationError({'max_level': 'Max level cannot be below the reorder point'})
+        return attrs
+
+
+class StockCheckpointSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+    batch_number = serializers.CharField(source='batch.batch_number', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = StockCheckpoint
+        fields = ['product', 'product_name', 'product_sku', 'batch', 'batch_number',
+                  'quantity_on_hand', 'quantity_reserved', 'quantity_in_transit',
+                  'quantity_damaged', 'average_cost', 'stock_value', 'last_transaction_at']
+
+
+class StockAsOfRequestSerializer(serializers.Serializer):
+    """Serializer for point-in-time stock queries"""
+    location_id = serializers.UUIDField()
+    date = serializers.DateField(required=False, help_text='Stock at the close of this day')
+    at = serializers.DateTimeField(required=False, help_text='Stock just before this instant')
+    
+    def validate(self, attrs):
+        if ('date' in attrs) == ('at' in attrs):
+            raise serializers.ValidationError('Provide either date or at')
+        return attrs
+
+
+class StockCountSerializer(serializers.ModelSerializer):
+    location_name = serializers.CharField(source='location.name', read_only=True)
+    state_display = serializers.CharField(source='get_state_display', read_only=True)
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True, allow_null=True)
+    reconciled_by_username = serializers.CharField(source='reconciled_by.username', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = StockCount
+        fields = ['id', 'tenant', 'location', 'location_name', 'count_number', 'is_full_count',
+                  'state', 'state_display', 'adjusted_items', 'variance_value', 'notes',
+                  'created_by', 'created_by_username', 'reconciled_by', 'reconciled_by_username',
+                  'reconciled_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'count_number', 'state', 'adjusted_items', 'variance_value',
+                           'created_by', 'reconciled_by', 'reconciled_at', 'created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        tenant = attrs.get('tenant', getattr(self.instance, 'tenant', None))
+        location = attrs.get('location', getattr(self.instance, 'location', None))
+        if tenant and location and location.tenant_id != tenant.id:
+            raise serializers.ValidationError({'location': 'Location belongs to another tenant'})
+        return attrs
+
+
+class CountVarianceSerializer(serializers.Serializer):
+    """Serializer for the variances of a stock count"""
+    product = serializers.UUIDField(source='product_id')
+    product_sku = serializers.CharField()
+    product_name = serializers.CharField()
+    batch = serializers.UUIDField(source='batch_id', allow_null=True)
+    batch_number = serializers.CharField(allow_null=True)
+    expected = serializers.DecimalField(max_digits=15, decimal_places=3)
+    counted = serializers.DecimalField(max_digits=15, decimal_places=3)
+    damaged = serializers.DecimalField(max_digits=15, decimal_places=3)
+    variance = serializers.DecimalField(max_digits=15, decimal_places=3)
+    variance_value = serializers.DecimalField(max_digits=18, decimal_places=4)
+
+
 class ExpiryAlertSerializer(serializers.ModelSerializer):
     location_name = serializers.CharField(source='location.name', read_only=True)
     product_name = serializers.CharField(source='product.name', read_only=True)
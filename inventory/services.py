@@ -1,12 +1,22 @@
 """
 Business logic services for inventory management
 """
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
 from django.utils import timezone
 from decimal import Decimal
 from datetime import timedelta
-from .models import InventoryLedger, StockBalance, ExpiryAlert, Product, Batch
+from .models import InventoryLedger, StockBalance, ReorderPoint, ExpiryAlert, Product, Batch
+from .replay import weighted_average_cost
 from core.models import Location, User
+from notifications.services import NotificationService
+
+
+# Columns written back to a stock balance after a movement
+BALANCE_FIELDS = [
+    'quantity_on_hand', 'quantity_reserved', 'quantity_in_transit', 'quantity_damaged',
+    'average_cost', 'last_transaction_at', 'updated_at',
+]
 
 
 class InventoryService:
@@ -15,7 +25,6 @@ class InventoryService:
     """
     
     @staticmethod
-    @transaction.atomic
     def create_ledger_entry(
         tenant,
         location,
@@ -35,64 +44,307 @@ class InventoryService:
     ):
         """
         Create an inventory ledger entry and update stock balance
+        
+        quantity_reserved, quantity_in_transit and quantity_damaged are
+        changes (negative to release); the ledger entry records the resulting
+        totals. See create_ledger_entries.
         """
-        # Get current stock balance
-        stock_balance, created = StockBalance.objects.get_or_create(
-            tenant=tenant,
-            location=location,
-            product=product,
-            batch=batch,
-            defaults={
-                'quantity_on_hand': Decimal('0'),
-                'quantity_reserved': Decimal('0'),
-                'quantity_in_transit': Decimal('0'),
-                'quantity_damaged': Decimal('0'),
-            }
+        return InventoryService.create_ledger_entries(tenant, [{
+            'location': location,
+            'product': product,
+            'batch': batch,
+            'transaction_type': transaction_type,
+            'quantity_in': quantity_in,
+            'quantity_out': quantity_out,
+            'unit_cost': unit_cost,
+            'reference_id': reference_id,
+            'reference_type': reference_type,
+            'quantity_reserved': quantity_reserved,
+            'quantity_in_transit': quantity_in_transit,
+            'quantity_damaged': quantity_damaged,
+            'notes': notes,
+            'created_by': created_by,
+        }])[0]
+    
+    @staticmethod
+    @transaction.atomic
+    def create_ledger_entries(tenant, movements, balances=None):
+        """
+        Post several movements in one go
+        
+        movements: list of dicts with the arguments of create_ledger_entry
+        (location, product, transaction_type, and optionally batch, quantities,
+        unit_cost, reference, notes and created_by). Movements are applied in
+        order, so several movements of the same stock see each other.
+        balances: stock balances already locked by the caller with
+        lock_balances; the rest are locked here.
+        The affected balances are locked in a deterministic order, ledger
+        entries are bulk inserted and the balances written back in one
+        statement. Returns the ledger entries in the order given.
+        """
+        balances = dict(balances or {})
+        missing = [
+            (movement['location'], movement['product'], movement.get('batch'))
+            for movement in movements
+            if InventoryService.balance_key(
+                movement['location'], movement['product'], movement.get('batch')
+            ) not in balances
+        ]
+        if missing:
+            balances.update(InventoryService.lock_balances(missing))
+        
+        ledger_entries = []
+        touched = {}
+        stock_changes = {}
+        for movement in movements:
+            location = movement['location']
+            product = movement['product']
+            batch = movement.get('batch')
+            key = InventoryService.balance_key(location, product, batch)
+            stock_balance = balances[key]
+            unit_cost = movement.get('unit_cost')
+            previous_average_cost = stock_balance.average_cost
+            quantity_in = movement.get('quantity_in', Decimal('0'))
+            quantity_out = movement.get('quantity_out', Decimal('0'))
+            
+            InventoryService.apply_movement(
+                stock_balance,
+                quantity_in=quantity_in,
+                quantity_out=quantity_out,
+                unit_cost=unit_cost,
+                quantity_reserved=movement.get('quantity_reserved', Decimal('0')),
+                quantity_in_transit=movement.get('quantity_in_transit', Decimal('0')),
+                quantity_damaged=movement.get('quantity_damaged', Decimal('0'))
+            )
+            
+            ledger_entries.append(InventoryLedger(
+                tenant=tenant,
+                location=location,
+                product=product,
+                batch=batch,
+                transaction_type=movement['transaction_type'],
+                reference_id=movement.get('reference_id'),
+                reference_type=movement.get('reference_type') or '',
+                quantity_in=quantity_in,
+                quantity_out=quantity_out,
+                unit_cost=unit_cost if unit_cost is not None else previous_average_cost,
+                quantity_on_hand=stock_balance.quantity_on_hand,
+                quantity_reserved=stock_balance.quantity_reserved,
+                quantity_in_transit=stock_balance.quantity_in_transit,
+                quantity_damaged=stock_balance.quantity_damaged,
+                notes=movement.get('notes', ''),
+                created_by=movement.get('created_by')
+            ))
+            touched[key] = stock_balance
+            change = stock_changes.setdefault((location.id, product.id), [location, product, Decimal('0')])
+            change[2] += quantity_in - quantity_out
+        
+        InventoryLedger.objects.bulk_create(ledger_entries)
+        
+        # Update stock balances
+        now = timezone.now()
+        for stock_balance in touched.values():
+            stock_balance.last_transaction_at = now
+            stock_balance.updated_at = now
+        InventoryService._write_balances(touched.values())
+        
+        ReorderService.apply_stock_changes(stock_changes.values())
+        
+        return ledger_entries
+    
+    @staticmethod
+    def _write_balances(stock_balances):
+        """
+        Write BALANCE_FIELDS of existing (locked) stock balances
+        
+        Like bulk_update this only ever updates, but as one plain UPDATE
+        by primary key per row: bulk_update builds a CASE expression per
+        field and row, which dominates postings of thousands of movements.
+        """
+        fields = [StockBalance._meta.get_field(name) for name in BALANCE_FIELDS]
+        pk = StockBalance._meta.pk
+        sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+            connection.ops.quote_name(StockBalance._meta.db_table),
+            ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields),
+            connection.ops.quote_name(pk.column),
         )
+        rows = [
+            [field.get_db_prep_save(getattr(stock_balance, field.attname), connection) for field in fields]
+            + [pk.get_db_prep_save(stock_balance.pk, connection)]
+            for stock_balance in stock_balances
+        ]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+    
+    @staticmethod
+    def lock_balance(location, product, batch=None):
+        """
+        Fetch a stock balance locked for update, creating it if missing
+        """
+        return InventoryService.lock_balances([(location, product, batch)])[
+            InventoryService.balance_key(location, product, batch)
+        ]
+    
+    @staticmethod
+    def lock_balances(stock_keys):
+        """
+        Lock the stock balances of (location, product, batch) triples
+        
+        Rows are locked in primary key order so concurrent transactions
+        touching overlapping stock cannot deadlock; missing rows are created
+        first. Returns a dict keyed by (location_id, product_id, batch_id).
+        """
+        wanted = {}
+        for location, product, batch in stock_keys:
+            wanted[InventoryService.balance_key(location, product, batch)] = (location, product, batch)
+        
+        balances = InventoryService._select_balances_for_update(wanted)
+        missing = [stock_key for key, stock_key in wanted.items() if key not in balances]
+        if missing:
+            # Concurrent creators of the same rows are ignored and then waited for
+            StockBalance.objects.bulk_create([
+                StockBalance(tenant_id=location.tenant_id, location=location, product=product, batch=batch)
+                for location, product, batch in missing
+            ], ignore_conflicts=True)
+            balances.update(InventoryService._select_balances_for_update({
+                InventoryService.balance_key(*stock_key): stock_key for stock_key in missing
+            }))
+        return balances
+    
+    @staticmethod
+    def _select_balances_for_update(wanted):
+        """
+        SELECT ... FOR UPDATE the balances of the given keys, in primary key order
+        """
+        balance_filter = Q()
+        for location_id, product_id, batch_id in wanted:
+            if batch_id:
+                balance_filter |= Q(location_id=location_id, product_id=product_id, batch_id=batch_id)
+            else:
+                balance_filter |= Q(location_id=location_id, product_id=product_id, batch__isnull=True)
         
-        # Calculate new quantities
+        balances = {}
+        if wanted:
+            for stock_balance in StockBalance.objects.select_for_update().filter(balance_filter).order_by('id'):
+                balances[(stock_balance.location_id, stock_balance.product_id, stock_balance.batch_id)] = stock_balance
+        return balances
+    
+    @staticmethod
+    def balance_key(location, product, batch=None):
+        """Key of a stock balance in lock_balances results"""
+        return (location.id, product.id, batch.id if batch else None)
+    
+    @staticmethod
+    def apply_movement(
+        stock_balance,
+        quantity_in=Decimal('0'),
+        quantity_out=Decimal('0'),
+        unit_cost=None,
+        quantity_reserved=Decimal('0'),
+        quantity_in_transit=Decimal('0'),
+        quantity_damaged=Decimal('0')
+    ):
+        """
+        Apply a movement to a locked stock balance in memory
+        
+        Receipts at a known unit cost move the average cost to the weighted
+        average of the stock already on hand and the stock received.
+        """
         new_on_hand = stock_balance.quantity_on_hand + quantity_in - quantity_out
         if new_on_hand < 0:
             raise ValueError(f"Insufficient stock. Available: {stock_balance.quantity_on_hand}")
         
-        # Create ledger entry
-        ledger_entry = InventoryLedger.objects.create(
-            tenant=tenant,
-            location=location,
-            product=product,
-            batch=batch,
-            transaction_type=transaction_type,
-            reference_id=reference_id,
-            reference_type=reference_type,
-            quantity_in=quantity_in,
-            quantity_out=quantity_out,
-            unit_cost=unit_cost or stock_balance.average_cost,
-            quantity_on_hand=new_on_hand,
-            quantity_reserved=quantity_reserved,
-            quantity_in_transit=quantity_in_transit,
-            quantity_damaged=quantity_damaged,
-            notes=notes,
-            created_by=created_by
-        )
+        new_reserved = stock_balance.quantity_reserved + quantity_reserved
+        if new_reserved < 0:
+            raise ValueError(f"Insufficient reserved stock. Reserved: {stock_balance.quantity_reserved}")
+        new_in_transit = stock_balance.quantity_in_transit + quantity_in_transit
+        if new_in_transit < 0:
+            raise ValueError(f"Insufficient stock in transit. In transit: {stock_balance.quantity_in_transit}")
+        new_damaged = stock_balance.quantity_damaged + quantity_damaged
+        if new_damaged < 0:
+            raise ValueError(f"Insufficient damaged stock. Damaged: {stock_balance.quantity_damaged}")
+        
+        # Update average cost (weighted average)
+        if unit_cost is not None and quantity_in > 0:
+            stock_balance.average_cost = weighted_average_cost(
+                stock_balance.quantity_on_hand, stock_balance.average_cost, quantity_in, unit_cost
+            )
         
-        # Update stock balance
         stock_balance.quantity_on_hand = new_on_hand
-        stock_balance.quantity_reserved = quantity_reserved
-        stock_balance.quantity_in_transit = quantity_in_transit
-        stock_balance.quantity_damaged = quantity_damaged
+        stock_balance.quantity_reserved = new_reserved
+        stock_balance.quantity_in_transit = new_in_transit
+        stock_balance.quantity_damaged = new_damaged
+        return stock_balance
+    
+    @staticmethod
+    @transaction.atomic
+    def allocate_batches(location, quantities, strategy='fefo'):
+        """
+        Split requested quantities across the batches in stock at a location
         
-        # Update average cost (weighted average)
-        if unit_cost and quantity_in > 0:
-            total_cost = (stock_balance.average_cost or Decimal('0')) * stock_balance.quantity_on_hand
-            new_cost = unit_cost * quantity_in
-            total_quantity = stock_balance.quantity_on_hand + quantity_in
-            if total_quantity > 0:
-                stock_balance.average_cost = (total_cost + new_cost) / total_quantity
+        quantities: dict of {product: quantity}. Batches are drawn by earliest
+        expiry date ('fefo', batches without one last) or earliest production
+        date ('fifo'); inactive and expired batches are skipped. Candidates
+        come from one query, and only the balances actually drawn from are
+        locked; stock taken concurrently is made up from the next batches.
+        Returns ({product_id: [(batch, quantity), ...]}, locked balances keyed
+        by balance_key, {product_id: quantity that could not be allocated}).
+        """
+        if strategy == 'fifo':
+            order = ['product_id', 'batch__production_date', 'batch__batch_number']
+        else:
+            order = [
+                'product_id', F('batch__expiry_date').asc(nulls_last=True),
+                'batch__production_date', 'batch__batch_number'
+            ]
         
-        stock_balance.last_transaction_at = ledger_entry.created_at
-        stock_balance.save()
+        products = {product.id: product for product in quantities}
+        remaining = {product.id: quantity for product, quantity in quantities.items() if quantity > 0}
+        allocations = {product_id: [] for product_id in products}
+        locked = {}
+        today = timezone.localdate()
         
-        return ledger_entry
+        while remaining:
+            candidates = list(
+                StockBalance.objects.filter(
+                    location=location,
+                    product_id__in=remaining,
+                    batch__isnull=False,
+                    batch__is_active=True,
+                    quantity_on_hand__gt=F('quantity_reserved'),
+                ).filter(
+                    Q(batch__expiry_date__isnull=True) | Q(batch__expiry_date__gte=today)
+                ).exclude(
+                    id__in=[stock_balance.id for stock_balance in locked.values()]
+                ).select_related('batch').order_by(*order)
+            )
+            
+            # Plan on the unlocked figures, then lock only what the plan draws from
+            planned = dict(remaining)
+            picks = []
+            for stock_balance in candidates:
+                if planned.get(stock_balance.product_id, 0) > 0:
+                    planned[stock_balance.product_id] -= stock_balance.available_quantity
+                    picks.append(stock_balance)
+            if not picks:
+                break
+            
+            locked_now = InventoryService.lock_balances(
+                [(location, products[pick.product_id], pick.batch) for pick in picks]
+            )
+            locked.update(locked_now)
+            for pick in picks:
+                stock_balance = locked_now[InventoryService.balance_key(location, products[pick.product_id], pick.batch)]
+                stock_balance.batch = pick.batch
+                take = min(stock_balance.available_quantity, remaining.get(pick.product_id, 0))
+                if take > 0:
+                    allocations[pick.product_id].append((pick.batch, take))
+                    remaining[pick.product_id] -= take
+                    if not remaining[pick.product_id]:
+                        del remaining[pick.product_id]
+        
+        return allocations, locked, remaining
     
     @staticmethod
     def check_stock_availability(location, product, quantity, batch=None):
@@ -112,109 +364,202 @@ class InventoryService:
             return False, None
     
     @staticmethod
+    @transaction.atomic
     def reserve_stock(location, product, quantity, batch=None, created_by=None):
         """
         Reserve stock (move from on-hand to reserved)
         """
-        stock_balance, _ = StockBalance.objects.get_or_create(
-            tenant=location.tenant,
-            location=location,
-            product=product,
-            batch=batch,
-            defaults={
-                'quantity_on_hand': Decimal('0'),
-                'quantity_reserved': Decimal('0'),
-            }
-        )
+        stock_balance = InventoryService.lock_balance(location, product, batch)
         
         if stock_balance.available_quantity < quantity:
             raise ValueError(f"Insufficient available stock. Available: {stock_balance.available_quantity}")
         
-        new_reserved = stock_balance.quantity_reserved + quantity
-        
         InventoryService.create_ledger_entry(
             tenant=location.tenant,
             location=location,
             product=product,
             batch=batch,
             transaction_type='adjustment',
-            quantity_reserved=new_reserved,
+            quantity_reserved=quantity,
             notes=f'Reserved {quantity} units',
             created_by=created_by
         )
     
     @staticmethod
+    @transaction.atomic
     def release_reservation(location, product, quantity, batch=None, created_by=None):
         """
         Release reserved stock (move from reserved back to on-hand)
         """
-        stock_balance = StockBalance.objects.get(
-            location=location,
-            product=product,
-            batch=batch
-        )
-        
-        if stock_balance.quantity_reserved < quantity:
-            raise ValueError(f"Insufficient reserved stock. Reserved: {stock_balance.quantity_reserved}")
-        
-        new_reserved = stock_balance.quantity_reserved - quantity
-        
         InventoryService.create_ledger_entry(
             tenant=location.tenant,
             location=location,
             product=product,
             batch=batch,
             transaction_type='adjustment',
-            quantity_reserved=new_reserved,
+            quantity_reserved=-quantity,
             notes=f'Released reservation of {quantity} units',
             created_by=created_by
         )
     
     @staticmethod
-    def check_expiry_alerts():
+    def check_expiry_alerts(days=30):
         """
         Check for products approaching expiry and create alerts
+        
+        Stock of active batches expiring within `days` is read in one joined
+        query and compared with the existing alerts; new alerts are bulk
+        inserted and only alerts whose quantity or countdown changed are
+        written back. Returns the alerts created.
         """
-        today = timezone.now().date()
-        alert_threshold = today + timedelta(days=30)  # Alert 30 days before expiry
+        today = timezone.localdate()
+        alert_threshold = today + timedelta(days=days)
         
-        batches = Batch.objects.filter(
-            expiry_date__isnull=False,
-            expiry_date__lte=alert_threshold,
-            is_active=True
-        )
+        candidates = list(StockBalance.objects.filter(
+            batch__isnull=False,
+            batch__is_active=True,
+            batch__expiry_date__isnull=False,
+            batch__expiry_date__lte=alert_threshold,
+            quantity_on_hand__gt=0
+        ).values_list(
+            'tenant_id', 'location_id', 'product_id', 'batch_id', 'batch__expiry_date', 'quantity_on_hand'
+        ))
+        if not candidates:
+            return []
+        
+        earliest = min(expiry_date for _, _, _, _, expiry_date, _ in candidates)
+        existing = {
+            (alert.location_id, alert.batch_id): alert
+            for alert in ExpiryAlert.objects.filter(
+                batch__expiry_date__gte=earliest,
+                batch__expiry_date__lte=alert_threshold
+            ).only('id', 'location_id', 'batch_id', 'expiry_date', 'quantity', 'days_until_expiry')
+        }
         
         alerts_created = []
-        for batch in batches:
-            # Get stock balances for this batch
-            stock_balances = StockBalance.objects.filter(
-                batch=batch,
-                quantity_on_hand__gt=0
-            )
-            
-            for stock_balance in stock_balances:
-                days_until_expiry = (batch.expiry_date - today).days
-                
-                # Check if alert already exists
-                alert, created = ExpiryAlert.objects.get_or_create(
-                    tenant=stock_balance.tenant,
-                    location=stock_balance.location,
-                    product=stock_balance.product,
-                    batch=batch,
-                    defaults={
-                        'expiry_date': batch.expiry_date,
-                        'quantity': stock_balance.quantity_on_hand,
-                        'days_until_expiry': days_until_expiry,
-                    }
-                )
-                
-                if created:
-                    alerts_created.append(alert)
-                else:
-                    # Update existing alert
-                    alert.quantity = stock_balance.quantity_on_hand
-                    alert.days_until_expiry = days_until_expiry
-                    alert.save()
+        alerts_changed = []
+        for tenant_id, location_id, product_id, batch_id, expiry_date, quantity in candidates:
+            days_until_expiry = (expiry_date - today).days
+            alert = existing.get((location_id, batch_id))
+            if alert is None:
+                alerts_created.append(ExpiryAlert(
+                    tenant_id=tenant_id,
+                    location_id=location_id,
+                    product_id=product_id,
+                    batch_id=batch_id,
+                    expiry_date=expiry_date,
+                    quantity=quantity,
+                    days_until_expiry=days_until_expiry,
+                ))
+            elif (alert.quantity, alert.days_until_expiry, alert.expiry_date) != (quantity, days_until_expiry, expiry_date):
+                alert.quantity = quantity
+                alert.days_until_expiry = days_until_expiry
+                alert.expiry_date = expiry_date
+                alerts_changed.append(alert)
+        
+        # A concurrent scan may have created some of the same alerts
+        ExpiryAlert.objects.bulk_create(alerts_created, batch_size=1000, ignore_conflicts=True)
+        ExpiryAlert.objects.bulk_update(
+            alerts_changed, ['quantity', 'days_until_expiry', 'expiry_date'], batch_size=1000
+        )
         
         return alerts_created
 
+
+class ReorderService:
+    """
+    Service class keeping reorder points in step with stock
+    """
+    
+    @staticmethod
+    def apply_stock_changes(changes):
+        """
+        Move the on-hand quantity of affected reorder points and detect
+        reorder point crossings
+        
+        changes: iterable of (location, product, on-hand change). Runs in the
+        caller's transaction, so a crossing is notified exactly once: when
+        the movement that causes it commits.
+        """
+        changes = {
+            (location.id, product.id): (location, product, quantity)
+            for location, product, quantity in changes if quantity
+        }
+        if not changes:
+            return
+        
+        # One OR term per pair outgrows SQLite's expression depth on big postings
+        points = [
+            point for point in ReorderPoint.objects.select_for_update().filter(
+                location_id__in={location_id for location_id, _ in changes},
+                product_id__in={product_id for _, product_id in changes},
+            ).order_by('id')
+            if (point.location_id, point.product_id) in changes
+        ]
+        if not points:
+            return
+        
+        for point in points:
+            location, product, quantity = changes[(point.location_id, point.product_id)]
+            point.location, point.product = location, product
+            point.quantity_on_hand += quantity
+        ReorderService._update_points(points)
+    
+    @staticmethod
+    @transaction.atomic
+    def refresh(points=None):
+        """
+        Recompute the on-hand quantity of reorder points from the stock
+        balances (all of them when points is None)
+        
+        Used when a reorder point is created or changed, and to reconcile
+        after balances were rebuilt. Returns the number of points refreshed.
+        """
+        points = ReorderPoint.objects.all() if points is None else ReorderPoint.objects.filter(
+            id__in=[point.id for point in points]
+        )
+        # Locked before reading balances: movements committing meanwhile
+        # then apply their change on top of the refreshed quantity
+        points = list(points.select_for_update(of=('self',)).select_related('location', 'product').order_by('id'))
+        if not points:
+            return 0
+        
+        location_ids = {point.location_id for point in points}
+        product_ids = {point.product_id for point in points}
+        on_hand = {
+            (row['location_id'], row['product_id']): row['total']
+            for row in StockBalance.objects.filter(
+                location_id__in=location_ids, product_id__in=product_ids
+            ).values('location_id', 'product_id').annotate(total=Sum('quantity_on_hand'))
+        }
+        
+        for point in points:
+            point.quantity_on_hand = on_hand.get((point.location_id, point.product_id)) or Decimal('0')
+        return ReorderService._update_points(points)
+    
+    @staticmethod
+    def _update_points(points):
+        """
+        Re-evaluate is_below, save the points and notify new crossings
+        """
+        now = timezone.now()
+        crossings = []
+        for point in points:
+            is_below = point.is_active and point.quantity_on_hand <= point.reorder_point
+            if is_below != point.is_below:
+                point.is_below = is_below
+                point.below_since = now if is_below else None
+                if is_below:
+                    crossings.append(point)
+            point.updated_at = now
+        
+        ReorderPoint.objects.bulk_update(points, ['quantity_on_hand', 'is_below', 'below_since', 'updated_at'])
+        
+        for point in crossings:
+            NotificationService.notify_low_stock(
+                point.location,
+                point.product,
+                point.quantity_on_hand,
+                point.reorder_point
+            )
+        return len(points)
@@ -0,0 +1,69 @@
+"""
+Background tasks for inventory
+"""
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from core.models import Location
+from .catalog_import import run_product_import as run_import
+from .models import ProductImport
+from .replay import checkpoint_boundary, take_checkpoint
+from .services import InventoryService, ReorderService
+
+
+@shared_task(ignore_result=True)
+def take_stock_checkpoints():
+    """
+    Checkpoint every location with ledger activity at the start of the
+    current period (STOCK_CHECKPOINT_FREQUENCY)
+    """
+    taken_at = checkpoint_boundary(timezone.localdate())
+    if taken_at > timezone.now() - timedelta(seconds=settings.STOCK_REBUILD_SETTLE_SECONDS):
+        # Transactions posting just before the boundary may not have committed yet
+        return 0
+    
+    location_ids = Location.objects.values_list('id', flat=True)
+    return sum(take_checkpoint(location_id, taken_at) for location_id in location_ids)
+
+
+@shared_task(ignore_result=True)
+def scan_expiry_alerts():
+    """
+    Refresh expiry alerts for stock approaching its expiry date
+    """
+    return len(InventoryService.check_expiry_alerts())
+
+
+@shared_task(ignore_result=True)
+def reconcile_reorder_points():
+    """
+    Recompute reorder point quantities from the stock balances
+    """
+    return ReorderService.refresh()
+
+
+@shared_task(ignore_result=True)
+def run_product_import(import_id):
+    """
+    Import a queued product catalog file
+    """
+    run_import(import_id)
+
+
+@shared_task(ignore_result=True)
+def run_pending_product_imports():
+    """
+    Start product imports whose queued task never arrived, and restart
+    (from the top; rows are written by sku, so that is safe) running ones
+    whose worker stopped recording progress
+    """
+    now = timezone.now()
+    ProductImport.objects.filter(
+        status='running', updated_at__lt=now - timedelta(seconds=settings.PRODUCT_IMPORT_STALE_SECONDS)
+    ).update(status='pending', updated_at=now)
+    
+    stale = now - timedelta(minutes=1)
+    import_ids = ProductImport.objects.filter(status='pending', created_at__lt=stale).values_list('id', flat=True)
+    for import_id in list(import_ids):
+        run_import(import_id)
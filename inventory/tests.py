@@ -0,0 +1,281 @@
+import io
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from config.models import SystemConfiguration
+from core.models import Location, Tenant, User
+from . import catalog_import
+from .catalog_import import import_products
+from .counts import reconcile_count
+from .models import (
+    InventoryLedger, Product, ProductCategory, ProductImport, StockBalance, StockCount, StockCountLine,
+    StockCountState
+)
+from .search import index_products, search_product_ids
+from .services import InventoryService
+
+
+class InventoryTestCase(TestCase):
+    """A tenant with a shop, a user and two products"""
+    
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name='Shop', slug='shop')
+        SystemConfiguration.objects.create(tenant=self.tenant)
+        self.shop = Location.objects.create(tenant=self.tenant, name='Shop', code='SH', location_type='shop')
+        self.user = User.objects.create_user(username='manager', password='secret', tenant=self.tenant)
+        self.bread = Product.objects.create(tenant=self.tenant, name='Bread', sku='BREAD')
+        self.milk = Product.objects.create(tenant=self.tenant, name='Milk', sku='MILK')
+    
+    def receive(self, product, quantity, unit_cost='1', location=None, batch=None):
+        return InventoryService.create_ledger_entry(
+            tenant=self.tenant,
+            location=location or self.shop,
+            product=product,
+            batch=batch,
+            transaction_type='adjustment',
+            quantity_in=Decimal(quantity),
+            unit_cost=Decimal(unit_cost),
+            reference_type='test',
+        )
+    
+    def on_hand(self, product, location=None, batch=None):
+        return StockBalance.objects.get(location=location or self.shop, product=product, batch=batch).quantity_on_hand
+
+
+class SearchProductIdsTests(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name='Shop', slug='shop')
+    
+    def create_products(self, names):
+        products = [
+            Product.objects.create(tenant=self.tenant, name=name, sku=f'SKU-{i}-{name[:2]}')
+            for i, name in enumerate(names)
+        ]
+        index_products([product.id for product in products])
+        return products
+    
+    def test_products_matching_on_several_tokens_are_not_skipped(self):
+        many = self.create_products(['zz caa cab cac cad cae caf'] * 3)
+        self.create_products(['zy cb'] * 5)
+        
+        found = search_product_ids(self.tenant.id, 'c', 5)
+        
+        self.assertEqual(len(found), 5)
+        self.assertEqual(len(set(found)), 5)
+        self.assertTrue({product.id for product in many} <= set(found))
+    
+    def test_every_match_is_returned_below_the_limit(self):
+        products = self.create_products(['zz caa cab cac cad cae caf'] * 3 + ['zy cb'] * 5)
+        
+        found = search_product_ids(self.tenant.id, 'c', 20)
+        
+        self.assertEqual(set(found), {product.id for product in products})
+
+
+class ReconcileCountTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.receive(self.bread, '10')
+        self.receive(self.milk, '4')
+    
+    def count(self, lines, is_full_count=False):
+        count = StockCount.objects.create(
+            tenant=self.tenant, location=self.shop, count_number=f'CNT-{StockCount.objects.count()}',
+            is_full_count=is_full_count, created_by=self.user,
+        )
+        StockCountLine.objects.bulk_create([
+            StockCountLine(count=count, product=product, quantity=Decimal(quantity), line_number=number)
+            for number, (product, quantity) in enumerate(lines, start=1)
+        ])
+        return count
+    
+    def test_variances_are_posted_as_adjustments(self):
+        count = self.count([(self.bread, '7'), (self.bread, '1')])
+        
+        variances = reconcile_count(count, self.user)
+        
+        self.assertEqual([(v.product_id, v.variance) for v in variances], [(self.bread.id, Decimal('-2'))])
+        self.assertEqual(self.on_hand(self.bread), Decimal('8'))
+        entry = InventoryLedger.objects.get(reference_id=count.id)
+        self.assertEqual((entry.transaction_type, entry.quantity_out), ('adjustment', Decimal('2')))
+        count = StockCount.objects.get(id=count.id)
+        self.assertEqual((count.state, count.adjusted_items), (StockCountState.RECONCILED, 1))
+    
+    def test_cycle_count_leaves_uncounted_balances_untouched(self):
+        self.milk.is_active = False
+        self.milk.save()
+        count = self.count([(self.bread, '9')])
+        
+        reconcile_count(count, self.user)
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('9'))
+        self.assertEqual(self.on_hand(self.milk), Decimal('4'))
+        self.assertFalse(InventoryLedger.objects.filter(reference_id=count.id, product=self.milk).exists())
+    
+    def test_full_count_zeroes_uncounted_balances(self):
+        count = self.count([(self.bread, '10')], is_full_count=True)
+        
+        reconcile_count(count, self.user)
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('10'))
+        self.assertEqual(self.on_hand(self.milk), Decimal('0'))
+    
+    def test_reconciled_count_cannot_be_reconciled_again(self):
+        count = self.count([(self.bread, '9')])
+        reconcile_count(count, self.user)
+        
+        with self.assertRaises(ValueError):
+            reconcile_count(count, self.user)
+        self.assertEqual(self.on_hand(self.bread), Decimal('9'))
+
+
+class LedgerPostingTests(InventoryTestCase):
+    def movement(self, product, **quantities):
+        return {'location': self.shop, 'product': product, 'transaction_type': 'adjustment', **quantities}
+    
+    def test_receipts_move_average_cost_to_the_weighted_average(self):
+        entries = InventoryService.create_ledger_entries(self.tenant, [
+            self.movement(self.bread, quantity_in=Decimal('10'), unit_cost=Decimal('2')),
+            self.movement(self.bread, quantity_in=Decimal('10'), unit_cost=Decimal('4')),
+            self.movement(self.bread, quantity_out=Decimal('5')),
+            self.movement(self.bread, quantity_in=Decimal('5'), unit_cost=Decimal('6')),
+        ])
+        
+        stock_balance = StockBalance.objects.get(location=self.shop, product=self.bread)
+        self.assertEqual(stock_balance.quantity_on_hand, Decimal('20'))
+        self.assertEqual(stock_balance.average_cost, Decimal('3.75'))
+        self.assertEqual([entry.quantity_on_hand for entry in entries], [10, 20, 15, 20])
+        self.assertEqual([entry.unit_cost for entry in entries], [2, 4, 3, 6])
+    
+    def test_receipt_without_cost_keeps_average_cost(self):
+        self.receive(self.bread, '4', unit_cost='5')
+        
+        InventoryService.create_ledger_entries(self.tenant, [self.movement(self.bread, quantity_in=Decimal('4'))])
+        
+        stock_balance = StockBalance.objects.get(location=self.shop, product=self.bread)
+        self.assertEqual((stock_balance.quantity_on_hand, stock_balance.average_cost), (Decimal('8'), Decimal('5')))
+    
+    def test_movements_of_several_products_post_together(self):
+        InventoryService.create_ledger_entries(self.tenant, [
+            self.movement(self.bread, quantity_in=Decimal('3'), unit_cost=Decimal('1')),
+            self.movement(self.milk, quantity_in=Decimal('2'), unit_cost=Decimal('7')),
+        ])
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('3'))
+        self.assertEqual(self.on_hand(self.milk), Decimal('2'))
+        self.assertEqual(StockBalance.objects.get(product=self.milk).average_cost, Decimal('7'))
+    
+    def test_overdrawing_movement_posts_nothing(self):
+        self.receive(self.bread, '2')
+        
+        with self.assertRaises(ValueError):
+            InventoryService.create_ledger_entries(self.tenant, [
+                self.movement(self.milk, quantity_in=Decimal('1'), unit_cost=Decimal('1')),
+                self.movement(self.bread, quantity_out=Decimal('3')),
+            ])
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('2'))
+        self.assertFalse(InventoryLedger.objects.filter(product=self.milk).exists())
+
+
+class ProductImportTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Tenant.objects.create(name='Other', slug='other')
+        self.theirs = Product.objects.create(tenant=self.other, name='Theirs', sku='THEIRS', barcode='TB')
+    
+    def run_import(self, text):
+        return import_products(self.tenant.id, io.StringIO(text))
+    
+    def test_existing_rows_are_updated_and_new_ones_inserted(self):
+        result = self.run_import(
+            'sku,name,barcode,category_code,category_name\n'
+            'BREAD,Brown bread,BB,BAKERY,Bakery\n'
+            'ROLL,Roll,,BAKERY,\n'
+        )
+        
+        self.assertEqual((result.created_count, result.updated_count, result.error_count), (1, 1, 0))
+        self.assertEqual(result.categories_created, 1)
+        bread = Product.objects.get(id=self.bread.id)
+        self.assertEqual((bread.name, bread.barcode, bread.category.code), ('Brown bread', 'BB', 'BAKERY'))
+        roll = Product.objects.get(sku='ROLL')
+        self.assertEqual((roll.tenant_id, roll.category_id), (self.tenant.id, bread.category_id))
+    
+    def test_only_the_columns_given_are_written(self):
+        self.run_import('sku,barcode\nMILK,MB\n')
+        
+        milk = Product.objects.get(id=self.milk.id)
+        self.assertEqual((milk.name, milk.barcode), ('Milk', 'MB'))
+    
+    def test_other_tenants_products_are_never_changed(self):
+        result = self.run_import('sku,name,barcode\nTHEIRS,Mine,\nROLL,Roll,TB\n')
+        
+        self.assertEqual((result.created_count, result.updated_count), (0, 0))
+        self.assertEqual([error['error'] for error in result.errors], [
+            'sku THEIRS is used by another tenant',
+            'barcode TB is already in use',
+        ])
+        theirs = Product.objects.get(id=self.theirs.id)
+        self.assertEqual((theirs.tenant_id, theirs.name, theirs.barcode), (self.other.id, 'Theirs', 'TB'))
+        self.assertFalse(Product.objects.filter(sku='ROLL').exists())
+    
+    def test_sku_taken_by_another_tenant_during_the_import_is_left_alone(self):
+        write = catalog_import._write
+        
+        def racing_write(*args):
+            Product.objects.create(tenant=self.other, name='Raced', sku='ROLL')
+            return write(*args)
+        
+        with mock.patch.object(catalog_import, '_write', racing_write):
+            result = self.run_import('sku,name\nROLL,Roll\nBUN,Bun\n')
+        
+        self.assertEqual(result.created_count, 1)
+        self.assertEqual(result.errors, [{'line': 2, 'error': 'sku ROLL or its barcode was taken meanwhile'}])
+        roll = Product.objects.get(sku='ROLL')
+        self.assertEqual((roll.tenant_id, roll.name), (self.other.id, 'Raced'))
+    
+    def test_categories_created_meanwhile_are_not_counted(self):
+        bulk_create = ProductCategory.objects.bulk_create
+        
+        def racing_bulk_create(categories, **kwargs):
+            ProductCategory.objects.create(tenant=self.tenant, code='DAIRY', name='Dairy')
+            return bulk_create(categories, **kwargs)
+        
+        with mock.patch.object(ProductCategory.objects, 'bulk_create', racing_bulk_create):
+            result = self.run_import(
+                'sku,name,category_code,category_name\nBREAD,Bread,BAKERY,Bakery\nMILK,Milk,DAIRY,Dairy\n'
+            )
+        
+        self.assertEqual((result.updated_count, result.categories_created), (2, 1))
+        self.assertEqual(ProductCategory.objects.filter(code='DAIRY').count(), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductImportViewTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Tenant.objects.create(name='Other', slug='other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_imports_go_into_the_users_catalog(self):
+        response = self.client.post('/api/inventory/product-imports/', {
+            'tenant': str(self.other.id),
+            'file': SimpleUploadedFile('catalog.csv', b'sku,name\nROLL,Roll\n', content_type='text/csv'),
+        })
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ProductImport.objects.get(id=response.data['id']).tenant_id, self.tenant.id)
+    
+    def test_other_tenants_imports_are_hidden(self):
+        ProductImport.objects.create(
+            tenant=self.other, file=SimpleUploadedFile('catalog.csv', b'sku,name\n', content_type='text/csv')
+        )
+        
+        response = self.client.get('/api/inventory/product-imports/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
@@ -1,16 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    ProductCategoryViewSet, ProductViewSet, BatchViewSet,
-    InventoryLedgerViewSet, StockBalanceViewSet, ExpiryAlertViewSet
+    ProductCategoryViewSet, ProductViewSet, ProductImportViewSet, BatchViewSet,
+    InventoryLedgerViewSet, StockBalanceViewSet, ReorderPointViewSet, StockCountViewSet,
+    ExpiryAlertViewSet
 )
 
 router = DefaultRouter()
 router.register(r'categories', ProductCategoryViewSet, basename='category')
 router.register(r'products', ProductViewSet, basename='product')
+router.register(r'product-imports', ProductImportViewSet, basename='product-import')
 router.register(r'batches', BatchViewSet, basename='batch')
 router.register(r'ledger', InventoryLedgerViewSet, basename='ledger')
 router.register(r'stock-balances', StockBalanceViewSet, basename='stock-balance')
+router.register(r'reorder-points', ReorderPointViewSet, basename='reorder-point')
+router.register(r'stock-counts', StockCountViewSet, basename='stock-count')
 router.register(r'expiry-alerts', ExpiryAlertViewSet, basename='expiry-alert')
 
 app_name = 'inventory'
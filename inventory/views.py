@@ -1,22 +1,33 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Q, Sum, F
+from django.utils import timezone
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 from .models import (
     ProductCategory, Product, Batch, InventoryLedger,
-    StockBalance, ExpiryAlert
+    StockBalance, ReorderPoint, StockCheckpoint, StockCount, ProductImport, ExpiryAlert
 )
 from .serializers import (
     ProductCategorySerializer, ProductSerializer, BatchSerializer,
-    InventoryLedgerSerializer, StockBalanceSerializer, ExpiryAlertSerializer
+    InventoryLedgerSerializer, StockBalanceSerializer, ExpiryAlertSerializer,
+    StockCheckpointSerializer, StockAsOfRequestSerializer, ReorderPointSerializer,
+    StockCountSerializer, CountVarianceSerializer, ProductImportSerializer
 )
-from .services import InventoryService
+from .services import InventoryService, ReorderService
+from .replay import balances_as_of, latest_checkpoint_at
+from .archive import archived_between
+from .catalog_import import schedule_import
+from .search import search_products
+from .counts import (
+    count_variances, import_count_lines, new_count_number, parse_rows, reconcile_count, upload_format
+)
+from core.models import Location
 from core.permissions import IsTenantMember, IsProductionManager, IsStoresManager, IsShopManager
 from core.validators import InventoryValidator
-from notifications.services import NotificationService
 
 
 class ProductCategoryViewSet(viewsets.ModelViewSet):
@@ -67,6 +78,45 @@ class ProductViewSet(viewsets.ModelViewSet):
         queryset = queryset.select_related('location', 'batch', 'created_by').order_by('-created_at')
         serializer = InventoryLedgerSerializer(queryset, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Typeahead search for the till: exact sku/barcode hits, then name
+        prefix matches, as lean rows of the fields the till needs
+        """
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = int(request.query_params.get('limit') or 0)
+        except ValueError:
+            return Response({'error': 'limit must be a whole number'}, status=status.HTTP_400_BAD_REQUEST)
+        if not query:
+            return Response([])
+        return Response(search_products(request.user.tenant_id, query, limit=max(limit, 0)))
+
+
+class ProductImportViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for bulk product catalog imports
+    
+    POST a CSV as the multipart field 'file'; it is imported in the
+    background. GET the import to follow its progress and row errors.
+    """
+    serializer_class = ProductImportSerializer
+    permission_classes = [permissions.IsAuthenticated, IsTenantMember]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['status']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        # Imports name skus and row errors, so only the user's tenant is visible
+        return ProductImport.objects.filter(tenant_id=self.request.user.tenant_id).select_related('tenant', 'created_by')
+    
+    def perform_create(self, serializer):
+        # Always into the user's own catalog
+        product_import = serializer.save(tenant=self.request.user.tenant, created_by=self.request.user)
+        schedule_import(product_import)
 
 
 class BatchViewSet(viewsets.ModelViewSet):
@@ -101,7 +151,7 @@ class InventoryLedgerViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = InventoryLedgerSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['tenant', 'location', 'product', 'batch', 'transaction_type', 'reference_type']
+    filterset_fields = ['tenant', 'location', 'product', 'batch', 'transaction_type', 'reference_type', 'reference_id']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
 
@@ -121,24 +171,21 @@ class StockBalanceViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
-        """Get products with low stock (configurable threshold)"""
-        threshold = Decimal(request.query_params.get('threshold', '10'))
+        """
+        Products at or below their reorder point
+        
+        Reads the index kept by ReorderService as stock moves; alerts are
+        sent when a product crosses its reorder point, not from here.
+        """
         location_id = request.query_params.get('location_id')
         
-        queryset = self.queryset.filter(quantity_on_hand__lt=threshold)
+        queryset = ReorderPoint.objects.filter(
+            tenant_id=request.user.tenant_id, is_below=True, is_active=True
+        ).select_related('location', 'product')
         if location_id:
             queryset = queryset.filter(location_id=location_id)
         
-        # Send notifications for low stock items
-        for balance in queryset:
-            NotificationService.notify_low_stock(
-                balance.location,
-                balance.product,
-                balance.quantity_on_hand,
-                threshold
-            )
-        
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = ReorderPointSerializer(queryset, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -152,6 +199,187 @@ class StockBalanceViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(balances, many=True)
         return Response(serializer.data)
 
+    
+    @action(detail=False, methods=['get'])
+    def as_of(self, request):
+        """
+        Stock balances and valuation of a location at a past date or instant
+        
+        Replays only the ledger since the nearest stock checkpoint.
+        """
+        serializer = StockAsOfRequestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        location = Location.objects.filter(id=data['location_id'], tenant_id=request.user.tenant_id).first()
+        if location is None:
+            return Response({'error': 'Location not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if 'date' in data:
+            at = timezone.make_aware(datetime.combine(data['date'] + timedelta(days=1), time.min))
+        else:
+            at = data['at']
+        
+        if archived_between(location.tenant_id, latest_checkpoint_at(location.id, at), at):
+            return Response(
+                {'error': 'Part of the ledger needed for this date is archived; restore it first'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        balances = {
+            key: balance for key, balance in balances_as_of(location.id, at).items()
+            if not balance.is_empty
+        }
+        products = Product.objects.in_bulk({product_id for product_id, _ in balances})
+        batches = Batch.objects.in_bulk({batch_id for _, batch_id in balances if batch_id})
+        rows = [
+            StockCheckpoint(
+                location=location,
+                product=products[product_id],
+                batch=batches.get(batch_id),
+                taken_at=at,
+                quantity_on_hand=balance.quantity_on_hand,
+                quantity_reserved=balance.quantity_reserved,
+                quantity_in_transit=balance.quantity_in_transit,
+                quantity_damaged=balance.quantity_damaged,
+                average_cost=balance.average_cost,
+                stock_value=balance.stock_value,
+                last_transaction_at=balance.last_transaction_at,
+            )
+            for (product_id, batch_id), balance in balances.items()
+        ]
+        rows.sort(key=lambda row: (row.product.name, row.batch.batch_number if row.batch else ''))
+        
+        return Response({
+            'location': location.id,
+            'as_of': at,
+            'total_value': sum((row.stock_value for row in rows), Decimal('0')),
+            'balances': StockCheckpointSerializer(rows, many=True).data,
+        })
+
+
+class ReorderPointViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for managing reorder points
+    """
+    queryset = ReorderPoint.objects.select_related('tenant', 'location', 'product').all()
+    serializer_class = ReorderPointSerializer
+    permission_classes = [permissions.IsAuthenticated, IsTenantMember]
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filterset_fields = ['tenant', 'location', 'product', 'is_below', 'is_active']
+    search_fields = ['product__name', 'product__sku']
+    ordering_fields = ['product__name', 'quantity_on_hand', 'below_since']
+    ordering = ['product__name']
+    
+    def perform_create(self, serializer):
+        point = serializer.save()
+        ReorderService.refresh([point])
+        point.refresh_from_db()
+    
+    def perform_update(self, serializer):
+        point = serializer.save()
+        ReorderService.refresh([point])
+        point.refresh_from_db()
+
+
+class StockCountViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for stock counts: upload counted lines, review variances, reconcile
+    """
+    queryset = StockCount.objects.select_related('tenant', 'location', 'created_by', 'reconciled_by').all()
+    serializer_class = StockCountSerializer
+    permission_classes = [permissions.IsAuthenticated, IsTenantMember]
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filterset_fields = ['tenant', 'location', 'state', 'is_full_count']
+    search_fields = ['count_number', 'notes']
+    ordering_fields = ['created_at', 'reconciled_at']
+    ordering = ['-created_at']
+    
+    def perform_create(self, serializer):
+        serializer.save(count_number=new_count_number(), created_by=self.request.user)
+    
+    @action(detail=True, methods=['post'])
+    def upload(self, request, pk=None):
+        """
+        Add counted lines from a CSV or NDJSON file
+        
+        Send the file as the request body (Content-Type text/csv or
+        application/x-ndjson) or as the multipart field 'file'. Columns:
+        sku, barcode or product_id; optional batch_number; quantity; optional
+        damaged_quantity. The body is parsed and stored in chunks as it is
+        read. Bad lines are reported and skipped.
+        """
+        count = self.get_object()
+        if count.state != 'open':
+            return Response({'error': f'Cannot add lines to a stock count in state: {count.state}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+            lines, fmt = upload, upload_format(upload.content_type, upload.name)
+        else:
+            lines, fmt = request.stream, upload_format(request.content_type)
+        if lines is None:
+            return Response({'error': 'Upload is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        imported, error_count, errors = import_count_lines(count, parse_rows(lines, fmt), counted_by=request.user)
+        return Response({'imported': imported, 'error_count': error_count, 'errors': errors})
+    
+    @action(detail=True, methods=['get'])
+    def variances(self, request, pk=None):
+        """
+        Differences between the counted and recorded stock, before reconciling
+        """
+        count = self.get_object()
+        if count.state != 'open':
+            return Response({'error': f'Stock count is {count.state}; see its ledger entries'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        variances = count_variances(count, StockBalance.objects.filter(location_id=count.location_id))
+        products = Product.objects.in_bulk({v.product_id for v in variances})
+        batches = Batch.objects.in_bulk({v.batch_id for v in variances if v.batch_id})
+        serializer = CountVarianceSerializer([
+            {
+                'product_id': v.product_id,
+                'product_sku': products[v.product_id].sku,
+                'product_name': products[v.product_id].name,
+                'batch_id': v.batch_id,
+                'batch_number': batches[v.batch_id].batch_number if v.batch_id else None,
+                'expected': v.expected,
+                'counted': v.counted,
+                'damaged': v.damaged,
+                'variance': v.variance,
+                'variance_value': v.variance_value,
+            }
+            for v in variances
+        ], many=True)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def reconcile(self, request, pk=None):
+        """Post the count's variances to the ledger as adjustment and damage entries"""
+        count = self.get_object()
+        try:
+            reconcile_count(count, request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        count = StockCount.objects.select_related('location', 'created_by', 'reconciled_by').get(id=count.id)
+        return Response(self.get_serializer(count).data)
+    
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel an open stock count"""
+        count = self.get_object()
+        if count.state != 'open':
+            return Response({'error': f'Cannot cancel stock count in state: {count.state}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        count.cancel()
+        count.save()
+        return Response(self.get_serializer(count).data)
+
 
 class ExpiryAlertViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Notification, NotificationLog, NotificationTemplate
+from .models import Notification, NotificationLog, NotificationTemplate, NotificationOutbox
+from .models import NotificationReceipt, UnreadNotificationCounter
 
 
 @admin.register(Notification)
@@ -12,6 +13,22 @@ class NotificationAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
 
 
+@admin.register(NotificationReceipt)
+class NotificationReceiptAdmin(admin.ModelAdmin):
+    list_display = ['notification', 'user', 'read_at']
+    search_fields = ['notification__title', 'user__username']
+    readonly_fields = ['id']
+    raw_id_fields = ['notification', 'user']
+
+
+@admin.register(UnreadNotificationCounter)
+class UnreadNotificationCounterAdmin(admin.ModelAdmin):
+    list_display = ['user', 'tenant', 'unread_count', 'reconciled_at']
+    search_fields = ['user__username']
+    readonly_fields = ['id', 'reconciled_at']
+    raw_id_fields = ['tenant', 'user']
+
+
 @admin.register(NotificationLog)
 class NotificationLogAdmin(admin.ModelAdmin):
     list_display = ['notification', 'channel', 'recipient', 'status', 'sent_at', 'delivered_at', 'created_at']
@@ -30,3 +47,12 @@ class NotificationTemplateAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at', 'updated_at']
     raw_id_fields = ['tenant']
 
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['title', 'tenant', 'user', 'notification_type', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status', 'notification_type', 'created_at']
+    search_fields = ['title', 'last_error']
+    readonly_fields = ['id', 'created_at', 'delivered_at']
+    raw_id_fields = ['tenant', 'user']
+    date_hierarchy = 'created_at'
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:45
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('notification_type', models.CharField(choices=[('transfer', 'Transfer'), ('dispute', 'Dispute'), ('low_stock', 'Low Stock'), ('margin_violation', 'Margin Violation'), ('cash_remittance', 'Cash Remittance'), ('return_request', 'Return Request'), ('expiry_alert', 'Expiry Alert'), ('system', 'System')], max_length=50)),
+                ('channels', models.JSONField(default=list)),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('reference_type', models.CharField(blank=True, max_length=50)),
+                ('reference_id', models.UUIDField(blank=True, null=True)),
+                ('priority', models.CharField(default='normal', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_outbox', to='core.tenant')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notification_outbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'notification_outbox',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='notificatio_status_7f28bd_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:53
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('notifications', '0004_notification_coalescing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadNotificationCounter',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_notification_counters', to='core.tenant')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='unread_notification_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'unread_notification_counters',
+                'indexes': [models.Index(fields=['tenant'], name='unread_noti_tenant__6c9d53_idx')],
+            },
+        ),
+    ]
@@ -26,7 +26,7 @@ class Notification(models.Model):
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='notifications')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
     
-    # If user is None, this is a broadcast notification
+    # If user is None, this is a broadcast notification; read state is per user in NotificationReceipt
     notification_type = models.CharField(max_length=50, choices=NotificationType.choices)
     channel = models.CharField(max_length=20, choices=NotificationChannel.choices, default=NotificationChannel.IN_APP)
     
@@ -48,6 +48,11 @@ class Notification(models.Model):
         default='normal'
     )
     
+    # Repeats of the same alert (same coalesce_key) within the coalescing window
+    coalesce_key = models.CharField(max_length=255, blank=True)
+    occurrence_count = models.PositiveIntegerField(default=1)
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -57,12 +62,48 @@ class Notification(models.Model):
             models.Index(fields=['tenant', 'user', 'is_read']),
             models.Index(fields=['notification_type', 'reference_type', 'reference_id']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['tenant', 'coalesce_key', 'created_at']),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username if self.user else 'Broadcast'}"
 
 
+class NotificationReceipt(models.Model):
+    """Per-user read state of a broadcast notification"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='receipts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_receipts')
+    
+    read_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'notification_receipts'
+        unique_together = [['notification', 'user']]
+    
+    def __str__(self):
+        return f"{self.notification.title} - {self.user.username}"
+
+
+class UnreadNotificationCounter(models.Model):
+    """Maintained count of unread notifications per user"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='unread_notification_counters')
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='unread_notification_counter')
+    
+    unread_count = models.IntegerField(default=0)
+    reconciled_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'unread_notification_counters'
+        indexes = [
+            models.Index(fields=['tenant']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.unread_count}"
+
+
 class NotificationLog(models.Model):
     """Log of notification delivery attempts"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -131,3 +172,50 @@ class NotificationTemplate(models.Model):
     def __str__(self):
         return f"{self.name} ({self.notification_type} - {self.channel})"
 
+
+class NotificationOutbox(models.Model):
+    """Notifications queued in the sender's transaction, delivered by workers"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='notification_outbox')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_outbox', null=True, blank=True)
+    
+    notification_type = models.CharField(max_length=50, choices=NotificationType.choices)
+    channels = models.JSONField(default=list)
+    
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    
+    reference_type = models.CharField(max_length=50, blank=True)
+    reference_id = models.UUIDField(null=True, blank=True)
+    priority = models.CharField(max_length=20, default='normal')
+    coalesce_key = models.CharField(max_length=255, blank=True)
+    occurrence_count = models.PositiveIntegerField(default=1)
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
+    
+    # Delivery state
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('delivered', 'Delivered'),
+            ('failed', 'Failed')
+        ],
+        default='pending'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'notification_outbox'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['tenant', 'coalesce_key', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} - {self.status}"
@@ -0,0 +1,182 @@
+"""
+Publish/subscribe layer waking notification streams
+
+Messages are only wake-up hints: a stream that receives one re-reads the
+database for what is new. With NOTIFICATION_PUBSUB_URL set, hints travel
+through Redis so deliveries made by Celery workers reach every ASGI server;
+otherwise they stay inside this process and streams also re-check the
+database every NOTIFICATION_STREAM_POLL_INTERVAL seconds.
+"""
+import asyncio
+import json
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id):
+    """Channel of notifications addressed to one user"""
+    return f'notifications:user:{user_id}'
+
+
+def tenant_channel(tenant_id):
+    """Channel of broadcasts to a tenant"""
+    return f'notifications:tenant:{tenant_id}'
+
+
+class InProcessBroker:
+    """
+    Broker delivering hints to streams served by this process
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+    
+    def publish(self, channel, message):
+        """
+        Wake every local subscriber of a channel; safe to call from any thread
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, event in subscribers:
+            loop.call_soon_threadsafe(event.set)
+    
+    def subscribe(self, channels):
+        """
+        Async context manager waiting for hints on the given channels
+        """
+        return InProcessSubscription(self, channels)
+    
+    def _add(self, channels, subscriber):
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscriber)
+    
+    def _remove(self, channels, subscriber):
+        with self._lock:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class InProcessSubscription:
+    """
+    Subscription to an InProcessBroker
+    """
+    
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = list(channels)
+        self._event = asyncio.Event()
+        self._subscriber = None
+    
+    async def __aenter__(self):
+        self._subscriber = (asyncio.get_running_loop(), self._event)
+        self.broker._add(self.channels, self._subscriber)
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.broker._remove(self.channels, self._subscriber)
+    
+    async def wait(self, timeout):
+        """
+        Wait for a hint; returns False when the timeout passed without one
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+
+class RedisBroker:
+    """
+    Broker relaying hints through Redis pub/sub
+    """
+    
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+    
+    def publish(self, channel, message):
+        """
+        Publish a hint to every subscriber of a channel
+        """
+        import redis
+        
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+        self._client.publish(channel, json.dumps(message))
+    
+    def subscribe(self, channels):
+        """
+        Async context manager waiting for hints on the given channels
+        """
+        return RedisSubscription(self.url, channels)
+
+
+class RedisSubscription:
+    """
+    Subscription to a RedisBroker
+    """
+    
+    def __init__(self, url, channels):
+        self.url = url
+        self.channels = list(channels)
+        self._client = None
+        self._pubsub = None
+    
+    async def __aenter__(self):
+        import redis.asyncio
+        
+        self._client = redis.asyncio.Redis.from_url(self.url)
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.subscribe(*self.channels)
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        try:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+        finally:
+            await self._client.aclose()
+    
+    async def wait(self, timeout):
+        """
+        Wait for a hint; returns False when the timeout passed without one
+        """
+        message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return message is not None
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    Broker selected by NOTIFICATION_PUBSUB_URL, created once per process
+    """
+    global _broker
+    if _broker is None:
+        if settings.NOTIFICATION_PUBSUB_URL:
+            _broker = RedisBroker(settings.NOTIFICATION_PUBSUB_URL)
+        else:
+            _broker = InProcessBroker()
+    return _broker
+
+
+def publish(channel, message):
+    """
+    Publish a hint, never failing the caller
+    """
+    try:
+        get_broker().publish(channel, message)
+    except Exception as e:
+        logger.warning("Could not publish notification hint: %s", e)
@@ -13,8 +13,17 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = ['id', 'tenant', 'user', 'user_username', 'notification_type',
                   'notification_type_display', 'channel', 'channel_display',
                   'title', 'message', 'reference_type', 'reference_id',
-                  'is_read', 'read_at', 'priority', 'priority_display', 'created_at']
-        read_only_fields = ['id', 'created_at']
+                  'is_read', 'read_at', 'priority', 'priority_display',
+                  'occurrence_count', 'last_occurred_at', 'created_at']
+        read_only_fields = ['id', 'occurrence_count', 'last_occurred_at', 'created_at']
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Read state of the requesting user, broadcasts included
+        if hasattr(instance, 'user_is_read'):
+            data['is_read'] = instance.user_is_read
+            data['read_at'] = self.fields['read_at'].to_representation(instance.user_read_at) if instance.user_read_at else None
+        return data
 
 
 class NotificationLogSerializer(serializers.ModelSerializer):
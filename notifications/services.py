@@ -1,10 +1,17 @@
 """
 Notification service for sending notifications
 """
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import get_connection, send_mail
 from django.db import transaction
+from django.db.models import BooleanField, Case, Exists, F, OuterRef, Q, Subquery, When
 from django.utils import timezone
-from .models import Notification, NotificationLog, NotificationTemplate
+from .models import Notification, NotificationLog, NotificationTemplate, NotificationOutbox
+from .models import NotificationReceipt, UnreadNotificationCounter
 from .models import NotificationChannel, NotificationType
+from . import pubsub
 from core.models import User, Tenant
 from inventory.models import StockBalance, ExpiryAlert
 from transfers.models import Transfer, Dispute
@@ -12,6 +19,8 @@ from sales.models import Sale
 from accounting.models import CashUpReport, Remittance
 from decimal import Decimal
 
+logger = logging.getLogger(__name__)
+
 
 class NotificationService:
     """
@@ -41,137 +50,457 @@ class NotificationService:
         reference_type=None,
         reference_id=None,
         priority='normal',
-        channels=None
+        channels=None,
+        coalesce_key='',
+        coalesce_window=None
     ):
         """
-        Send notification to user(s)
+        Queue notification to user(s)
+        
+        The notification is written to the outbox in the caller's transaction
+        and delivered by a worker after commit, so it is never sent for work
+        that was rolled back and the caller never waits on delivery.
+        Alerts that repeat (low stock, margin violations, expiry) pass a
+        ``coalesce_key`` naming the event, e.g. the product and location; a
+        repeat with the same key within ``coalesce_window`` seconds
+        (NOTIFICATION_COALESCE_WINDOW by default, 0 disables) only bumps the
+        occurrence count of the earlier one, and None is returned.
+        Notifications without a key are never merged.
         """
         if channels is None:
             channels = [NotificationChannel.IN_APP]
         
-        notifications = []
+        if coalesce_window is None:
+            coalesce_window = settings.NOTIFICATION_COALESCE_WINDOW
+        if coalesce_key and coalesce_window:
+            if NotificationService._coalesce(
+                tenant, notification_type, coalesce_key, user, title, message, coalesce_window
+            ):
+                return None
         
-        if user:
-            # Send to specific user
-            recipients = [user]
-        else:
-            # Broadcast to all tenant users
-            recipients = User.objects.filter(tenant=tenant, is_active=True)
+        entry = NotificationOutbox.objects.create(
+            tenant=tenant,
+            user=user,
+            notification_type=notification_type,
+            channels=list(channels),
+            title=title,
+            message=message,
+            reference_type=reference_type or '',
+            reference_id=reference_id,
+            priority=priority,
+            coalesce_key=coalesce_key,
+            next_attempt_at=timezone.now()
+        )
+        transaction.on_commit(NotificationService._schedule_delivery)
+        return entry
+    
+    @staticmethod
+    def _coalesce(tenant, notification_type, coalesce_key, user, title, message, window):
+        """
+        Fold a repeated alert into the one already queued or sent in the window
         
-        for recipient in recipients:
-            for channel in channels:
-                # Get template
-                template = NotificationService.get_template(tenant, notification_type, channel)
-                
-                if template:
-                    # Use template
-                    final_title = template.title_template.format(
-                        title=title,
-                        **locals()
-                    )
-                    final_message = template.message_template.format(
-                        message=message,
-                        **locals()
+        Returns True when an earlier notification absorbed it.
+        """
+        now = timezone.now()
+        key = {
+            'tenant': tenant,
+            'notification_type': notification_type,
+            'coalesce_key': coalesce_key,
+            'user': user,
+            'created_at__gte': now - timedelta(seconds=window),
+        }
+        
+        # Still undelivered: carry the latest wording
+        if NotificationOutbox.objects.filter(status='pending', **key).update(
+            occurrence_count=F('occurrence_count') + 1,
+            last_occurred_at=now,
+            title=title,
+            message=message
+        ):
+            return True
+        
+        return Notification.objects.filter(**key).update(
+            occurrence_count=F('occurrence_count') + 1,
+            last_occurred_at=now
+        ) > 0
+    
+    @staticmethod
+    def _schedule_delivery():
+        """
+        Wake a worker to drain the outbox
+        """
+        from .tasks import drain_notification_outbox
+        
+        try:
+            drain_notification_outbox.apply_async(retry=False)
+        except Exception as e:
+            # The periodic sweep delivers it instead
+            logger.warning("Could not queue notification delivery: %s", e)
+    
+    @staticmethod
+    def process_outbox(batch_size):
+        """
+        Deliver one batch of due outbox entries
+        
+        Due entries are claimed in a short transaction of their own (locked
+        entries are skipped): their next attempt is pushed
+        NOTIFICATION_OUTBOX_CLAIM_TIMEOUT seconds ahead, so other workers
+        leave them alone and they come due again should this worker die.
+        Each entry is then sent outside any transaction, so a slow mail
+        server holds no locks, and its outcome is recorded in a transaction
+        of its own. A failed entry is retried with exponential backoff; on
+        its last attempt channel errors are only logged so the in-app
+        notification still goes out.
+        Returns the number of entries processed.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            entries = list(
+                NotificationOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('tenant', 'user')
+                .filter(status='pending', next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:batch_size]
+            )
+            for entry in entries:
+                entry.attempts += 1
+                entry.next_attempt_at = now + timedelta(seconds=settings.NOTIFICATION_OUTBOX_CLAIM_TIMEOUT)
+            NotificationOutbox.objects.bulk_update(entries, ['attempts', 'next_attempt_at'])
+        
+        for entry in entries:
+            final_attempt = entry.attempts >= settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+            try:
+                NotificationService.deliver(entry, raise_errors=not final_attempt)
+            except Exception as e:
+                NotificationOutbox.objects.filter(id=entry.id).update(
+                    status='failed' if final_attempt else 'pending',
+                    last_error=str(e),
+                    next_attempt_at=timezone.now() + timedelta(
+                        seconds=settings.NOTIFICATION_OUTBOX_RETRY_DELAY * 2 ** (entry.attempts - 1)
                     )
-                else:
-                    # Use provided title/message
-                    final_title = title
-                    final_message = message
-                
-                # Create notification
-                notification = Notification.objects.create(
-                    tenant=tenant,
-                    user=recipient if user else None,
-                    notification_type=notification_type,
-                    channel=channel,
-                    title=final_title,
-                    message=final_message,
-                    reference_type=reference_type,
-                    reference_id=reference_id,
-                    priority=priority
                 )
-                
-                # Send via channel
-                NotificationService._send_via_channel(notification, channel)
-                notifications.append(notification)
-        
-        return notifications
+        return len(entries)
     
     @staticmethod
-    def _send_via_channel(notification, channel):
+    def deliver(entry, raise_errors=True):
         """
-        Send notification via specific channel
+        Send the notifications of an outbox entry on each channel, then store them
+        
+        Emails and SMS go out first, outside any transaction; the
+        notifications, their delivery logs and the entry's delivered state
+        are then written together in one short transaction. A failure while
+        sending stores nothing, so a retry creates no duplicates.
+        A broadcast (no user) is stored once per channel and read by every
+        tenant user, with per-user read state kept in NotificationReceipt.
+        Recipients are only looked up to send broadcast emails and SMS.
         """
-        if channel == NotificationChannel.IN_APP:
-            # In-app notifications are automatically available
-            log = NotificationLog.objects.create(
-                notification=notification,
-                channel=channel,
-                recipient=notification.user.username if notification.user else 'broadcast',
-                status='delivered'
+        templates = {}
+        for template in NotificationTemplate.objects.filter(
+            tenant_id=entry.tenant_id,
+            notification_type=entry.notification_type,
+            channel__in=entry.channels,
+            is_active=True
+        ):
+            templates.setdefault(template.channel, template)
+        
+        notifications = []
+        for channel in entry.channels:
+            final_title, final_message = NotificationService._render(
+                templates.get(channel), entry, entry.user, channel
             )
-            log.delivered_at = timezone.now()
-            log.save()
+            notifications.append(Notification(
+                tenant_id=entry.tenant_id,
+                user=entry.user,
+                notification_type=entry.notification_type,
+                channel=channel,
+                title=final_title,
+                message=final_message,
+                reference_type=entry.reference_type,
+                reference_id=entry.reference_id,
+                priority=entry.priority,
+                coalesce_key=entry.coalesce_key
+            ))
+        
+        # Send via channel
+        logs = []
+        recipients = None
+        mail_connection = None
+        for notification in notifications:
+            if notification.channel == NotificationChannel.IN_APP:
+                # In-app notifications are automatically available
+                logs.append(NotificationLog(
+                    notification=notification,
+                    channel=notification.channel,
+                    recipient=entry.user.username if entry.user_id else 'broadcast',
+                    status='delivered',
+                    delivered_at=timezone.now()
+                ))
+                continue
+            
+            if recipients is None:
+                if entry.user_id:
+                    recipients = [entry.user]
+                else:
+                    recipients = list(User.objects.filter(tenant_id=entry.tenant_id, is_active=True))
+            
+            if notification.channel == NotificationChannel.EMAIL:
+                # Email sending logic, one backend connection per delivery
+                if mail_connection is None:
+                    try:
+                        mail_connection = get_connection()
+                    except Exception:
+                        if raise_errors:
+                            raise
+                for recipient in recipients:
+                    log = NotificationService._send_email(notification, recipient, mail_connection, raise_errors)
+                    if log:
+                        logs.append(log)
+            elif notification.channel == NotificationChannel.SMS:
+                # SMS sending logic (integrate with SMS provider)
+                for recipient in recipients:
+                    logs.append(NotificationService._send_sms(notification, recipient))
         
-        elif channel == NotificationChannel.EMAIL:
-            # Email sending logic (integrate with email backend)
-            NotificationService._send_email(notification)
+        with transaction.atomic():
+            # Repeats coalesced into the entry while it was being sent
+            occurrence_count, last_occurred_at = NotificationOutbox.objects.select_for_update().values_list(
+                'occurrence_count', 'last_occurred_at'
+            ).get(id=entry.id)
+            for notification in notifications:
+                notification.occurrence_count = occurrence_count
+                notification.last_occurred_at = last_occurred_at
+            Notification.objects.bulk_create(notifications)
+            NotificationLog.objects.bulk_create(logs)
+            NotificationService._adjust_unread_counts(entry.tenant_id, entry.user_id, len(notifications))
+            NotificationOutbox.objects.filter(id=entry.id).update(status='delivered', delivered_at=timezone.now())
+            
+            # Wake the recipients' notification streams
+            if entry.user_id:
+                channel = pubsub.user_channel(entry.user_id)
+            else:
+                channel = pubsub.tenant_channel(entry.tenant_id)
+            transaction.on_commit(lambda: pubsub.publish(channel, {'type': 'notification'}))
         
-        elif channel == NotificationChannel.SMS:
-            # SMS sending logic (integrate with SMS provider)
-            NotificationService._send_sms(notification)
+        return notifications
     
     @staticmethod
-    def _send_email(notification):
+    def _render(template, entry, recipient, channel):
         """
-        Send email notification
+        Title and message of a notification, from the template if there is one
         """
-        from django.core.mail import send_mail
-        from django.conf import settings
+        if not template:
+            return entry.title, entry.message
         
-        if not notification.user or not notification.user.email:
-            return
+        context = {
+            'title': entry.title,
+            'message': entry.message,
+            'recipient': recipient,
+            'channel': channel,
+            'priority': entry.priority,
+            'reference_type': entry.reference_type,
+            'reference_id': entry.reference_id,
+        }
+        try:
+            return (
+                template.title_template.format(**context),
+                template.message_template.format(**context)
+            )
+        except (KeyError, IndexError, AttributeError, ValueError):
+            logger.warning("Notification template %s could not be rendered", template.id)
+            return entry.title, entry.message
+    
+    @staticmethod
+    def _send_email(notification, recipient, connection=None, raise_errors=False):
+        """
+        Send email notification; returns its unsaved NotificationLog
+        """
+        if not recipient.email:
+            return None
         
         try:
             send_mail(
                 subject=notification.title,
                 message=notification.message,
                 from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[notification.user.email],
+                recipient_list=[recipient.email],
                 fail_silently=False,
-            )
-            
-            NotificationLog.objects.create(
-                notification=notification,
-                channel=NotificationChannel.EMAIL,
-                recipient=notification.user.email,
-                status='sent',
-                sent_at=timezone.now()
+                connection=connection,
             )
         except Exception as e:
-            NotificationLog.objects.create(
+            if raise_errors:
+                raise
+            return NotificationLog(
                 notification=notification,
                 channel=NotificationChannel.EMAIL,
-                recipient=notification.user.email,
+                recipient=recipient.email,
                 status='failed',
                 error_message=str(e)
             )
+        return NotificationLog(
+            notification=notification,
+            channel=NotificationChannel.EMAIL,
+            recipient=recipient.email,
+            status='sent',
+            sent_at=timezone.now()
+        )
     
     @staticmethod
-    def _send_sms(notification):
+    def _send_sms(notification, recipient):
         """
-        Send SMS notification (placeholder - integrate with SMS provider)
+        Send SMS notification (placeholder - integrate with SMS provider);
+        returns its unsaved NotificationLog
         """
         # This would integrate with your SMS provider
         # For now, just log it
-        NotificationLog.objects.create(
+        return NotificationLog(
             notification=notification,
             channel=NotificationChannel.SMS,
-            recipient=notification.user.phone if notification.user else 'unknown',
+            recipient=recipient.phone or 'unknown',
             status='pending',
             error_message='SMS provider not configured'
         )
     
+    # Read state
+    
+    @staticmethod
+    def visible_to(user):
+        """
+        Notifications addressed to a user or broadcast to their tenant
+        
+        Annotated with the user's own read state as user_is_read/user_read_at:
+        the notification's fields for direct notifications, the user's
+        receipt for broadcasts.
+        """
+        receipts = NotificationReceipt.objects.filter(notification=OuterRef('pk'), user=user)
+        return Notification.objects.filter(
+            tenant_id=user.tenant_id
+        ).filter(
+            Q(user=user) | Q(user__isnull=True)
+        ).annotate(
+            user_is_read=Case(
+                When(user__isnull=False, then=F('is_read')),
+                default=Exists(receipts),
+                output_field=BooleanField()
+            ),
+            user_read_at=Case(
+                When(user__isnull=False, then=F('read_at')),
+                default=Subquery(receipts.values('read_at')[:1])
+            )
+        )
+    
+    @staticmethod
+    def mark_read(notification, user):
+        """
+        Mark a notification as read by a user
+        """
+        if notification.user_id:
+            newly_read = Notification.objects.filter(id=notification.id, is_read=False).update(
+                is_read=True,
+                read_at=timezone.now()
+            ) > 0
+        else:
+            _, newly_read = NotificationReceipt.objects.get_or_create(
+                notification=notification,
+                user=user,
+                defaults={'read_at': timezone.now()}
+            )
+        
+        if newly_read:
+            UnreadNotificationCounter.objects.filter(user=user, unread_count__gt=0).update(
+                unread_count=F('unread_count') - 1
+            )
+    
+    @staticmethod
+    def mark_all_read(user):
+        """
+        Mark every notification visible to a user as read
+        """
+        now = timezone.now()
+        Notification.objects.filter(
+            tenant_id=user.tenant_id,
+            user=user,
+            is_read=False
+        ).update(is_read=True, read_at=now)
+        
+        unread_broadcasts = NotificationService.visible_to(user).filter(
+            user__isnull=True,
+            user_is_read=False
+        ).values_list('id', flat=True)
+        NotificationReceipt.objects.bulk_create(
+            [NotificationReceipt(notification_id=notification_id, user=user, read_at=now)
+             for notification_id in unread_broadcasts],
+            ignore_conflicts=True
+        )
+        UnreadNotificationCounter.objects.filter(user=user).update(unread_count=0)
+    
+    @staticmethod
+    def unread_count(user):
+        """
+        Unread notifications of a user, from the maintained counter
+        
+        The counter is computed and stored on first use, and again after it
+        has been reset.
+        """
+        count = UnreadNotificationCounter.objects.filter(user=user).values_list('unread_count', flat=True).first()
+        if count is None:
+            count = NotificationService.visible_to(user).filter(user_is_read=False).count()
+            UnreadNotificationCounter.objects.bulk_create(
+                [UnreadNotificationCounter(tenant_id=user.tenant_id, user=user, unread_count=count)],
+                ignore_conflicts=True
+            )
+        return count
+    
+    @staticmethod
+    def reset_unread_counts(tenant_id, user_id=None):
+        """
+        Drop counters so they are recomputed on next read
+        
+        Used after changes the counters cannot follow incrementally, such as
+        deleting or editing notifications. Without a user, every counter of
+        the tenant is dropped.
+        """
+        counters = UnreadNotificationCounter.objects.filter(tenant_id=tenant_id)
+        if user_id:
+            counters = counters.filter(user_id=user_id)
+        counters.delete()
+    
+    @staticmethod
+    def reconcile_unread_counts(batch_size=500):
+        """
+        Recompute every stored counter and correct the ones that drifted
+        
+        Returns the number of counters corrected.
+        """
+        corrected = 0
+        counters = UnreadNotificationCounter.objects.select_related('user').order_by('id')
+        last_id = None
+        while True:
+            batch = counters.filter(id__gt=last_id) if last_id else counters
+            batch = list(batch[:batch_size])
+            if not batch:
+                return corrected
+            
+            for counter in batch:
+                actual = NotificationService.visible_to(counter.user).filter(user_is_read=False).count()
+                if actual != counter.unread_count:
+                    # Skipped if the counter moved meanwhile; the next run picks it up
+                    corrected += UnreadNotificationCounter.objects.filter(
+                        id=counter.id,
+                        unread_count=counter.unread_count
+                    ).update(unread_count=actual)
+            UnreadNotificationCounter.objects.filter(
+                id__in=[counter.id for counter in batch]
+            ).update(reconciled_at=timezone.now())
+            last_id = batch[-1].id
+    
+    @staticmethod
+    def _adjust_unread_counts(tenant_id, user_id, delta):
+        """
+        Add newly delivered notifications to the recipients' counters
+        """
+        counters = UnreadNotificationCounter.objects.filter(tenant_id=tenant_id)
+        if user_id:
+            counters = counters.filter(user_id=user_id)
+        counters.update(unread_count=F('unread_count') + delta)
+    
     # Notification triggers
     
     @staticmethod
@@ -210,7 +539,8 @@ class NotificationService:
             message=f'Stock at {location.name} is below threshold. Current: {current_quantity}, Threshold: {threshold}',
             reference_type='product',
             reference_id=product.id,
-            priority='high'
+            priority='high',
+            coalesce_key=f'low_stock:{location.id}:{product.id}'
         )
     
     @staticmethod
@@ -223,7 +553,8 @@ class NotificationService:
             message=f'Price margin ({margin_percent:.2f}%) below required ({required_margin}%) at {shop.name}',
             reference_type='product',
             reference_id=product.id,
-            priority='normal'
+            priority='normal',
+            coalesce_key=f'margin_violation:{shop.id}:{product.id}'
         )
     
     @staticmethod
@@ -262,6 +593,7 @@ class NotificationService:
             message=f'Product expires in {alert.days_until_expiry} days at {alert.location.name}',
             reference_type='expiry_alert',
             reference_id=alert.id,
-            priority='high'
+            priority='high',
+            coalesce_key=f'expiry_alert:{alert.id}'
         )
 
@@ -0,0 +1,138 @@
+"""
+Server-Sent Events stream of notifications, served over ASGI
+"""
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .serializers import NotificationSerializer
+from .services import NotificationService
+from . import pubsub
+
+
+def _authenticate(request):
+    """
+    User from a Bearer token, a ``token`` query parameter or the session
+    
+    EventSource cannot send headers, so browsers pass the access token in
+    the query string.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else request.GET.get('token')
+    if raw_token:
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+def _fetch(user, since, seen_ids):
+    """
+    Notifications not sent yet, and the unread count
+    
+    The scan starts NOTIFICATION_STREAM_OVERLAP_SECONDS before the cursor,
+    so a notification committed after a later-stamped one was streamed is
+    still picked up; the ids already sent in that window are skipped.
+    """
+    notifications = list(
+        NotificationService.visible_to(user)
+        .select_related('user')
+        .filter(created_at__gte=since - timedelta(seconds=settings.NOTIFICATION_STREAM_OVERLAP_SECONDS))
+        .exclude(id__in=seen_ids)
+        .order_by('created_at', 'id')[:settings.NOTIFICATION_STREAM_BATCH_SIZE]
+    )
+    return notifications, NotificationSerializer(notifications, many=True).data, NotificationService.unread_count(user)
+
+
+def _event(event, data, event_id=None):
+    """
+    Encode one SSE event
+    """
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + JSONRenderer().render(data).decode())
+    return '\n'.join(lines) + '\n\n'
+
+
+def _parse_event_id(event_id):
+    """
+    Cursor and notification id from a Last-Event-ID header
+    
+    Only the last id survives a reconnect, so notifications from the
+    overlap window before the cursor may be sent again; clients drop
+    repeats by notification id.
+    """
+    timestamp, _, notification_id = (event_id or '').partition('|')
+    since = parse_datetime(timestamp) if timestamp else None
+    if since is None:
+        return None, set()
+    return since, {notification_id} if notification_id else set()
+
+
+async def _event_stream(user, since, seen_ids):
+    """
+    Yield new notifications and unread count changes until the stream expires
+    
+    The stream sleeps on the pub/sub subscription and re-reads the database
+    when woken, or after NOTIFICATION_STREAM_POLL_INTERVAL seconds at most.
+    """
+    channels = [pubsub.user_channel(user.id), pubsub.tenant_channel(user.tenant_id)]
+    deadline = time.monotonic() + settings.NOTIFICATION_STREAM_MAX_DURATION
+    last_count = None
+    # Ids from the Last-Event-ID count as sent at the cursor
+    seen = dict.fromkeys(seen_ids, since)
+    
+    yield f'retry: {settings.NOTIFICATION_STREAM_RETRY}\n\n'
+    async with pubsub.get_broker().subscribe(channels) as subscription:
+        while True:
+            notifications, data, count = await sync_to_async(_fetch)(user, since, list(seen))
+            for notification, payload in zip(notifications, data):
+                since = max(since, notification.created_at)
+                seen[notification.id] = notification.created_at
+                yield _event('notification', payload, f'{since.isoformat()}|{notification.id}')
+            if notifications:
+                # Ids sent before the overlap window can no longer come back
+                oldest = since - timedelta(seconds=settings.NOTIFICATION_STREAM_OVERLAP_SECONDS)
+                seen = {notification_id: created_at for notification_id, created_at in seen.items() if created_at >= oldest}
+            
+            if count != last_count:
+                last_count = count
+                yield _event('unread_count', {'unread_count': count})
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not await subscription.wait(min(settings.NOTIFICATION_STREAM_POLL_INTERVAL, remaining)):
+                yield ': keepalive\n\n'
+
+
+async def notification_stream(request):
+    """Stream notifications of the current user as Server-Sent Events"""
+    user = await sync_to_async(_authenticate)(request)
+    if user is None or not user.tenant_id:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+    
+    since, seen_ids = _parse_event_id(request.headers.get('Last-Event-ID'))
+    if since is None:
+        since = timezone.now()
+    
+    response = StreamingHttpResponse(
+        _event_stream(user, since, seen_ids),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
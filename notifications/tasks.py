@@ -0,0 +1,41 @@
+"""
+Background tasks for notifications
+"""
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from .models import NotificationOutbox
+from .services import NotificationService
+
+
+@shared_task(ignore_result=True)
+def drain_notification_outbox(batch_size=None):
+    """
+    Deliver due outbox entries batch by batch until none are left
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    processed = 0
+    while True:
+        count = NotificationService.process_outbox(batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
+
+
+@shared_task(ignore_result=True)
+def purge_notification_outbox():
+    """
+    Delete delivered outbox entries past their retention period
+    """
+    cutoff = timezone.now() - timedelta(days=settings.NOTIFICATION_OUTBOX_RETENTION_DAYS)
+    deleted, _ = NotificationOutbox.objects.filter(status='delivered', delivered_at__lte=cutoff).delete()
+    return deleted
+
+
+@shared_task(ignore_result=True)
+def reconcile_unread_notification_counters():
+    """
+    Correct unread counters that drifted from the notifications table
+    """
+    return NotificationService.reconcile_unread_counts()
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import NotificationViewSet, NotificationLogViewSet, NotificationTemplateViewSet
+from .streams import notification_stream
 
 router = DefaultRouter()
 router.register(r'notifications', NotificationViewSet, basename='notification')
@@ -10,6 +11,7 @@ router.register(r'templates', NotificationTemplateViewSet, basename='notificatio
 app_name = 'notifications'
 
 urlpatterns = [
+    path('stream/', notification_stream, name='notification-stream'),
     path('', include(router.urls)),
 ]
 
@@ -3,10 +3,9 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db import models
-from django.utils import timezone
 from .models import Notification, NotificationLog, NotificationTemplate
 from .serializers import NotificationSerializer, NotificationLogSerializer, NotificationTemplateSerializer
+from .services import NotificationService
 from core.permissions import IsTenantMember
 
 
@@ -18,7 +17,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsTenantMember]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['title', 'message']
-    filterset_fields = ['notification_type', 'channel', 'priority', 'is_read']
+    filterset_fields = ['notification_type', 'channel', 'priority']
     ordering_fields = ['created_at', 'priority']
     ordering = ['-created_at']
     
@@ -32,42 +31,44 @@ class NotificationViewSet(viewsets.ModelViewSet):
         if not user.is_authenticated or not hasattr(user, 'tenant'):
             return Notification.objects.none()
         
-        return Notification.objects.filter(
-            tenant=user.tenant
-        ).filter(
-            models.Q(user=user) | models.Q(user__isnull=True)
-        )
+        queryset = NotificationService.visible_to(user)
+        
+        is_read = self.request.query_params.get('is_read')
+        if is_read is not None:
+            queryset = queryset.filter(user_is_read=is_read.lower() in ('true', '1'))
+        return queryset
+    
+    def perform_create(self, serializer):
+        notification = serializer.save()
+        NotificationService.reset_unread_counts(notification.tenant_id, notification.user_id)
+    
+    def perform_update(self, serializer):
+        notification = serializer.save()
+        NotificationService.reset_unread_counts(notification.tenant_id, notification.user_id)
+    
+    def perform_destroy(self, instance):
+        tenant_id, user_id = instance.tenant_id, instance.user_id
+        instance.delete()
+        NotificationService.reset_unread_counts(tenant_id, user_id)
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Mark notification as read"""
         notification = self.get_object()
-        notification.is_read = True
-        notification.read_at = timezone.now()
-        notification.save()
-        serializer = self.get_serializer(notification)
+        NotificationService.mark_read(notification, request.user)
+        serializer = self.get_serializer(self.get_object())
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        user = request.user
-        Notification.objects.filter(
-            tenant=user.tenant,
-            user=user,
-            is_read=False
-        ).update(is_read=True, read_at=timezone.now())
+        NotificationService.mark_all_read(request.user)
         return Response({'message': 'All notifications marked as read'})
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
         """Get count of unread notifications"""
-        user = request.user
-        count = Notification.objects.filter(
-            tenant=user.tenant,
-            user=user,
-            is_read=False
-        ).count()
+        count = NotificationService.unread_count(request.user)
         return Response({'unread_count': count})
 
 
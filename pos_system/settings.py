@@ -102,6 +102,23 @@ DATABASES = {
 }
 
 
+# Cache
+# Per-process by default; point CACHE_BACKEND at django.core.cache.backends.redis.RedisCache
+# (with CACHE_LOCATION=redis://...) to share compiled indexes between workers.
+
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default='pos-system'),
+    }
+}
+
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=100000, cast=int)}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -179,6 +196,58 @@ CORS_ALLOWED_ORIGINS = config(
 # Celery Configuration (for async tasks)
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
+# Publishing gives up quickly when the broker is down; periodic sweeps pick up the work instead
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'max_retries': config('CELERY_BROKER_PUBLISH_RETRIES', default=1, cast=int),
+    'interval_start': 0,
+    'interval_step': 0.2,
+}
+CELERY_BEAT_SCHEDULE = {
+    'purge-expired-idempotency-keys': {
+        'task': 'core.tasks.purge_expired_idempotency_keys',
+        'schedule': 3600,
+    },
+    'drain-notification-outbox': {
+        'task': 'notifications.tasks.drain_notification_outbox',
+        'schedule': 60,
+    },
+    'purge-notification-outbox': {
+        'task': 'notifications.tasks.purge_notification_outbox',
+        'schedule': 86400,
+    },
+    'reconcile-unread-notification-counters': {
+        'task': 'notifications.tasks.reconcile_unread_notification_counters',
+        'schedule': 3600,
+    },
+    'take-stock-checkpoints': {
+        'task': 'inventory.tasks.take_stock_checkpoints',
+        'schedule': 3600,  # a no-op once the current period is checkpointed
+    },
+    'scan-expiry-alerts': {
+        'task': 'inventory.tasks.scan_expiry_alerts',
+        'schedule': 86400,
+    },
+    'reconcile-reorder-points': {
+        'task': 'inventory.tasks.reconcile_reorder_points',
+        'schedule': 86400,
+    },
+    'run-pending-product-imports': {
+        'task': 'inventory.tasks.run_pending_product_imports',
+        'schedule': 60,
+    },
+    'draft-replenishment-orders': {
+        'task': 'transfers.tasks.draft_replenishment_orders',
+        'schedule': 86400,
+    },
+    'purge-catalog-tombstones': {
+        'task': 'sales.tasks.purge_catalog_tombstones',
+        'schedule': 86400,
+    },
+    'build-offline-bundles': {
+        'task': 'sales.tasks.build_offline_bundles',
+        'schedule': config('OFFLINE_BUNDLE_INTERVAL', default=300, cast=int),  # incremental; cheap when nothing changed
+    },
+}
 
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
@@ -198,3 +267,79 @@ AUDITLOG_INCLUDE_ALL_MODELS = False
 # Multi-tenant settings
 TENANT_MODEL = 'core.Tenant'
 
+# Idempotency-Key retention for replayed POST responses (seconds)
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+# Seconds an unfinished request holds its Idempotency-Key before a retry may take it over
+IDEMPOTENCY_KEY_LEASE = config('IDEMPOTENCY_KEY_LEASE', default=60, cast=int)
+
+
+# Seconds a compiled pricing/margin index entry may live without being invalidated
+PRICING_INDEX_TIMEOUT = config('PRICING_INDEX_TIMEOUT', default=3600, cast=int)
+# Used instead when the default cache is per-process (LocMem), where invalidations reach one worker only
+PRICING_INDEX_LOCAL_TIMEOUT = config('PRICING_INDEX_LOCAL_TIMEOUT', default=30, cast=int)
+
+# Notification outbox
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+NOTIFICATION_OUTBOX_RETRY_DELAY = config('NOTIFICATION_OUTBOX_RETRY_DELAY', default=30, cast=int)  # seconds, doubled per attempt
+NOTIFICATION_OUTBOX_CLAIM_TIMEOUT = config('NOTIFICATION_OUTBOX_CLAIM_TIMEOUT', default=300, cast=int)  # seconds before a claimed entry is due again
+NOTIFICATION_OUTBOX_RETENTION_DAYS = config('NOTIFICATION_OUTBOX_RETENTION_DAYS', default=7, cast=int)
+# Seconds during which repeats of the same low stock, margin violation or expiry alert are folded into one notification
+NOTIFICATION_COALESCE_WINDOW = config('NOTIFICATION_COALESCE_WINDOW', default=3600, cast=int)
+
+# Notification stream (SSE, served over ASGI)
+# Set NOTIFICATION_PUBSUB_URL (e.g. redis://localhost:6379/1) so worker deliveries wake streams at once
+NOTIFICATION_PUBSUB_URL = config('NOTIFICATION_PUBSUB_URL', default='')
+NOTIFICATION_STREAM_POLL_INTERVAL = config('NOTIFICATION_STREAM_POLL_INTERVAL', default=15, cast=int)  # seconds
+NOTIFICATION_STREAM_MAX_DURATION = config('NOTIFICATION_STREAM_MAX_DURATION', default=300, cast=int)  # seconds
+NOTIFICATION_STREAM_RETRY = config('NOTIFICATION_STREAM_RETRY', default=3000, cast=int)  # client reconnect delay, ms
+NOTIFICATION_STREAM_BATCH_SIZE = config('NOTIFICATION_STREAM_BATCH_SIZE', default=50, cast=int)
+# Seconds re-scanned before the cursor for notifications whose transaction committed late
+NOTIFICATION_STREAM_OVERLAP_SECONDS = config('NOTIFICATION_STREAM_OVERLAP_SECONDS', default=60, cast=int)
+
+# Configuration cache
+# Set CONFIG_CACHE_ALIAS to a shared cache (e.g. 'default' on Redis) so config changes reach every worker
+CONFIG_CACHE_ALIAS = config('CONFIG_CACHE_ALIAS', default='')
+CONFIG_CACHE_TIMEOUT = config('CONFIG_CACHE_TIMEOUT', default=300, cast=int)
+CONFIG_CACHE_CHECK_INTERVAL = config('CONFIG_CACHE_CHECK_INTERVAL', default=1, cast=int)
+
+# Offline mode
+OFFLINE_SYNC_CHUNK_SIZE = config('OFFLINE_SYNC_CHUNK_SIZE', default=100, cast=int)
+OFFLINE_SYNC_MAX_SALES = config('OFFLINE_SYNC_MAX_SALES', default=5000, cast=int)
+
+# Stock balance rebuild (manage.py rebuild_stock_balances)
+STOCK_REBUILD_CHUNK_SIZE = config('STOCK_REBUILD_CHUNK_SIZE', default=5000, cast=int)  # ledger rows fetched per round trip
+# Ledger rows older than this are replayed without locks; newer ones under the balance locks
+STOCK_REBUILD_SETTLE_SECONDS = config('STOCK_REBUILD_SETTLE_SECONDS', default=60, cast=int)
+# Stock checkpoints for point-in-time queries: 'daily' or 'monthly'
+STOCK_CHECKPOINT_FREQUENCY = config('STOCK_CHECKPOINT_FREQUENCY', default='daily')
+
+# Inventory ledger archive (manage.py archive_ledger)
+LEDGER_ARCHIVE_DIR = config('LEDGER_ARCHIVE_DIR', default=str(BASE_DIR / 'ledger_archive'))
+LEDGER_ARCHIVE_AFTER_MONTHS = config('LEDGER_ARCHIVE_AFTER_MONTHS', default=24, cast=int)  # months kept in the database
+
+# Replenishment (draft shop orders from sales velocity)
+REPLENISHMENT_LOOKBACK_DAYS = config('REPLENISHMENT_LOOKBACK_DAYS', default=28, cast=int)  # sales history used for velocity
+REPLENISHMENT_REORDER_DAYS = config('REPLENISHMENT_REORDER_DAYS', default=7, cast=int)  # order when cover drops below
+REPLENISHMENT_COVER_DAYS = config('REPLENISHMENT_COVER_DAYS', default=21, cast=int)  # order up to this many days of sales
+
+# Stock counts
+STOCK_COUNT_CHUNK_SIZE = config('STOCK_COUNT_CHUNK_SIZE', default=2000, cast=int)  # uploaded lines stored per round trip
+STOCK_COUNT_MAX_ERRORS = config('STOCK_COUNT_MAX_ERRORS', default=100, cast=int)  # bad lines listed in an upload response
+
+# Product catalog import
+PRODUCT_IMPORT_CHUNK_SIZE = config('PRODUCT_IMPORT_CHUNK_SIZE', default=2000, cast=int)  # rows upserted per statement
+PRODUCT_IMPORT_MAX_ERRORS = config('PRODUCT_IMPORT_MAX_ERRORS', default=1000, cast=int)  # row errors kept on an import
+PRODUCT_IMPORT_STALE_SECONDS = config('PRODUCT_IMPORT_STALE_SECONDS', default=600, cast=int)  # running imports without progress this long are restarted
+
+# Product search (till typeahead)
+PRODUCT_SEARCH_LIMIT = config('PRODUCT_SEARCH_LIMIT', default=20, cast=int)  # results when the till does not ask
+PRODUCT_SEARCH_MAX_LIMIT = config('PRODUCT_SEARCH_MAX_LIMIT', default=100, cast=int)
+PRODUCT_SEARCH_MIN_CODE_PREFIX = config('PRODUCT_SEARCH_MIN_CODE_PREFIX', default=3, cast=int)  # characters before codes match by prefix
+
+# Till catalog snapshots
+CATALOG_CURSOR_OVERLAP_SECONDS = config('CATALOG_CURSOR_OVERLAP_SECONDS', default=120, cast=int)  # deltas reach back this far before the cursor
+CATALOG_TOMBSTONE_DAYS = config('CATALOG_TOMBSTONE_DAYS', default=30, cast=int)  # older cursors get a full snapshot
+
+# Offline till bundles (SQLite file per shop)
+OFFLINE_BUNDLE_CHUNK_SIZE = config('OFFLINE_BUNDLE_CHUNK_SIZE', default=2000, cast=int)  # rows read and products priced per round trip
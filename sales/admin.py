@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     Shift, Sale, SaleItem, Payment, Refund, RefundItem,
-    ShopProductCost, PriceRule, MarginRule,
+    ShopProductCost, PriceRule, MarginRule, CatalogTombstone, OfflineBundle,
     Customer, CreditAccount, CreditTransaction
 )
 
@@ -110,6 +110,23 @@ class MarginRuleAdmin(admin.ModelAdmin):
     raw_id_fields = ['tenant', 'shop', 'product']
 
 
+@admin.register(CatalogTombstone)
+class CatalogTombstoneAdmin(admin.ModelAdmin):
+    list_display = ['section', 'object_id', 'shop', 'tenant', 'deleted_at']
+    list_filter = ['section', 'tenant', 'deleted_at']
+    search_fields = ['object_id']
+    raw_id_fields = ['tenant', 'shop']
+
+
+@admin.register(OfflineBundle)
+class OfflineBundleAdmin(admin.ModelAdmin):
+    list_display = ['shop', 'tenant', 'last_build', 'size', 'prices_on', 'built_at', 'last_error']
+    list_filter = ['last_build', 'tenant', 'built_at']
+    readonly_fields = ['id', 'schema_version', 'cursor', 'prices_on', 'row_counts', 'size', 'sha256',
+                       'last_build', 'last_error', 'built_at', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'shop']
+
+
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ['name', 'code', 'phone', 'email', 'tenant', 'is_active', 'created_at']
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
-
+    
+    def ready(self):
+        import sales.checks  # noqa
+        import sales.signals  # noqa
@@ -0,0 +1,157 @@
+"""
+Per-shop catalog snapshots for the till
+
+A snapshot holds what a till needs to sell: active products, the shop's
+stock, its active shop costs and price rules, and the expiry dates of the
+batches it stocks. Each section is sent as one list of field names and
+rows of values, which is far smaller than an object per row.
+
+A snapshot carries a cursor: the time it was read, in microseconds. Given
+back as since, only rows whose updated_at moved after it are returned,
+plus the ids deleted since (CatalogTombstone). The window starts
+CATALOG_CURSOR_OVERLAP_SECONDS early so rows written by transactions still
+open when the cursor was taken are not missed; tills upsert rows by id, so
+a row sent twice is harmless. Cursors older than the tombstones kept get a
+full snapshot instead.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from inventory.models import Batch, Product, StockBalance
+from .models import CatalogTombstone, PriceRule, ShopProductCost
+
+
+SECTION_FIELDS = {
+    'products': ['id', 'sku', 'barcode', 'name', 'category_id', 'unit_of_measure',
+                 'track_batches', 'track_expiry', 'is_active'],
+    'stock': ['id', 'product_id', 'batch_id', 'quantity_on_hand', 'quantity_reserved'],
+    'costs': ['id', 'product_id', 'batch_id', 'unit_cost', 'effective_from', 'effective_to', 'is_active'],
+    'price_rules': ['id', 'shop_id', 'product_id', 'unit_price', 'price_multiplier',
+                    'effective_from', 'effective_to', 'priority', 'is_active'],
+    'batches': ['id', 'product_id', 'batch_number', 'expiry_date', 'is_active'],
+}
+
+
+def to_cursor(moment):
+    """Cursor (microseconds since the epoch, as text) of a point in time"""
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def from_cursor(cursor):
+    """Point in time of a cursor; raises ValueError for anything else"""
+    microseconds = int(cursor)
+    if microseconds < 0:
+        raise ValueError('cursor must not be negative')
+    return datetime.fromtimestamp(0, dt_timezone.utc) + timedelta(microseconds=microseconds)
+
+
+def catalog_scopes(shop):
+    """Every row a till of the shop may hold, per section"""
+    return {
+        'products': Product.objects.filter(tenant_id=shop.tenant_id),
+        'stock': StockBalance.objects.filter(location=shop),
+        'costs': ShopProductCost.objects.filter(shop=shop),
+        'price_rules': PriceRule.objects.filter(Q(shop=shop) | Q(shop__isnull=True), tenant_id=shop.tenant_id),
+        'batches': Batch.objects.filter(tenant_id=shop.tenant_id),
+    }
+
+
+def current_rows(scopes, today):
+    """What a full snapshot sends: active rows, stock held, running prices"""
+    running = Q(is_active=True) & (Q(effective_to__isnull=True) | Q(effective_to__gte=today))
+    stock = scopes['stock'].filter(Q(quantity_on_hand__gt=0) | Q(quantity_reserved__gt=0))
+    return {
+        'products': scopes['products'].filter(is_active=True),
+        'stock': stock,
+        'costs': scopes['costs'].filter(running),
+        'price_rules': scopes['price_rules'].filter(running),
+        'batches': scopes['batches'].filter(id__in=stock.values('batch_id')),
+    }
+
+
+def changed_rows(scopes, after):
+    """What a delta sends: rows whose updated_at moved, and the batches of changed stock"""
+    changed = {
+        name: scope.filter(updated_at__gte=after)
+        for name, scope in scopes.items()
+        if name != 'batches'
+    }
+    changed['batches'] = scopes['batches'].filter(
+        Q(id__in=changed['stock'].values('batch_id'))
+        | Q(updated_at__gte=after, id__in=scopes['stock'].values('batch_id'))
+    )
+    return changed
+
+
+def deleted_ids(shop, after):
+    """Ids deleted outright since a point in time, per tombstone section"""
+    deleted = {section: [] for section, _ in CatalogTombstone.SECTION_CHOICES}
+    for section, object_id in CatalogTombstone.objects.filter(
+        Q(shop=shop) | Q(shop__isnull=True), tenant_id=shop.tenant_id, deleted_at__gte=after
+    ).values_list('section', 'object_id'):
+        deleted[section].append(object_id)
+    return deleted
+
+
+def tombstones_kept_since(now=None):
+    """Oldest point in time deltas can still be answered from"""
+    return (now or timezone.now()) - timedelta(days=settings.CATALOG_TOMBSTONE_DAYS)
+
+
+def _value(value):
+    # Decimals go out as text so the till never sees a rounded float
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def _section(queryset, fields):
+    return {
+        'fields': fields,
+        'rows': [[_value(value) for value in row] for row in queryset.order_by().values_list(*fields)],
+    }
+
+
+def snapshot_etag(shop):
+    """
+    ETag of a shop's full snapshot, from the row count and latest
+    updated_at of every section (one aggregate query each) and the date,
+    since price rules and costs lapse at midnight
+    """
+    parts = [str(shop.id), timezone.localdate().isoformat()]
+    for name, scope in catalog_scopes(shop).items():
+        state = scope.order_by().aggregate(count=Count('id'), latest=Max('updated_at'))
+        parts.append(f"{name}:{state['count']}:{state['latest'] and state['latest'].isoformat()}")
+    return '"{}"'.format(hashlib.sha1('|'.join(parts).encode()).hexdigest())
+
+
+def build_snapshot(shop, since=None):
+    """
+    Catalog of a shop, in full or (since a cursor's time) as a delta
+    
+    Returns a dict with the shop, the new cursor, whether it is a full
+    snapshot, a {'fields', 'rows'} table per section and, for deltas, the
+    ids deleted per section.
+    """
+    now = timezone.now()
+    full = since is None or since < tombstones_kept_since(now)
+    scopes = catalog_scopes(shop)
+    if full:
+        querysets = current_rows(scopes, timezone.localdate())
+    else:
+        after = since - timedelta(seconds=settings.CATALOG_CURSOR_OVERLAP_SECONDS)
+        querysets = changed_rows(scopes, after)
+    
+    snapshot = {
+        'shop': shop.id,
+        # Never behind the cursor given, so cursors only move forward
+        'cursor': to_cursor(max(now, since) if since else now),
+        'full': full,
+    }
+    for name, fields in SECTION_FIELDS.items():
+        snapshot[name] = _section(querysets[name], fields)
+    
+    if not full:
+        snapshot['deleted'] = deleted_ids(shop, after)
+    return snapshot
@@ -0,0 +1,22 @@
+"""
+System checks for the sales app
+"""
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+from core.cache_versions import is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_pricing_cache(app_configs, **kwargs):
+    """
+    Compiled margin floors and price rules are invalidated through the
+    default cache, which must be shared for changes to reach every worker
+    """
+    if is_shared(caches['default']):
+        return []
+    return [Warning(
+        'The default cache is per-process, so price and margin rule changes only reach other '
+        'workers once their compiled entries expire (PRICING_INDEX_LOCAL_TIMEOUT).',
+        hint='Set CACHE_BACKEND to a shared backend such as django.core.cache.backends.redis.RedisCache.',
+        id='sales.W001',
+    )]
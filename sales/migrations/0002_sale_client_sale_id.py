@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('sales', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='client_sale_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sale',
+            unique_together={('tenant', 'client_sale_id')},
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('inventory', '0010_catalog_change_indexes'),
+        ('sales', '0002_sale_client_sale_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('products', 'Product'), ('batches', 'Batch'), ('costs', 'Shop product cost'), ('price_rules', 'Price rule')], max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'catalog_tombstones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pricerule',
+            index=models.Index(fields=['tenant', 'updated_at'], name='price_rules_tenant__fb5f9d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shopproductcost',
+            index=models.Index(fields=['shop', 'updated_at'], name='shop_produc_shop_id_367716_idx'),
+        ),
+        migrations.AddField(
+            model_name='catalogtombstone',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='catalog_tombstones', to='core.location'),
+        ),
+        migrations.AddField(
+            model_name='catalogtombstone',
+            name='tenant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_tombstones', to='core.tenant'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogtombstone',
+            index=models.Index(fields=['tenant', 'deleted_at'], name='catalog_tom_tenant__f46b19_idx'),
+        ),
+    ]
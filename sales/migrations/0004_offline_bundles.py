@@ -0,0 +1,45 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:06
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+        ('sales', '0003_catalog_tombstones'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='catalogtombstone',
+            name='section',
+            field=models.CharField(choices=[('products', 'Product'), ('batches', 'Batch'), ('costs', 'Shop product cost'), ('price_rules', 'Price rule'), ('customers', 'Customer')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='OfflineBundle',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(blank=True, upload_to='offline_bundles/')),
+                ('schema_version', models.PositiveSmallIntegerField(default=0)),
+                ('cursor', models.CharField(blank=True, max_length=20)),
+                ('prices_on', models.DateField(blank=True, null=True)),
+                ('row_counts', models.JSONField(blank=True, default=dict)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('last_build', models.CharField(blank=True, choices=[('full', 'Full'), ('incremental', 'Incremental')], max_length=20)),
+                ('last_error', models.TextField(blank=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shop', models.OneToOneField(limit_choices_to={'location_type': 'shop'}, on_delete=django.db.models.deletion.CASCADE, related_name='offline_bundle', to='core.location')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offline_bundles', to='core.tenant')),
+            ],
+            options={
+                'db_table': 'offline_bundles',
+                'indexes': [models.Index(fields=['tenant', 'built_at'], name='offline_bun_tenant__46cfbe_idx')],
+            },
+        ),
+    ]
@@ -83,6 +83,7 @@ class Sale(models.Model):
     # Offline mode
     is_offline = models.BooleanField(default=False)
     synced_at = models.DateTimeField(null=True, blank=True)
+    client_sale_id = models.UUIDField(null=True, blank=True)  # Generated by the till for offline sales
     
     # Metadata
     notes = models.TextField(blank=True)
@@ -92,6 +93,7 @@ class Sale(models.Model):
     class Meta:
         db_table = 'sales'
         ordering = ['-created_at']
+        unique_together = [['tenant', 'client_sale_id']]
         indexes = [
             models.Index(fields=['tenant', 'shop', 'attendant']),
             models.Index(fields=['sale_number']),
@@ -308,6 +310,7 @@ class ShopProductCost(models.Model):
         indexes = [
             models.Index(fields=['shop', 'product', 'is_active']),
             models.Index(fields=['effective_from', 'effective_to']),
+            models.Index(fields=['shop', 'updated_at']),
         ]
     
     def __str__(self):
@@ -348,6 +351,7 @@ class PriceRule(models.Model):
         indexes = [
             models.Index(fields=['shop', 'product', 'is_active']),
             models.Index(fields=['effective_from', 'effective_to']),
+            models.Index(fields=['tenant', 'updated_at']),
         ]
     
     def __str__(self):
@@ -395,6 +399,87 @@ class MarginRule(models.Model):
         return f"Margin Rule: {scope} ({self.minimum_margin_percent}%)"
 
 
+class CatalogTombstone(models.Model):
+    """
+    A catalog row deleted outright, kept so till catalog deltas can drop it
+    Rows switched off with is_active reach tills as ordinary changes
+    """
+    SECTION_CHOICES = [
+        ('products', 'Product'),
+        ('batches', 'Batch'),
+        ('costs', 'Shop product cost'),
+        ('price_rules', 'Price rule'),
+        ('customers', 'Customer'),
+    ]
+    
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='catalog_tombstones')
+    shop = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        related_name='catalog_tombstones',
+        null=True,
+        blank=True
+    )  # None = every shop of the tenant
+    section = models.CharField(max_length=20, choices=SECTION_CHOICES)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'catalog_tombstones'
+        indexes = [
+            models.Index(fields=['tenant', 'deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.section} {self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class OfflineBundle(models.Model):
+    """
+    SQLite file an offline till of a shop downloads
+    Holds the catalog, barcodes, resolved prices and margin floors,
+    customers with their credit and the shop's stock; rebuilt from catalog
+    changes since its cursor
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='offline_bundles')
+    shop = models.OneToOneField(
+        Location,
+        on_delete=models.CASCADE,
+        related_name='offline_bundle',
+        limit_choices_to={'location_type': 'shop'}
+    )
+    file = models.FileField(upload_to='offline_bundles/', blank=True)
+    
+    # What the file holds
+    schema_version = models.PositiveSmallIntegerField(default=0)
+    cursor = models.CharField(max_length=20, blank=True)  # catalog cursor the file is current to
+    prices_on = models.DateField(null=True, blank=True)  # date its prices were resolved for
+    row_counts = models.JSONField(default=dict, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    
+    # Builds
+    last_build = models.CharField(
+        max_length=20,
+        choices=[('full', 'Full'), ('incremental', 'Incremental')],
+        blank=True
+    )
+    last_error = models.TextField(blank=True)  # why the latest build failed
+    built_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'offline_bundles'
+        indexes = [
+            models.Index(fields=['tenant', 'built_at']),
+        ]
+    
+    def __str__(self):
+        return f"Offline bundle {self.shop.name} ({self.built_at or 'never built'})"
+
+
 # Credit Accounts (Accounts Receivable)
 
 class Customer(models.Model):
@@ -0,0 +1,374 @@
+"""
+Offline SQLite bundles for tills
+
+A bundle is one SQLite file per shop holding what a till needs to sell
+without a network: active products and their barcodes, prices and margin
+floors resolved for the day, customers with their credit, and the shop's
+stock with batch expiry. Money and quantities are stored as text so they
+stay exact.
+
+The first build writes every table. Later builds copy the last file and
+apply only the rows changed since its catalog cursor (the same change
+scopes as the till catalog delta, see sales.catalog), repricing only the
+products whose prices could have moved; everything is repriced when the
+day changes or a rule covering all products moves. The file's SHA-256 is
+the download's ETag.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from uuid import UUID
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from core.models import Location
+from inventory.models import Batch
+from .catalog import (
+    catalog_scopes, changed_rows, current_rows, deleted_ids, from_cursor, to_cursor, tombstones_kept_since
+)
+from .models import Customer, MarginRule, OfflineBundle
+from .pricing import MarginIndex
+from .services import PricingService
+
+logger = logging.getLogger(__name__)
+
+
+# Bumped whenever SCHEMA changes; older files are rebuilt in full
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE products (
+    id TEXT PRIMARY KEY, sku TEXT NOT NULL, barcode TEXT, name TEXT NOT NULL, category_id TEXT,
+    unit_of_measure TEXT, track_batches INTEGER, track_expiry INTEGER
+);
+CREATE INDEX products_name ON products (name COLLATE NOCASE);
+CREATE TABLE barcodes (code TEXT NOT NULL, product_id TEXT NOT NULL, PRIMARY KEY (code, product_id));
+CREATE INDEX barcodes_product ON barcodes (product_id);
+CREATE TABLE prices (
+    product_id TEXT PRIMARY KEY, unit_price TEXT, price_rule_id TEXT, minimum_price TEXT, margin_behavior TEXT
+);
+CREATE TABLE stock (
+    id TEXT PRIMARY KEY, product_id TEXT NOT NULL, batch_id TEXT, batch_number TEXT, expiry_date TEXT,
+    quantity_on_hand TEXT NOT NULL, quantity_reserved TEXT NOT NULL
+);
+CREATE INDEX stock_product ON stock (product_id);
+CREATE INDEX stock_batch ON stock (batch_id);
+CREATE TABLE customers (
+    id TEXT PRIMARY KEY, name TEXT NOT NULL, code TEXT, phone TEXT,
+    credit_limit TEXT, current_balance TEXT, available_credit TEXT, credit_state TEXT
+);
+"""
+
+TABLES = ['products', 'barcodes', 'prices', 'stock', 'customers']
+
+PRODUCT_FIELDS = ['id', 'sku', 'barcode', 'name', 'category_id', 'unit_of_measure', 'track_batches', 'track_expiry']
+PRICE_COLUMNS = ['product_id', 'unit_price', 'price_rule_id', 'minimum_price', 'margin_behavior']
+STOCK_COLUMNS = ['id', 'product_id', 'batch_id', 'batch_number', 'expiry_date', 'quantity_on_hand', 'quantity_reserved']
+STOCK_FIELDS = ['id', 'product_id', 'batch_id', 'batch__batch_number', 'batch__expiry_date',
+                'quantity_on_hand', 'quantity_reserved']
+CUSTOMER_COLUMNS = ['id', 'name', 'code', 'phone', 'credit_limit', 'current_balance', 'available_credit', 'credit_state']
+CUSTOMER_FIELDS = ['id', 'name', 'code', 'phone', 'credit_account__credit_limit', 'credit_account__current_balance',
+                   'credit_account__state', 'credit_account__is_active']
+
+BARCODES_OF_PRODUCT = """
+INSERT OR IGNORE INTO barcodes (code, product_id)
+SELECT sku, id FROM products WHERE id = :id
+UNION ALL
+SELECT barcode, id FROM products WHERE id = :id AND barcode IS NOT NULL AND barcode != ''
+"""
+
+
+def _sql(value):
+    """A value as SQLite stores it in a bundle"""
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _row(values):
+    return tuple(_sql(value) for value in values)
+
+
+def _upsert(conn, table, columns, rows):
+    conn.executemany(
+        'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(table, ', '.join(columns), ', '.join('?' * len(columns))),
+        rows
+    )
+
+
+def _delete(conn, table, column, ids):
+    conn.executemany(f'DELETE FROM {table} WHERE {column} = ?', [(_sql(value),) for value in ids])
+
+
+def _iterate(queryset, fields):
+    return queryset.order_by().values_list(*fields).iterator(chunk_size=settings.OFFLINE_BUNDLE_CHUNK_SIZE)
+
+
+def _customer_row(row):
+    """Customer row with the available credit of an active credit account"""
+    customer_id, name, code, phone, credit_limit, current_balance, state, account_active = row
+    available = None
+    if credit_limit is not None:
+        available = max(Decimal('0'), credit_limit - current_balance) if account_active else Decimal('0')
+    return _row((customer_id, name, code, phone, credit_limit, current_balance, available, state))
+
+
+def _price_rows(shop, product_ids, today):
+    """
+    Resolved price and margin floor rows, quoted a chunk of products at a time
+    """
+    product_ids = list(product_ids)
+    chunk_size = settings.OFFLINE_BUNDLE_CHUNK_SIZE
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        margin_entries = MarginIndex.entries(shop, chunk)
+        for quote in PricingService.quote(shop, chunk, at=today):
+            rule = margin_entries[quote['product']].rule
+            yield _row((
+                quote['product'], quote['unit_price'], quote['price_rule'], quote['minimum_price'],
+                rule.behavior if rule else None,
+            ))
+
+
+def _margin_state(shop):
+    """
+    Fingerprint of the shop's margin rules; a change (deletes included)
+    reprices every product
+    """
+    state = MarginRule.objects.filter(tenant_id=shop.tenant_id, shop=shop).order_by().aggregate(
+        count=Count('id'), latest=Max('updated_at')
+    )
+    return f"{state['count']}:{state['latest'] and state['latest'].isoformat()}"
+
+
+def _write_full(conn, shop, today):
+    """Create and fill every table"""
+    conn.executescript(SCHEMA)
+    current = current_rows(catalog_scopes(shop), today)
+    
+    product_ids = []
+    
+    def products():
+        for row in _iterate(current['products'], PRODUCT_FIELDS):
+            product_ids.append(row[0])
+            yield _row(row)
+    
+    _upsert(conn, 'products', PRODUCT_FIELDS, products())
+    conn.execute(
+        "INSERT OR IGNORE INTO barcodes (code, product_id) SELECT sku, id FROM products "
+        "UNION ALL SELECT barcode, id FROM products WHERE barcode IS NOT NULL AND barcode != ''"
+    )
+    _upsert(conn, 'prices', PRICE_COLUMNS, _price_rows(shop, product_ids, today))
+    _upsert(conn, 'stock', STOCK_COLUMNS, (_row(row) for row in _iterate(current['stock'], STOCK_FIELDS)))
+    _upsert(conn, 'customers', CUSTOMER_COLUMNS, (
+        _customer_row(row)
+        for row in _iterate(Customer.objects.filter(tenant_id=shop.tenant_id, is_active=True), CUSTOMER_FIELDS)
+    ))
+
+
+def _apply_changes(conn, shop, after, today, reprice_all):
+    """
+    Bring a copied bundle up to date with the rows changed since after
+    
+    Returns the number of rows written or deleted (repricing included).
+    """
+    changed = changed_rows(catalog_scopes(shop), after)
+    deleted = deleted_ids(shop, after)
+    changes = 0
+    
+    # Products and their barcodes; deactivated products leave the bundle
+    upserted = []
+    removed = list(deleted['products'])
+    for row in _iterate(changed['products'], PRODUCT_FIELDS + ['is_active']):
+        if row[-1]:
+            upserted.append(_row(row[:-1]))
+        else:
+            removed.append(row[0])
+    for table, column in [('products', 'id'), ('barcodes', 'product_id'), ('prices', 'product_id'), ('stock', 'product_id')]:
+        _delete(conn, table, column, removed)
+    _upsert(conn, 'products', PRODUCT_FIELDS, upserted)
+    _delete(conn, 'barcodes', 'product_id', [row[0] for row in upserted])
+    conn.executemany(BARCODES_OF_PRODUCT, [{'id': row[0]} for row in upserted])
+    changes += len(upserted) + len(removed)
+    
+    # Stock, with the expiry of batches that changed
+    held = []
+    emptied = []
+    removed = set(removed)
+    for row in _iterate(changed['stock'], STOCK_FIELDS):
+        if row[1] in removed:
+            continue
+        if row[-2] > 0 or row[-1] > 0:
+            held.append(_row(row))
+        else:
+            emptied.append(row[0])
+    _upsert(conn, 'stock', STOCK_COLUMNS, held)
+    _delete(conn, 'stock', 'id', emptied)
+    _delete(conn, 'stock', 'batch_id', deleted['batches'])
+    batches = [_row(row) for row in _iterate(changed['batches'], ['batch_number', 'expiry_date', 'id'])]
+    conn.executemany('UPDATE stock SET batch_number = ?, expiry_date = ? WHERE batch_id = ?', batches)
+    changes += len(held) + len(emptied) + len(deleted['batches']) + len(batches)
+    
+    # Customers whose details or credit account moved
+    customers = Customer.objects.filter(tenant_id=shop.tenant_id).filter(
+        Q(updated_at__gte=after) | Q(credit_account__updated_at__gte=after)
+    )
+    active = []
+    inactive = list(deleted['customers'])
+    for row in _iterate(customers, CUSTOMER_FIELDS + ['is_active']):
+        if row[-1]:
+            active.append(_customer_row(row[:-1]))
+        else:
+            inactive.append(row[0])
+    _upsert(conn, 'customers', CUSTOMER_COLUMNS, active)
+    _delete(conn, 'customers', 'id', inactive)
+    changes += len(active) + len(inactive)
+    
+    # Prices of the products a change could have moved
+    if not reprice_all:
+        rule_products = set(changed['price_rules'].order_by().values_list('product_id', flat=True)) | set(
+            changed['costs'].order_by().values_list('product_id', flat=True)
+        ) | set(
+            Batch.objects.filter(tenant_id=shop.tenant_id, updated_at__gte=after).values_list('product_id', flat=True)
+        )
+        reprice_all = None in rule_products or any(deleted[section] for section in ('price_rules', 'costs', 'batches'))
+    if reprice_all:
+        conn.execute('DELETE FROM prices')
+        repriced = [row[0] for row in conn.execute('SELECT id FROM products')]
+    else:
+        in_bundle = {row[0] for row in conn.execute('SELECT id FROM products')}
+        repriced = {_sql(product_id) for product_id in rule_products} | {row[0] for row in upserted}
+        repriced = [product_id for product_id in repriced if product_id in in_bundle]
+    _upsert(conn, 'prices', PRICE_COLUMNS, _price_rows(shop, [UUID(product_id) for product_id in repriced], today))
+    changes += len(repriced)
+    return changes
+
+
+def _write_meta(conn, shop, cursor, today, margin_state):
+    _upsert(conn, 'meta', ['key', 'value'], [
+        ('schema_version', str(SCHEMA_VERSION)),
+        ('tenant_id', str(shop.tenant_id)),
+        ('shop_id', str(shop.id)),
+        ('cursor', cursor),  # usable as since= against the catalog endpoint
+        ('prices_on', today.isoformat()),
+        ('margin_rules', margin_state),
+        ('built_at', timezone.now().isoformat()),
+    ])
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@transaction.atomic
+def build_bundle(shop, full=False):
+    """
+    Build or bring up to date the offline bundle of a shop
+    
+    Incremental unless asked for a full build, or the last file is missing,
+    of an older schema, or older than the catalog tombstones kept. When
+    nothing changed only the cursor moves on. Returns the OfflineBundle.
+    """
+    bundle, _ = OfflineBundle.objects.get_or_create(shop=shop, defaults={'tenant_id': shop.tenant_id})
+    bundle = OfflineBundle.objects.select_for_update().get(id=bundle.id)
+    now = timezone.now()
+    today = timezone.localdate()
+    cursor = to_cursor(now)
+    since = from_cursor(bundle.cursor) if bundle.cursor else None
+    incremental = bool(
+        not full and bundle.file and bundle.schema_version == SCHEMA_VERSION
+        and since and since >= tombstones_kept_since(now)
+    )
+    
+    workdir = tempfile.mkdtemp(prefix='offline-bundle-')
+    path = os.path.join(workdir, 'bundle.sqlite3')
+    try:
+        if incremental:
+            with bundle.file.open('rb') as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+        
+        conn = sqlite3.connect(path)
+        try:
+            margin_state = _margin_state(shop)
+            with conn:
+                if incremental:
+                    meta = dict(conn.execute('SELECT key, value FROM meta'))
+                    after = since - timedelta(seconds=settings.CATALOG_CURSOR_OVERLAP_SECONDS)
+                    reprice_all = bundle.prices_on != today or meta.get('margin_rules') != margin_state
+                    changes = _apply_changes(conn, shop, after, today, reprice_all)
+                else:
+                    _write_full(conn, shop, today)
+                    changes = None
+                _write_meta(conn, shop, cursor, today, margin_state)
+            
+            if incremental and not changes:
+                bundle.cursor = cursor
+                bundle.last_error = ''
+                bundle.save(update_fields=['cursor', 'last_error', 'updated_at'])
+                return bundle
+            
+            if incremental:
+                conn.execute('VACUUM')
+            row_counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in TABLES}
+        finally:
+            conn.close()
+        
+        previous = bundle.file.name
+        with open(path, 'rb') as f:
+            bundle.file.save(f'{shop.id}.sqlite3', File(f), save=False)
+        bundle.schema_version = SCHEMA_VERSION
+        bundle.cursor = cursor
+        bundle.prices_on = today
+        bundle.row_counts = row_counts
+        bundle.size = os.path.getsize(path)
+        bundle.sha256 = _sha256(path)
+        bundle.last_build = 'incremental' if incremental else 'full'
+        bundle.last_error = ''
+        bundle.built_at = now
+        bundle.save()
+        
+        if previous and previous != bundle.file.name:
+            storage = bundle.file.storage
+            transaction.on_commit(lambda: storage.delete(previous))
+        return bundle
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def offline_shops():
+    """Active shops of active tenants that have offline mode on"""
+    return Location.objects.filter(location_type='shop', is_active=True, tenant__is_active=True).exclude(
+        tenant__system_config__enable_offline_mode=False
+    )
+
+
+def refresh_bundle(shop_id, full=False):
+    """
+    Build or update a shop's bundle, recording a failure on it instead of
+    raising; returns the OfflineBundle (None for an unknown shop)
+    """
+    shop = Location.objects.filter(id=shop_id, location_type='shop').first()
+    if shop is None:
+        return None
+    try:
+        return build_bundle(shop, full=full)
+    except Exception as e:
+        logger.exception("Offline bundle of shop %s failed", shop_id)
+        bundle, _ = OfflineBundle.objects.update_or_create(
+            shop=shop, defaults={'tenant_id': shop.tenant_id, 'last_error': str(e)}
+        )
+        return bundle
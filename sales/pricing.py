@@ -0,0 +1,291 @@
+"""
+Compiled pricing indexes used on the till hot path
+"""
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db.models import Max, Q
+from core.cache_versions import bump_version, current_version, is_shared
+from inventory.models import Batch
+from .models import ShopProductCost, MarginRule, PriceRule
+
+
+CompiledMarginRule = namedtuple('CompiledMarginRule', ['id', 'minimum_margin_percent', 'behavior'])
+
+MarginEntry = namedtuple('MarginEntry', ['highest_cost', 'rule', 'minimum_price'])
+
+EMPTY_MARGIN_ENTRY = MarginEntry(highest_cost=None, rule=None, minimum_price=None)
+
+CompiledPriceRule = namedtuple('CompiledPriceRule', ['id', 'unit_price', 'price_multiplier', 'priority'])
+
+
+def _version(key):
+    return current_version(cache, key)
+
+
+def _bump(key):
+    bump_version(cache, key)
+
+
+def _timeout():
+    """
+    Lifetime of a compiled entry
+    
+    Version bumps only reach the process that made them when the cache is
+    per-process, so other workers would keep stale floors and prices for
+    the whole PRICING_INDEX_TIMEOUT; entries are kept briefly instead.
+    """
+    if is_shared(caches[DEFAULT_CACHE_ALIAS]):
+        return settings.PRICING_INDEX_TIMEOUT
+    return min(settings.PRICING_INDEX_TIMEOUT, settings.PRICING_INDEX_LOCAL_TIMEOUT)
+
+
+class MarginIndex:
+    """
+    Compiled margin floors per shop and product
+    
+    Each entry holds the resolved MarginRule (product-specific before
+    shop-wide), the highest active batch cost (or the active
+    ShopProductCost when the product has no batches) and the minimum price
+    allowed by the rule. Entries are cached per (shop, product) under
+    tenant and shop version counters, which are bumped when batches, shop
+    costs or margin rules change.
+    """
+    
+    @staticmethod
+    def _tenant_version_key(tenant_id):
+        """Cache key of the tenant-wide invalidation counter"""
+        return f'margin_index:tenant:{tenant_id}'
+    
+    @staticmethod
+    def _shop_version_key(shop_id):
+        """Cache key of the per-shop invalidation counter"""
+        return f'margin_index:shop:{shop_id}'
+    
+    @staticmethod
+    def entries(shop, product_ids):
+        """
+        Margin entries for a set of products at a shop, as {product_id: MarginEntry}
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return {}
+        
+        prefix = 'margin_index:{}:{}:{}:{}'.format(
+            shop.tenant_id,
+            _version(MarginIndex._tenant_version_key(shop.tenant_id)),
+            shop.id,
+            _version(MarginIndex._shop_version_key(shop.id)),
+        )
+        keys = {f'{prefix}:{product_id}': product_id for product_id in product_ids}
+        cached = cache.get_many(keys.keys())
+        
+        entries = {keys[key]: entry for key, entry in cached.items()}
+        missing = product_ids - entries.keys()
+        if missing:
+            compiled = MarginIndex.compile(shop, missing)
+            entries.update(compiled)
+            cache.set_many(
+                {f'{prefix}:{product_id}': entry for product_id, entry in compiled.items()},
+                _timeout()
+            )
+        return entries
+    
+    @staticmethod
+    def entry(shop, product_id):
+        """
+        Margin entry for a single product at a shop
+        """
+        return MarginIndex.entries(shop, [product_id])[product_id]
+    
+    @staticmethod
+    def compile(shop, product_ids):
+        """
+        Build margin entries from the database (three queries for any number of products)
+        """
+        batch_costs = dict(
+            Batch.objects.filter(
+                tenant_id=shop.tenant_id,
+                product_id__in=product_ids,
+                is_active=True
+            ).values('product_id').annotate(
+                max_cost=Max('unit_cost')
+            ).values_list('product_id', 'max_cost')
+        )
+        
+        shop_costs = {}
+        for product_id, unit_cost in ShopProductCost.objects.filter(
+            shop=shop,
+            product_id__in=product_ids,
+            is_active=True
+        ).order_by('product_id', '-effective_from').values_list('product_id', 'unit_cost'):
+            shop_costs.setdefault(product_id, unit_cost)
+        
+        product_rules = {}
+        shop_rule = None
+        for rule in MarginRule.objects.filter(
+            tenant_id=shop.tenant_id,
+            shop=shop,
+            is_active=True
+        ).order_by('-updated_at'):
+            compiled = CompiledMarginRule(rule.id, rule.minimum_margin_percent, rule.behavior)
+            if rule.product_id is None:
+                shop_rule = shop_rule or compiled
+            elif rule.product_id in product_ids:
+                product_rules.setdefault(rule.product_id, compiled)
+        
+        entries = {}
+        for product_id in product_ids:
+            highest_cost = batch_costs.get(product_id, shop_costs.get(product_id))
+            rule = product_rules.get(product_id, shop_rule)
+            entries[product_id] = MarginEntry(
+                highest_cost=highest_cost,
+                rule=rule,
+                minimum_price=MarginIndex.minimum_price(rule, highest_cost),
+            )
+        return entries
+    
+    @staticmethod
+    def minimum_price(rule, cost):
+        """
+        Lowest price that satisfies a blocking or warning margin rule
+        """
+        if rule is None or rule.behavior == 'allow' or not cost or cost <= 0:
+            return None
+        return cost * (1 + rule.minimum_margin_percent / Decimal('100'))
+    
+    @staticmethod
+    def invalidate_shop(shop_id):
+        """
+        Drop compiled entries for one shop
+        """
+        _bump(MarginIndex._shop_version_key(shop_id))
+    
+    @staticmethod
+    def invalidate_tenant(tenant_id):
+        """
+        Drop compiled entries for every shop of a tenant
+        """
+        _bump(MarginIndex._tenant_version_key(tenant_id))
+
+
+class PriceRuleIndex:
+    """
+    Compiled PriceRule resolution for one shop
+    
+    Rules that apply to the shop (its own and all-shop rules) are grouped by
+    product, with all-product rules merged into every product's group. Each
+    group is compiled into an interval index: the sorted effective-date
+    boundaries and the winning rule for each interval between them, so a
+    lookup is a binary search. Winners are chosen by priority, then
+    product-specific over all-product, shop-specific over all-shop, then
+    the latest effective_from.
+    """
+    
+    def __init__(self, rules):
+        generic = [rule for rule in rules if rule['product_id'] is None]
+        by_product = {}
+        for rule in rules:
+            if rule['product_id'] is not None:
+                by_product.setdefault(rule['product_id'], []).append(rule)
+        
+        self.default = self._compile_intervals(generic)
+        self.products = {
+            product_id: self._compile_intervals(product_rules + generic)
+            for product_id, product_rules in by_product.items()
+        }
+    
+    @staticmethod
+    def _compile_intervals(rules):
+        """
+        Split the timeline at every effective date and pick a winner per interval
+        """
+        boundaries = set()
+        for rule in rules:
+            boundaries.add(rule['effective_from'])
+            if rule['effective_to'] is not None:
+                boundaries.add(rule['effective_to'] + timedelta(days=1))
+        boundaries = sorted(boundaries)
+        
+        winners = []
+        for start in boundaries:
+            covering = [
+                rule for rule in rules
+                if rule['effective_from'] <= start
+                and (rule['effective_to'] is None or rule['effective_to'] >= start)
+            ]
+            if covering:
+                best = max(covering, key=lambda rule: (
+                    rule['priority'],
+                    rule['product_id'] is not None,
+                    rule['shop_id'] is not None,
+                    rule['effective_from'],
+                ))
+                winners.append(CompiledPriceRule(
+                    best['id'], best['unit_price'], best['price_multiplier'], best['priority']
+                ))
+            else:
+                winners.append(None)
+        return boundaries, winners
+    
+    def resolve(self, product_id, at):
+        """
+        Winning CompiledPriceRule for a product on a date, or None
+        """
+        boundaries, winners = self.products.get(product_id, self.default)
+        position = bisect_right(boundaries, at) - 1
+        if position < 0:
+            return None
+        return winners[position]
+    
+    @staticmethod
+    def for_shop(shop):
+        """
+        Compiled index for a shop, built once per shop and rule version
+        """
+        key = 'price_index:{}:{}:{}:{}'.format(
+            shop.tenant_id,
+            _version(PriceRuleIndex._tenant_version_key(shop.tenant_id)),
+            shop.id,
+            _version(PriceRuleIndex._shop_version_key(shop.id)),
+        )
+        index = cache.get(key)
+        if index is None:
+            rules = list(PriceRule.objects.filter(
+                Q(shop=shop) | Q(shop__isnull=True),
+                tenant_id=shop.tenant_id,
+                is_active=True
+            ).values(
+                'id', 'shop_id', 'product_id', 'unit_price', 'price_multiplier',
+                'effective_from', 'effective_to', 'priority'
+            ))
+            index = PriceRuleIndex(rules)
+            cache.set(key, index, _timeout())
+        return index
+    
+    @staticmethod
+    def _tenant_version_key(tenant_id):
+        """Cache key of the tenant-wide invalidation counter"""
+        return f'price_index:tenant:{tenant_id}'
+    
+    @staticmethod
+    def _shop_version_key(shop_id):
+        """Cache key of the per-shop invalidation counter"""
+        return f'price_index:shop:{shop_id}'
+    
+    @staticmethod
+    def invalidate_shop(shop_id):
+        """
+        Drop the compiled index of one shop
+        """
+        _bump(PriceRuleIndex._shop_version_key(shop_id))
+    
+    @staticmethod
+    def invalidate_tenant(tenant_id):
+        """
+        Drop the compiled indexes of every shop of a tenant
+        """
+        _bump(PriceRuleIndex._tenant_version_key(tenant_id))
@@ -2,7 +2,7 @@ from rest_framework import serializers
 from .models import (
     Shift, Sale, SaleItem, Payment, Refund, RefundItem,
     ShopProductCost, PriceRule, MarginRule,
-    Customer, CreditAccount, CreditTransaction
+    Customer, CreditAccount, CreditTransaction, OfflineBundle
 )
 
 
@@ -116,6 +116,18 @@ class PriceRuleSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class SaleProcessRequestSerializer(serializers.Serializer):
+    """Serializer for the fields of a sale request checked before processing"""
+    client_sale_id = serializers.UUIDField(required=False, allow_null=True)
+
+
+class PriceQuoteRequestSerializer(serializers.Serializer):
+    """Serializer for cart price quote requests"""
+    shop = serializers.UUIDField()
+    product_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=500)
+    at = serializers.DateField(required=False)
+
+
 class MarginRuleSerializer(serializers.ModelSerializer):
     shop_name = serializers.CharField(source='shop.name', read_only=True, allow_null=True)
     product_name = serializers.CharField(source='product.name', read_only=True, allow_null=True)
@@ -167,3 +179,13 @@ class CreditAccountSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at']
         read_only_fields = ['id', 'available_credit', 'created_at', 'updated_at']
 
+
+class OfflineBundleSerializer(serializers.ModelSerializer):
+    shop_name = serializers.CharField(source='shop.name', read_only=True)
+    
+    class Meta:
+        model = OfflineBundle
+        fields = ['id', 'tenant', 'shop', 'shop_name', 'schema_version', 'cursor', 'prices_on',
+                  'row_counts', 'size', 'sha256', 'last_build', 'last_error', 'built_at',
+                  'created_at', 'updated_at']
+        read_only_fields = fields
@@ -1,14 +1,20 @@
 """
 Business logic services for sales and POS
 """
-from django.db import transaction
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction, IntegrityError
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from decimal import Decimal
 import uuid
-from .models import Sale, SaleItem, Payment, Shift
+from .models import Sale, SaleItem, Payment, Shift, Customer
+from .pricing import MarginIndex, PriceRuleIndex
 from inventory.services import InventoryService
-from inventory.models import StockBalance
+from inventory.models import Batch, Product
+from core.models import Location
 from core.validators import InventoryValidator, PricingValidator, CreditValidator
+from config.cache import ConfigCache
 from notifications.services import NotificationService
 
 
@@ -22,9 +28,19 @@ class SalesService:
     def process_sale(sale_data, items_data, payments_data, user):
         """
         Process a complete sale transaction
+        
+        Cart lines are processed as a set: stock balances, costs and margin
+        rules for the whole cart are loaded in a few queries, the affected
+        stock balances are locked once, and sale items and ledger entries
+        are written with bulk inserts.
+        
+        ``sale_data['sold_at']`` is when a till recorded an offline sale; it
+        becomes the sale's created_at, which reports and sales velocity read.
         """
+        sold_at = sale_data.get('sold_at')
+        
         # Generate sale number
-        sale_number = f"SALE-{timezone.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+        sale_number = f"SALE-{(sold_at or timezone.now()).strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
         
         # Create sale
         sale = Sale.objects.create(
@@ -35,102 +51,79 @@ class SalesService:
             shift=sale_data.get('shift'),
             customer=sale_data.get('customer'),
             is_offline=sale_data.get('is_offline', False),
+            synced_at=sale_data.get('synced_at'),
+            client_sale_id=sale_data.get('client_sale_id'),
             notes=sale_data.get('notes', '')
         )
+        if sold_at:
+            # created_at is auto_now_add, so the till's time is set afterwards
+            Sale.objects.filter(id=sale.id).update(created_at=sold_at)
+            sale.created_at = sold_at
         
-        subtotal = Decimal('0')
-        discount_total = Decimal('0')
+        lines = SalesService._build_lines(items_data)
+        lines, allocated_balances = SalesService._allocate_batches(sale.shop, lines)
+        context = SalesService._load_cart_context(sale.shop, lines, allocated_balances)
         
-        # Process items
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = Decimal(str(item_data['quantity']))
-            unit_price = Decimal(str(item_data['unit_price']))
-            discount = Decimal(str(item_data.get('discount_amount', 0)))
-            batch = item_data.get('batch')
-            
-            # Get stock balance for validation and cost calculation
-            available, stock_balance_qty = InventoryValidator.validate_stock_availability(
-                sale.shop, product, quantity, batch
-            )
+        # Validate stock per (product, batch), summing repeated cart lines
+        requested = {}
+        for line in lines:
+            requested.setdefault(line['key'], [line['product'], Decimal('0')])[1] += line['quantity']
+        
+        for key, (product, quantity) in requested.items():
+            stock_balance = context['balances'].get(key)
+            available = stock_balance.available_quantity if stock_balance else Decimal('0')
             
-            # Get stock balance object
-            stock_balance_obj = None
+            # Validate stock availability and negative stock rules
             try:
-                stock_balance_obj = StockBalance.objects.get(
-                    location=sale.shop,
-                    product=product,
-                    batch=batch
+                InventoryValidator.check_negative_stock(
+                    sale.shop,
+                    context['config'],
+                    available,
+                    quantity
+                )
+            except DjangoValidationError:
+                # Block mode
+                raise ValueError(
+                    f"Insufficient stock for {product.name}. "
+                    f"Available: {available}"
                 )
-            except StockBalance.DoesNotExist:
-                pass
-            
-            # Validate stock availability and negative stock rules
-            is_valid, warning = InventoryValidator.validate_negative_stock(
-                sale.shop,
-                product,
-                quantity,
-                batch
-            )
             
-            if not is_valid:
-                if warning:
-                    # Warning mode - log but continue
-                    pass
-                else:
-                    # Block mode - raise error
-                    raise ValueError(
-                        f"Insufficient stock for {product.name}. "
-                        f"Available: {stock_balance_qty}"
-                    )
+            on_hand = stock_balance.quantity_on_hand if stock_balance else Decimal('0')
+            if on_hand - quantity < 0:
+                raise ValueError(f"Insufficient stock. Available: {on_hand}")
+        
+        subtotal = Decimal('0')
+        discount_total = Decimal('0')
+        sale_items = []
+        movements = []
+        
+        # Process items
+        for line in lines:
+            product = line['product']
+            batch = line['batch']
+            quantity = line['quantity']
+            unit_price = line['unit_price']
+            discount = line['discount']
+            stock_balance = context['balances'][line['key']]
             
             # Get unit cost
-            unit_cost = None
-            if stock_balance_obj:
-                unit_cost = stock_balance_obj.average_cost
-            elif batch:
-                unit_cost = batch.unit_cost
-            else:
-                # Try to get from shop cost
-                from sales.models import ShopProductCost
-                shop_cost = ShopProductCost.objects.filter(
-                    shop=sale.shop,
-                    product=product,
-                    is_active=True
-                ).first()
-                if shop_cost:
-                    unit_cost = shop_cost.unit_cost
+            unit_cost = stock_balance.average_cost
             
             # Validate margin rules
-            is_valid, warning = PricingValidator.validate_margin(
-                sale.shop,
-                product,
-                unit_price,
-                batch
-            )
+            margin_entry = context['margin_entries'][product.id]
+            is_valid, warning = PricingValidator.check_margin_entry(margin_entry, unit_price, batch)
             
             if not is_valid:
                 if warning:
                     # Warning mode - send notification
-                    # Get margin rule for required margin
-                    from sales.models import MarginRule
-                    margin_rule = MarginRule.objects.filter(
-                        tenant=sale.tenant,
-                        shop=sale.shop,
-                        product=product,
-                        is_active=True
-                    ).first()
-                    required_margin = margin_rule.minimum_margin_percent if margin_rule else Decimal('0')
-                    
-                    # Calculate actual margin
-                    cost = batch.unit_cost if batch else (stock_balance_obj.average_cost if stock_balance_obj else (unit_cost or Decimal('0')))
+                    cost = batch.unit_cost if batch else (unit_cost or Decimal('0'))
                     if cost > 0:
                         actual_margin = ((unit_price - cost) / cost) * 100
                         NotificationService.notify_margin_violation(
                             sale.shop,
                             product,
                             float(actual_margin),
-                            float(required_margin)
+                            float(margin_entry.rule.minimum_margin_percent)
                         )
                 else:
                     # Block mode - raise error
@@ -139,8 +132,7 @@ class SalesService:
             # Calculate line total
             line_total = (unit_price * quantity) - discount
             
-            # Create sale item
-            sale_item = SaleItem.objects.create(
+            sale_items.append(SaleItem(
                 sale=sale,
                 product=product,
                 batch=batch,
@@ -149,27 +141,28 @@ class SalesService:
                 unit_cost=unit_cost,
                 discount_amount=discount,
                 line_total=line_total,
-                notes=item_data.get('notes', '')
-            )
+                notes=line['notes']
+            ))
             
-            # Update inventory
-            InventoryService.create_ledger_entry(
-                tenant=sale.tenant,
-                location=sale.shop,
-                product=product,
-                batch=batch,
-                transaction_type='sale',
-                quantity_out=quantity,
-                unit_cost=unit_cost,
-                reference_id=sale.id,
-                reference_type='sale',
-                notes=f'Sale {sale.sale_number}',
-                created_by=user
-            )
+            movements.append({
+                'location': sale.shop,
+                'product': product,
+                'batch': batch,
+                'transaction_type': 'sale',
+                'reference_id': sale.id,
+                'reference_type': 'sale',
+                'quantity_out': quantity,
+                'unit_cost': unit_cost,
+                'notes': f'Sale {sale.sale_number}',
+                'created_by': user,
+            })
             
             subtotal += line_total
             discount_total += discount
         
+        SaleItem.objects.bulk_create(sale_items)
+        InventoryService.create_ledger_entries(sale.tenant, movements, balances=context['locked_balances'])
+        
         # Process payments
         payment_total = Decimal('0')
         for payment_data in payments_data:
@@ -217,4 +210,378 @@ class SalesService:
         sale.save()
         
         return sale
+    
+    @staticmethod
+    def sync_offline_sales(tenant, sales_data, user, chunk_size=None):
+        """
+        Ingest a batch of sales recorded by a till while offline
+        
+        Each sale carries a client-generated ``client_sale_id`` and may carry
+        ``sold_at``, the ISO 8601 time the till recorded it (stored as the
+        sale's created_at, never later than the sync). Sales that were
+        already ingested are reported as duplicates, malformed ones fail on
+        their own, and the rest are processed in chunked transactions with
+        one savepoint per sale so a bad sale does not roll back its
+        neighbours.
+        Returns one result dict per submitted sale, in submission order.
+        """
+        config = ConfigCache.system(tenant.id)
+        if config and not config.enable_offline_mode:
+            raise ValueError("Offline mode is disabled for this tenant")
+        
+        if len(sales_data) > settings.OFFLINE_SYNC_MAX_SALES:
+            raise ValueError(f"Cannot sync more than {settings.OFFLINE_SYNC_MAX_SALES} sales at once")
+        
+        chunk_size = chunk_size or settings.OFFLINE_SYNC_CHUNK_SIZE
+        results = [None] * len(sales_data)
+        pending = []
+        seen = {}
+        
+        for index, entry in enumerate(sales_data):
+            try:
+                client_sale_id = uuid.UUID(str(entry.get('client_sale_id')))
+            except (TypeError, ValueError, AttributeError):
+                results[index] = {
+                    'client_sale_id': entry.get('client_sale_id') if isinstance(entry, dict) else None,
+                    'status': 'failed',
+                    'error': 'A valid client_sale_id is required',
+                }
+                continue
+            
+            error = SalesService._payload_error(entry)
+            if error:
+                results[index] = {'client_sale_id': str(client_sale_id), 'status': 'failed', 'error': error}
+                continue
+            
+            if client_sale_id in seen:
+                # Repeated within the same payload - report against the first copy
+                results[index] = {
+                    'client_sale_id': str(client_sale_id),
+                    'status': 'duplicate',
+                    'duplicate_of_index': seen[client_sale_id],
+                }
+                continue
+            seen[client_sale_id] = index
+            pending.append((index, client_sale_id, entry))
+        
+        # Dedupe against sales that were already ingested
+        existing = {
+            row[0]: row for row in Sale.objects.filter(
+                tenant=tenant,
+                client_sale_id__in=[client_sale_id for _, client_sale_id, _ in pending]
+            ).values_list('client_sale_id', 'id', 'sale_number')
+        }
+        to_process = []
+        for index, client_sale_id, entry in pending:
+            if client_sale_id in existing:
+                _, sale_id, sale_number = existing[client_sale_id]
+                results[index] = SalesService._sync_result(client_sale_id, 'duplicate', sale_id, sale_number)
+            else:
+                to_process.append((index, client_sale_id, entry))
+        
+        references = SalesService._resolve_sale_references(tenant, [entry for _, _, entry in to_process])
+        synced_at = timezone.now()
+        
+        for start in range(0, len(to_process), chunk_size):
+            with transaction.atomic():
+                for index, client_sale_id, entry in to_process[start:start + chunk_size]:
+                    try:
+                        sale_data, items_data = SalesService.sale_data_from_payload(tenant, entry, references)
+                        sale_data.update(
+                            client_sale_id=client_sale_id,
+                            is_offline=True,
+                            synced_at=synced_at,
+                            sold_at=SalesService._sold_at(entry.get('sold_at'), synced_at),
+                        )
+                        # process_sale runs in a nested atomic block, i.e. a savepoint
+                        sale = SalesService.process_sale(
+                            sale_data=sale_data,
+                            items_data=items_data,
+                            payments_data=entry.get('payments', []),
+                            user=user
+                        )
+                        results[index] = SalesService._sync_result(client_sale_id, 'created', sale.id, sale.sale_number)
+                    except IntegrityError:
+                        # Ingested concurrently by another sync request
+                        sale = Sale.objects.filter(tenant=tenant, client_sale_id=client_sale_id).first()
+                        if sale:
+                            results[index] = SalesService._sync_result(client_sale_id, 'duplicate', sale.id, sale.sale_number)
+                        else:
+                            results[index] = {'client_sale_id': str(client_sale_id), 'status': 'failed', 'error': 'Integrity error'}
+                    except Exception as e:
+                        error = '; '.join(e.messages) if isinstance(e, DjangoValidationError) else str(e)
+                        results[index] = {'client_sale_id': str(client_sale_id), 'status': 'failed', 'error': error}
+        
+        return results
+    
+    @staticmethod
+    def _sync_result(client_sale_id, status, sale_id, sale_number):
+        """
+        Result entry for a sale that exists on the server
+        """
+        return {
+            'client_sale_id': str(client_sale_id),
+            'status': status,
+            'sale_id': str(sale_id),
+            'sale_number': sale_number,
+        }
+    
+    @staticmethod
+    def _payload_error(entry):
+        """
+        Why a sale payload is malformed (its shape, not its values), or None
+        """
+        if not isinstance(entry, dict):
+            return 'Sale must be an object'
+        for field in ('items', 'payments'):
+            value = entry.get(field, [])
+            if not isinstance(value, list) or not all(isinstance(element, dict) for element in value):
+                return f"{field} must be a list of objects"
+        return None
+    
+    @staticmethod
+    def _sold_at(value, synced_at):
+        """
+        When a till recorded a sale, from its ISO 8601 timestamp
+        
+        Naive times are taken in the server's time zone, and a till clock
+        running ahead is capped at the sync time. None when not given.
+        """
+        if not value:
+            return None
+        sold_at = parse_datetime(value) if isinstance(value, str) else None
+        if sold_at is None:
+            raise ValueError(f"Invalid sold_at: {value}")
+        if timezone.is_naive(sold_at):
+            sold_at = timezone.make_aware(sold_at)
+        return min(sold_at, synced_at)
+    
+    @staticmethod
+    def _resolve_sale_references(tenant, entries):
+        """
+        Resolve every id referenced by sale payloads with one query per model
+        """
+        ids = {'shop': set(), 'shift': set(), 'customer': set(), 'product': set(), 'batch': set()}
+        for entry in entries:
+            for field in ('shop', 'shift', 'customer'):
+                if entry.get(field):
+                    ids[field].add(str(entry[field]))
+            for item in entry.get('items', []):
+                for field in ('product', 'batch'):
+                    if item.get(field):
+                        ids[field].add(str(item[field]))
+        
+        def by_id(queryset, values):
+            valid = []
+            for value in values:
+                try:
+                    valid.append(uuid.UUID(value))
+                except ValueError:
+                    continue
+            return {str(obj.id): obj for obj in queryset.filter(id__in=valid)}
+        
+        return {
+            'shop': by_id(Location.objects.filter(tenant=tenant, location_type='shop'), ids['shop']),
+            'shift': by_id(Shift.objects.filter(tenant=tenant), ids['shift']),
+            'customer': by_id(Customer.objects.filter(tenant=tenant), ids['customer']),
+            'product': by_id(Product.objects.filter(tenant=tenant), ids['product']),
+            'batch': by_id(Batch.objects.filter(tenant=tenant), ids['batch']),
+        }
+    
+    @staticmethod
+    def sale_data_from_payload(tenant, entry, references=None):
+        """
+        Build process_sale arguments from a request payload of ids
+        
+        ``references`` are the preloaded objects from _resolve_sale_references;
+        they are loaded for this payload alone when not given.
+        """
+        error = SalesService._payload_error(entry)
+        if error:
+            raise ValueError(error)
+        if references is None:
+            references = SalesService._resolve_sale_references(tenant, [entry])
+        
+        def resolve(field, value, required=False):
+            if not value:
+                if required:
+                    raise ValueError(f"{field} is required")
+                return None
+            obj = references[field].get(str(value))
+            if obj is None:
+                raise ValueError(f"Unknown {field}: {value}")
+            return obj
+        
+        sale_data = {
+            'tenant': tenant,
+            'shop': resolve('shop', entry.get('shop'), required=True),
+            'shift': resolve('shift', entry.get('shift')),
+            'customer': resolve('customer', entry.get('customer')),
+            'notes': entry.get('notes', ''),
+        }
+        items_data = []
+        for item in entry.get('items', []):
+            items_data.append({
+                **item,
+                'product': resolve('product', item.get('product'), required=True),
+                'batch': resolve('batch', item.get('batch')),
+            })
+        if not items_data:
+            raise ValueError("Sale has no items")
+        return sale_data, items_data
+    
+    @staticmethod
+    def _build_lines(items_data):
+        """
+        Normalise cart lines from request data
+        """
+        lines = []
+        for item_data in items_data:
+            product = item_data['product']
+            batch = item_data.get('batch')
+            lines.append({
+                'key': (product.id, batch.id if batch else None),
+                'product': product,
+                'batch': batch,
+                'quantity': Decimal(str(item_data['quantity'])),
+                'unit_price': Decimal(str(item_data['unit_price'])),
+                'discount': Decimal(str(item_data.get('discount_amount', 0))),
+                'notes': item_data.get('notes', ''),
+            })
+        return lines
+    
+    @staticmethod
+    def _allocate_batches(shop, lines):
+        """
+        Pick batches server-side for batch-tracked lines scanned without one
+        
+        The quantity of each such product is split across the shop's batches
+        using the tenant's allocation strategy (FEFO by default), and lines
+        are split per batch with their discount shared pro rata. Quantity no
+        batch can cover is drawn from unbatched stock, where the usual stock
+        checks accept or reject it. Returns the new lines and the balances
+        locked while allocating.
+        """
+        config = ConfigCache.system(shop.tenant_id)
+        if config and not config.track_batches:
+            return lines, {}
+        
+        quantities = {}
+        for line in lines:
+            if line['batch'] is None and line['product'].track_batches:
+                quantities[line['product']] = quantities.get(line['product'], Decimal('0')) + line['quantity']
+        if not quantities:
+            return lines, {}
+        
+        allocations, locked_balances, shortfall = InventoryService.allocate_batches(
+            shop,
+            quantities,
+            strategy=config.batch_allocation_strategy if config else 'fefo'
+        )
+        for product_id, quantity in shortfall.items():
+            allocations[product_id].append((None, quantity))
+        
+        allocated_lines = []
+        for line in lines:
+            if line['batch'] is not None or line['product'] not in quantities:
+                allocated_lines.append(line)
+                continue
+            
+            # Consume this line's quantity from the product's picks, in order
+            picks = allocations[line['product'].id]
+            remaining = line['quantity']
+            discount_left = line['discount']
+            while remaining > 0:
+                batch, available = picks[0]
+                part = min(available, remaining)
+                if part == available:
+                    picks.pop(0)
+                else:
+                    picks[0] = (batch, available - part)
+                remaining -= part
+                
+                if remaining > 0:
+                    discount = (line['discount'] * part / line['quantity']).quantize(Decimal('0.01'))
+                else:
+                    discount = discount_left
+                discount_left -= discount
+                allocated_lines.append({
+                    **line,
+                    'key': (line['product'].id, batch.id if batch else None),
+                    'batch': batch,
+                    'quantity': part,
+                    'discount': discount,
+                })
+        return allocated_lines, locked_balances
+    
+    @staticmethod
+    def _load_cart_context(shop, lines, locked_balances=None):
+        """
+        Load everything needed to validate and cost a cart in a few queries
+        
+        Stock balances touched by the cart are locked in primary key order so
+        concurrent tills selling the same SKUs cannot deadlock; balances
+        already locked by the caller are not locked again. Margin floors
+        come from the compiled MarginIndex, so a warm cart costs a single
+        cache lookup for pricing.
+        """
+        product_ids = {line['product'].id for line in lines}
+        
+        locked_balances = dict(locked_balances or {})
+        missing = [
+            (shop, line['product'], line['batch']) for line in lines
+            if InventoryService.balance_key(shop, line['product'], line['batch']) not in locked_balances
+        ]
+        if missing:
+            locked_balances.update(InventoryService.lock_balances(missing))
+        balances = {
+            (product_id, batch_id): balance
+            for (_, product_id, batch_id), balance in locked_balances.items()
+        }
+        
+        return {
+            'config': ConfigCache.system(shop.tenant_id),
+            'balances': balances,
+            'locked_balances': locked_balances,
+            'margin_entries': MarginIndex.entries(shop, product_ids),
+        }
 
+
+class PricingService:
+    """Service for resolving selling prices"""
+    
+    @staticmethod
+    def quote(shop, product_ids, at=None):
+        """
+        Resolve the winning PriceRule and selling price for a whole cart
+        
+        Returns one quote per product id, in the order given. A rule with a
+        unit_price sets the price directly; a rule with a price_multiplier is
+        applied to the product's highest batch cost. Products without a
+        winning rule (or without a cost to multiply) get a unit_price of None.
+        """
+        at = at or timezone.localdate()
+        product_ids = list(dict.fromkeys(product_ids))
+        index = PriceRuleIndex.for_shop(shop)
+        margin_entries = MarginIndex.entries(shop, product_ids)
+        
+        quotes = []
+        for product_id in product_ids:
+            rule = index.resolve(product_id, at)
+            margin_entry = margin_entries[product_id]
+            
+            unit_price = None
+            if rule is not None:
+                if rule.unit_price is not None:
+                    unit_price = rule.unit_price
+                elif rule.price_multiplier is not None and margin_entry.highest_cost is not None:
+                    unit_price = (margin_entry.highest_cost * rule.price_multiplier).quantize(Decimal('0.01'))
+            
+            quotes.append({
+                'product': product_id,
+                'unit_price': unit_price,
+                'price_rule': rule.id if rule else None,
+                'minimum_price': margin_entry.minimum_price,
+            })
+        
+        return quotes
@@ -0,0 +1,86 @@
+"""
+Signals for sales
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import Location, Tenant
+from inventory.models import Batch, Product
+from .models import CatalogTombstone, Customer, ShopProductCost, MarginRule, PriceRule
+from .pricing import MarginIndex, PriceRuleIndex
+
+
+@receiver([post_save, post_delete], sender=MarginRule)
+@receiver([post_save, post_delete], sender=ShopProductCost)
+def invalidate_shop_margin_index(sender, instance, **kwargs):
+    """
+    Recompile margin floors of the affected shop once the change is committed
+    """
+    if instance.shop_id:
+        transaction.on_commit(lambda: MarginIndex.invalidate_shop(instance.shop_id))
+    else:
+        transaction.on_commit(lambda: MarginIndex.invalidate_tenant(instance.tenant_id))
+
+
+@receiver([post_save, post_delete], sender=Batch)
+def invalidate_tenant_margin_index(sender, instance, **kwargs):
+    """
+    Batch costs feed the margin floor of every shop in the tenant
+    """
+    transaction.on_commit(lambda: MarginIndex.invalidate_tenant(instance.tenant_id))
+
+
+@receiver([post_save, post_delete], sender=PriceRule)
+def invalidate_price_rule_index(sender, instance, **kwargs):
+    """
+    Recompile price rules of the affected shop (or all shops) once committed
+    """
+    if instance.shop_id:
+        transaction.on_commit(lambda: PriceRuleIndex.invalidate_shop(instance.shop_id))
+    else:
+        transaction.on_commit(lambda: PriceRuleIndex.invalidate_tenant(instance.tenant_id))
+
+
+def _record_tombstone(section, instance, shop_id=None):
+    """
+    Record a deleted catalog row once the deletion is committed
+    
+    Rows deleted along with their tenant or shop need no tombstone (and
+    could not reference it).
+    """
+    tenant_id = instance.tenant_id
+    object_id = instance.pk
+    
+    def record():
+        if not Tenant.objects.filter(id=tenant_id).exists():
+            return
+        if shop_id and not Location.objects.filter(id=shop_id).exists():
+            return
+        CatalogTombstone.objects.create(tenant_id=tenant_id, shop_id=shop_id, section=section, object_id=object_id)
+    
+    transaction.on_commit(record)
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    _record_tombstone('products', instance)
+
+
+@receiver(post_delete, sender=Batch)
+def record_batch_tombstone(sender, instance, **kwargs):
+    _record_tombstone('batches', instance)
+
+
+@receiver(post_delete, sender=ShopProductCost)
+def record_cost_tombstone(sender, instance, **kwargs):
+    _record_tombstone('costs', instance, shop_id=instance.shop_id)
+
+
+@receiver(post_delete, sender=PriceRule)
+def record_price_rule_tombstone(sender, instance, **kwargs):
+    _record_tombstone('price_rules', instance, shop_id=instance.shop_id)
+
+
+@receiver(post_delete, sender=Customer)
+def record_customer_tombstone(sender, instance, **kwargs):
+    _record_tombstone('customers', instance)
@@ -0,0 +1,33 @@
+"""
+Periodic tasks for sales
+"""
+from celery import shared_task
+from .catalog import tombstones_kept_since
+from .models import CatalogTombstone
+from .offline_bundle import offline_shops, refresh_bundle
+
+
+@shared_task(ignore_result=True)
+def purge_catalog_tombstones():
+    """
+    Delete tombstones older than any cursor still answered with a delta
+    """
+    deleted, _ = CatalogTombstone.objects.filter(deleted_at__lt=tombstones_kept_since()).delete()
+    return deleted
+
+
+@shared_task(ignore_result=True)
+def build_offline_bundle(shop_id, full=False):
+    """
+    Build or update the offline bundle of one shop
+    """
+    refresh_bundle(shop_id, full=full)
+
+
+@shared_task(ignore_result=True)
+def build_offline_bundles():
+    """
+    Bring the offline bundle of every shop in offline mode up to date
+    """
+    shop_ids = offline_shops().values_list('id', flat=True)
+    return sum(1 for shop_id in shop_ids if refresh_bundle(shop_id))
@@ -0,0 +1,192 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from config.models import SystemConfiguration
+from core.models import Location, Tenant, User
+from inventory.models import Batch, InventoryLedger, Product, StockBalance
+from inventory.services import InventoryService
+from .models import Sale
+from .services import SalesService
+
+
+class SalesTestCase(TestCase):
+    """A tenant with a shop, an attendant and an unbatched product"""
+    
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name='Shop', slug='shop')
+        self.config = SystemConfiguration.objects.create(tenant=self.tenant)
+        self.shop = Location.objects.create(tenant=self.tenant, name='Shop', code='SH', location_type='shop')
+        self.user = User.objects.create_user(username='attendant', password='secret', tenant=self.tenant)
+        self.bread = Product.objects.create(tenant=self.tenant, name='Bread', sku='BREAD', track_batches=False)
+    
+    def receive(self, product, quantity, batch=None, reserved='0'):
+        InventoryService.create_ledger_entry(
+            tenant=self.tenant,
+            location=self.shop,
+            product=product,
+            batch=batch,
+            transaction_type='adjustment',
+            quantity_in=Decimal(quantity),
+            quantity_reserved=Decimal(reserved),
+            unit_cost=Decimal('1'),
+            reference_type='test',
+        )
+    
+    def sell(self, *lines):
+        items = [{'product': product, 'quantity': quantity, 'unit_price': '2'} for product, quantity in lines]
+        total = sum(Decimal(quantity) * 2 for _, quantity in lines)
+        return SalesService.process_sale(
+            sale_data={'tenant': self.tenant, 'shop': self.shop},
+            items_data=items,
+            payments_data=[{'payment_method': 'cash', 'amount': str(total)}],
+            user=self.user,
+        )
+    
+    def on_hand(self, product, batch=None):
+        return StockBalance.objects.get(location=self.shop, product=product, batch=batch).quantity_on_hand
+
+
+class ProcessSaleTests(SalesTestCase):
+    def test_repeated_lines_are_sold_together(self):
+        self.receive(self.bread, '10')
+        
+        sale = self.sell((self.bread, '3'), (self.bread, '4'))
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('3'))
+        self.assertEqual(sale.items.count(), 2)
+        entries = InventoryLedger.objects.filter(reference_id=sale.id).order_by('quantity_on_hand')
+        self.assertEqual([entry.quantity_out for entry in entries], [Decimal('4'), Decimal('3')])
+        self.assertEqual([entry.quantity_on_hand for entry in entries], [Decimal('3'), Decimal('7')])
+    
+    def test_repeated_lines_are_checked_against_stock_together(self):
+        self.receive(self.bread, '5')
+        
+        with self.assertRaisesMessage(ValueError, 'Insufficient stock for Bread'):
+            self.sell((self.bread, '3'), (self.bread, '3'))
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('5'))
+        self.assertFalse(Sale.objects.exists())
+    
+    def test_block_mode_refuses_reserved_stock(self):
+        self.receive(self.bread, '5', reserved='3')
+        
+        with self.assertRaisesMessage(ValueError, 'Available: 2'):
+            self.sell((self.bread, '4'))
+    
+    def test_warn_mode_sells_reserved_stock(self):
+        self.shop.negative_stock_behavior = 'warn'
+        self.shop.save()
+        self.receive(self.bread, '5', reserved='3')
+        
+        self.sell((self.bread, '4'))
+        
+        self.assertEqual(self.on_hand(self.bread), Decimal('1'))
+    
+    def test_warn_mode_never_sells_below_zero(self):
+        self.shop.negative_stock_behavior = 'warn'
+        self.shop.save()
+        self.receive(self.bread, '5')
+        
+        with self.assertRaisesMessage(ValueError, 'Insufficient stock'):
+            self.sell((self.bread, '6'))
+        self.assertEqual(self.on_hand(self.bread), Decimal('5'))
+
+
+class ProcessSaleViewTests(SalesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_superuser = True
+        self.user.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def post(self, quantity, **headers):
+        return self.client.post('/api/sales/sales/process/', {
+            'shop': str(self.shop.id),
+            'items': [{'product': str(self.bread.id), 'quantity': quantity, 'unit_price': '2'}],
+            'payments': [{'payment_method': 'cash', 'amount': str(quantity * 2)}],
+        }, format='json', headers=headers)
+    
+    def test_oversell_in_block_mode_is_a_bad_request(self):
+        self.receive(self.bread, '2')
+        
+        response = self.post(3, **{'Idempotency-Key': 'sale-1'})
+        replayed = self.post(3, **{'Idempotency-Key': 'sale-1'})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient stock', response.data['error'])
+        self.assertEqual(replayed.status_code, 400)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.on_hand(self.bread), Decimal('2'))
+
+
+class BatchAllocationTests(SalesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pie = Product.objects.create(tenant=self.tenant, name='Pie', sku='PIE')
+        kitchen = Location.objects.create(tenant=self.tenant, name='Kitchen', code='K', location_type='production')
+        today = timezone.localdate()
+        
+        def batch(number, produced, expires):
+            batch = Batch.objects.create(
+                tenant=self.tenant, product=self.pie, batch_number=number, production_location=kitchen,
+                production_date=today + timedelta(days=produced), expiry_date=today + timedelta(days=expires),
+                quantity=Decimal('3'), bulk_price=Decimal('3'), unit_cost=Decimal('1'),
+            )
+            self.receive(self.pie, '3', batch=batch)
+            return batch
+        
+        self.expired = batch('EXPIRED', -9, -1)
+        self.older = batch('OLDER', -5, 10)
+        self.newer = batch('NEWER', -3, 5)
+    
+    def picked(self, sale):
+        return sorted(
+            (item.batch.batch_number if item.batch else '', item.quantity) for item in sale.items.select_related('batch')
+        )
+    
+    def assertPicked(self, sale, expected):
+        picked = {}
+        for batch_number, quantity in self.picked(sale):
+            picked[batch_number] = picked.get(batch_number, Decimal('0')) + quantity
+        self.assertEqual(picked, {
+            batch.batch_number if batch else '': Decimal(quantity) for batch, quantity in expected.items()
+        })
+    
+    def test_fefo_draws_the_earliest_expiry_first(self):
+        sale = self.sell((self.pie, '4'))
+        
+        self.assertPicked(sale, {self.newer: '3', self.older: '1'})
+        self.assertEqual(self.on_hand(self.pie, self.expired), Decimal('3'))
+        self.assertEqual(self.on_hand(self.pie, self.older), Decimal('2'))
+    
+    def test_fifo_draws_the_earliest_production_first(self):
+        self.config.batch_allocation_strategy = 'fifo'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.save()
+        
+        sale = self.sell((self.pie, '4'))
+        
+        self.assertPicked(sale, {self.older: '3', self.newer: '1'})
+    
+    def test_repeated_lines_are_split_across_batches_in_order(self):
+        sale = self.sell((self.pie, '2'), (self.pie, '2'))
+        
+        self.assertEqual(self.picked(sale), [('NEWER', Decimal('1')), ('NEWER', Decimal('2')), ('OLDER', Decimal('1'))])
+    
+    def test_shortfall_is_drawn_from_unbatched_stock(self):
+        self.receive(self.pie, '2')
+        
+        sale = self.sell((self.pie, '8'))
+        
+        self.assertPicked(sale, {self.newer: '3', self.older: '3', None: '2'})
+        self.assertEqual(self.on_hand(self.pie), Decimal('0'))
+    
+    def test_more_than_the_unexpired_batches_hold_is_refused(self):
+        with self.assertRaisesMessage(ValueError, 'Insufficient stock for Pie'):
+            self.sell((self.pie, '7'))
+        
+        self.assertEqual(self.on_hand(self.pie, self.newer), Decimal('3'))
+        self.assertEqual(self.on_hand(self.pie, self.older), Decimal('3'))
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    ShiftViewSet, SaleViewSet, CustomerViewSet, CreditAccountViewSet
+    ShiftViewSet, SaleViewSet, CustomerViewSet, CreditAccountViewSet,
+    PriceQuoteViewSet, CatalogViewSet, OfflineBundleViewSet
 )
 
 router = DefaultRouter()
@@ -9,6 +10,9 @@ router.register(r'shifts', ShiftViewSet, basename='shift')
 router.register(r'sales', SaleViewSet, basename='sale')
 router.register(r'customers', CustomerViewSet, basename='customer')
 router.register(r'credit-accounts', CreditAccountViewSet, basename='credit-account')
+router.register(r'price-quote', PriceQuoteViewSet, basename='price-quote')
+router.register(r'catalog', CatalogViewSet, basename='catalog')
+router.register(r'offline-bundles', OfflineBundleViewSet, basename='offline-bundle')
 
 app_name = 'sales'
 
@@ -1,20 +1,28 @@
+import uuid
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.utils import timezone
+from django.http import FileResponse
+from django.utils.http import parse_etags
 from .models import (
     Shift, Sale, SaleItem, Payment, Refund, RefundItem,
-    Customer, CreditAccount, CreditTransaction
+    Customer, CreditAccount, CreditTransaction, OfflineBundle
 )
 from .serializers import (
     ShiftSerializer, SaleSerializer, SaleItemSerializer, PaymentSerializer,
     RefundSerializer, RefundItemSerializer,
-    CustomerSerializer, CreditAccountSerializer, CreditTransactionSerializer
+    CustomerSerializer, CreditAccountSerializer, CreditTransactionSerializer,
+    PriceQuoteRequestSerializer, SaleProcessRequestSerializer, OfflineBundleSerializer
 )
-from .services import SalesService
+from .services import SalesService, PricingService
+from .catalog import build_snapshot, from_cursor, snapshot_etag
+from .tasks import build_offline_bundle
+from config.cache import ConfigCache
 from core.permissions import IsTenantMember, IsShopManager, IsShopAttendant
+from core.idempotency import idempotent
 from core.validators import InventoryValidator, PricingValidator, CreditValidator
 from notifications.services import NotificationService
 
@@ -59,12 +67,23 @@ class SaleViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def process(self, request):
         """Process a complete sale"""
+        request_serializer = SaleProcessRequestSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        client_sale_id = request_serializer.validated_data.get('client_sale_id')
+        if client_sale_id:
+            # A retry of a sale that was recorded before its response got lost
+            existing = Sale.objects.filter(tenant=request.user.tenant, client_sale_id=client_sale_id).first()
+            if existing:
+                return Response(self.get_serializer(existing).data)
         try:
+            sale_data, items_data = SalesService.sale_data_from_payload(request.user.tenant, request.data)
+            sale_data['client_sale_id'] = client_sale_id
             sale = SalesService.process_sale(
-                sale_data=request.data,
-                items_data=request.data.get('items', []),
+                sale_data=sale_data,
+                items_data=items_data,
                 payments_data=request.data.get('payments', []),
                 user=request.user
             )
@@ -72,6 +91,27 @@ class SaleViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except ValueError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """Ingest a batch of offline sales identified by client_sale_id"""
+        sales_data = request.data.get('sales')
+        if not isinstance(sales_data, list):
+            return Response({'error': 'sales must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            results = SalesService.sync_offline_sales(
+                tenant=request.user.tenant,
+                sales_data=sales_data,
+                user=request.user
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        summary = {'created': 0, 'duplicate': 0, 'failed': 0}
+        for result in results:
+            summary[result['status']] += 1
+        return Response({**summary, 'results': results})
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
@@ -109,3 +149,118 @@ class CreditAccountViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = CreditTransactionSerializer(transactions, many=True)
         return Response(serializer.data)
 
+
+class PriceQuoteViewSet(viewsets.ViewSet):
+    """
+    ViewSet for quoting selling prices for a cart
+    """
+    permission_classes = [permissions.IsAuthenticated, IsTenantMember]
+    
+    def create(self, request):
+        """Resolve prices for every product in the cart in one pass"""
+        serializer = PriceQuoteRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        shop = ConfigCache.location(data['shop'])
+        if shop is None or shop.tenant_id != request.user.tenant_id or shop.location_type != 'shop':
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        quotes = PricingService.quote(shop, data['product_ids'], at=data.get('at'))
+        return Response({
+            'shop': shop.id,
+            'at': data.get('at') or timezone.localdate(),
+            'quotes': quotes,
+        })
+
+
+def _user_shop(request, shop_id):
+    """The shop of the user's tenant with this id, or None"""
+    try:
+        shop = ConfigCache.location(uuid.UUID(str(shop_id)))
+    except ValueError:
+        return None
+    if shop is None or shop.tenant_id != request.user.tenant_id or shop.location_type != 'shop':
+        return None
+    return shop
+
+
+class CatalogViewSet(viewsets.ViewSet):
+    """
+    ViewSet for the till's catalog of a shop
+    
+    GET catalog/<shop id>/ returns the full snapshot with an ETag (304 when
+    If-None-Match still matches); ?since=<cursor> returns only what changed
+    since that snapshot or delta.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsTenantMember]
+    
+    def retrieve(self, request, pk=None):
+        """Full catalog snapshot, or the changes since a cursor"""
+        shop = _user_shop(request, pk)
+        if shop is None:
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = from_cursor(since)
+            except (ValueError, OverflowError):
+                return Response({'error': 'since must be a cursor from an earlier snapshot'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response(build_snapshot(shop, since=since))
+        
+        etag = snapshot_etag(shop)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(build_snapshot(shop), headers={'ETag': etag})
+
+
+class OfflineBundleViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for the offline SQLite bundles of shops, looked up by shop id
+    """
+    serializer_class = OfflineBundleSerializer
+    permission_classes = [permissions.IsAuthenticated, IsTenantMember]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['shop', 'last_build']
+    ordering_fields = ['built_at', 'size']
+    ordering = ['-built_at']
+    lookup_field = 'shop'
+    
+    def get_queryset(self):
+        # Bundles carry customers' credit, so only the user's tenant is visible
+        return OfflineBundle.objects.filter(tenant_id=self.request.user.tenant_id).select_related('shop')
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, shop=None):
+        """Download the SQLite file (304 when If-None-Match holds its SHA-256)"""
+        bundle = self.get_object()
+        if not bundle.file:
+            return Response({'error': 'The bundle has not been built yet'}, status=status.HTTP_404_NOT_FOUND)
+        etag = f'"{bundle.sha256}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        response = FileResponse(
+            bundle.file.open('rb'),
+            as_attachment=True,
+            filename=f'{bundle.shop.code}-offline.sqlite3',
+            content_type='application/vnd.sqlite3',
+        )
+        response['ETag'] = etag
+        return response
+    
+    @action(detail=False, methods=['post'])
+    def build(self, request):
+        """Queue a build of a shop's bundle (full=true rebuilds it from scratch)"""
+        shop = _user_shop(request, request.data.get('shop'))
+        if shop is None:
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        full = str(request.data.get('full', '')).lower() in ('1', 'true', 'yes')
+        try:
+            build_offline_bundle.apply_async((str(shop.id), full), retry=False)
+        except Exception as e:
+            return Response({'error': f'Could not queue the build: {e}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'shop': shop.id, 'full': full, 'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
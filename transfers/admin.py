@@ -3,6 +3,7 @@ from .models import (
     Transfer, TransferItem, ShopOrder, ShopOrderItem,
     ReturnRequest, ReturnItem, Dispute, DisputeMessage
 )
+from .services import ShopOrderService
 
 
 class TransferItemInline(admin.TabularInline):
@@ -39,13 +40,18 @@ class ShopOrderItemInline(admin.TabularInline):
 
 @admin.register(ShopOrder)
 class ShopOrderAdmin(admin.ModelAdmin):
-    list_display = ['order_number', 'shop', 'store', 'state', 'created_at', 'created_by']
-    list_filter = ['state', 'shop', 'store', 'created_at']
+    list_display = ['order_number', 'shop', 'store', 'state', 'auto_generated', 'created_at', 'created_by']
+    list_filter = ['state', 'auto_generated', 'shop', 'store', 'created_at']
     search_fields = ['order_number']
     readonly_fields = ['id', 'created_at', 'updated_at']
     raw_id_fields = ['tenant', 'shop', 'store', 'created_by', 'submitted_by', 'approved_by']
     inlines = [ShopOrderItemInline]
     date_hierarchy = 'created_at'
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            ShopOrderService.mark_edited(form.instance.id)
 
 
 @admin.register(ShopOrderItem)
@@ -55,6 +61,20 @@ class ShopOrderItemAdmin(admin.ModelAdmin):
     search_fields = ['product__name', 'product__sku']
     readonly_fields = ['id']
     raw_id_fields = ['order', 'product']
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        ShopOrderService.mark_edited(obj.order_id)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShopOrderService.mark_edited(obj.order_id)
+    
+    def delete_queryset(self, request, queryset):
+        order_ids = set(queryset.values_list('order_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for order_id in order_ids:
+            ShopOrderService.mark_edited(order_id)
 
 
 class ReturnItemInline(admin.TabularInline):
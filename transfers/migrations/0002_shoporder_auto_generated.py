@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoporder',
+            name='auto_generated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -169,6 +169,7 @@ class ShopOrder(models.Model):
     )
     
     state = FSMField(default=ShopOrderState.DRAFT, choices=ShopOrderState.choices, protected=True)
+    auto_generated = models.BooleanField(default=False)  # drafted by the replenishment engine, not edited since
     
     # Dates
     submitted_at = models.DateTimeField(null=True, blank=True)
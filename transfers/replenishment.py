@@ -0,0 +1,212 @@
+"""
+Draft shop orders from sales velocity
+
+Every (shop, product) pair of a tenant is laid out as one cell of a
+shops x products NumPy matrix. Recent sales, stock on hand, stock in
+transit and quantities already on order are each loaded with a single
+grouped query, summed as floats to skip Decimal conversion of every row,
+and scattered into their matrix, so days of cover and suggested
+quantities are computed for all SKUs at once. Shops with something to
+order get one draft ShopOrder to their parent store.
+"""
+import uuid
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+from core.models import Location
+from inventory.models import Product, ReorderPoint, StockBalance
+from sales.models import RefundItem, SaleItem
+from .models import ShopOrder, ShopOrderItem, ShopOrderState
+
+
+# Orders still to be delivered; their outstanding quantities count as stock
+OPEN_ORDER_STATES = [
+    ShopOrderState.DRAFT, ShopOrderState.SUBMITTED, ShopOrderState.APPROVED, ShopOrderState.PARTIALLY_FULFILLED,
+]
+
+
+class StockGrid:
+    """
+    Quantities of every product at every shop of a tenant, one cell per pair
+    """
+    
+    def __init__(self, shop_ids, product_ids):
+        self.shop_ids = list(shop_ids)
+        self.product_ids = list(product_ids)
+        self.shop_index = {shop_id: i for i, shop_id in enumerate(self.shop_ids)}
+        self.product_index = {product_id: j for j, product_id in enumerate(self.product_ids)}
+    
+    def matrix(self, rows, fill=0.0):
+        """
+        Scatter (shop_id, product_id, quantity) rows into a shops x products
+        array; pairs outside the grid are dropped, repeated pairs summed
+        """
+        grid = np.full((len(self.shop_ids), len(self.product_ids)), fill)
+        cells = [
+            (self.shop_index[shop_id], self.product_index[product_id], float(quantity))
+            for shop_id, product_id, quantity in rows
+            if shop_id in self.shop_index and product_id in self.product_index and quantity is not None
+        ]
+        if cells:
+            i, j, quantities = (np.array(column) for column in zip(*cells))
+            if fill:
+                grid[i, j] = 0.0
+            np.add.at(grid, (i, j), quantities)
+        return grid
+
+
+def _float_sum(expression):
+    return Cast(Sum(expression), FloatField())
+
+
+def shop_store_pairs(tenant_id):
+    """
+    Active shops of a tenant supplied by an active parent store
+    """
+    return dict(
+        Location.objects.filter(
+            tenant_id=tenant_id,
+            location_type='shop',
+            is_active=True,
+            parent_location__location_type='store',
+            parent_location__is_active=True,
+        ).values_list('id', 'parent_location_id')
+    )
+
+
+def units_sold(tenant_id, shop_ids, since):
+    """
+    (shop_id, product_id, quantity) sold since a point in time, net of
+    refunds
+    """
+    sold = SaleItem.objects.filter(
+        sale__tenant_id=tenant_id, sale__shop_id__in=shop_ids, sale__created_at__gte=since
+    ).exclude(sale__state='voided').values('sale__shop_id', 'product_id').annotate(quantity=_float_sum('quantity'))
+    refunded = RefundItem.objects.filter(
+        refund__state__in=['approved', 'completed'],
+        sale_item__sale__tenant_id=tenant_id,
+        sale_item__sale__shop_id__in=shop_ids,
+        sale_item__sale__created_at__gte=since,
+    ).exclude(sale_item__sale__state='voided').values(
+        'sale_item__sale__shop_id', 'sale_item__product_id'
+    ).annotate(quantity=_float_sum('quantity'))
+    
+    yield from (
+        (row['sale__shop_id'], row['product_id'], row['quantity']) for row in sold
+    )
+    yield from (
+        (row['sale_item__sale__shop_id'], row['sale_item__product_id'], -row['quantity']) for row in refunded
+    )
+
+
+def suggest_quantities(sold, on_hand, in_transit, on_order, reorder_point, max_level,
+                       lookback_days, cover_days, reorder_days):
+    """
+    Days of cover and suggested order quantities, element-wise
+    
+    A pair is due when its stock position (on hand + in transit + on
+    order) covers fewer than reorder_days of sales, or is at or below its
+    reorder point. It is ordered up to cover_days of sales, or its max
+    level (else reorder point) if that is higher, in whole units.
+    reorder_point and max_level are NaN where unset. Returns
+    (velocity, days_of_cover, suggested).
+    """
+    velocity = np.maximum(sold, 0.0) / lookback_days
+    position = on_hand + in_transit + on_order
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(velocity > 0, position / velocity, np.inf)
+    
+    target = np.fmax(velocity * cover_days, np.where(np.isnan(max_level), reorder_point, max_level))
+    due = (days_of_cover < reorder_days) | (position <= reorder_point)
+    suggested = np.where(due, np.ceil(np.round(target - position, 3)), 0.0)
+    return velocity, days_of_cover, np.maximum(suggested, 0.0)
+
+
+def draft_replenishment_orders(tenant_id, created_by=None):
+    """
+    Replace a tenant's auto-generated draft shop orders with fresh ones
+    
+    Drafts still untouched by a manager from the previous run are deleted
+    first so quantities are never suggested twice; editing a draft clears
+    its auto_generated flag (ShopOrderService.mark_edited), so edited
+    drafts, orders drafted by hand and orders already submitted count as
+    stock on order. Returns the new orders.
+    """
+    lookback_days = settings.REPLENISHMENT_LOOKBACK_DAYS
+    pairs = shop_store_pairs(tenant_id)
+    product_ids = list(Product.objects.filter(tenant_id=tenant_id, is_active=True).values_list('id', flat=True))
+    if not pairs or not product_ids:
+        return []
+    
+    grid = StockGrid(pairs, product_ids)
+    since = timezone.now() - timedelta(days=lookback_days)
+    
+    with transaction.atomic():
+        ShopOrder.objects.filter(
+            tenant_id=tenant_id, shop_id__in=grid.shop_ids, state=ShopOrderState.DRAFT, auto_generated=True
+        ).delete()
+        
+        stock = StockBalance.objects.filter(location_id__in=grid.shop_ids).values('location_id', 'product_id').annotate(
+            on_hand=_float_sum('quantity_on_hand'), in_transit=_float_sum('quantity_in_transit')
+        )
+        stock = [(row['location_id'], row['product_id'], row['on_hand'], row['in_transit']) for row in stock]
+        open_orders = ShopOrderItem.objects.filter(
+            order__shop_id__in=grid.shop_ids, order__state__in=OPEN_ORDER_STATES
+        ).values_list('order__shop_id', 'product_id').annotate(
+            outstanding=_float_sum(F('quantity_ordered') - F('quantity_fulfilled'))
+        )
+        reorder_points = list(
+            ReorderPoint.objects.filter(location_id__in=grid.shop_ids, is_active=True).values_list(
+                'location_id', 'product_id', 'reorder_point', 'max_level'
+            )
+        )
+        
+        velocity, days_of_cover, suggested = suggest_quantities(
+            sold=grid.matrix(units_sold(tenant_id, grid.shop_ids, since)),
+            on_hand=grid.matrix((shop, product, on_hand) for shop, product, on_hand, _ in stock),
+            in_transit=grid.matrix((shop, product, in_transit) for shop, product, _, in_transit in stock),
+            on_order=grid.matrix(open_orders),
+            reorder_point=grid.matrix(((shop, product, point) for shop, product, point, _ in reorder_points), fill=np.nan),
+            max_level=grid.matrix(((shop, product, level) for shop, product, _, level in reorder_points), fill=np.nan),
+            lookback_days=lookback_days,
+            cover_days=settings.REPLENISHMENT_COVER_DAYS,
+            reorder_days=settings.REPLENISHMENT_REORDER_DAYS,
+        )
+        
+        shop_rows, product_columns = np.nonzero(suggested)
+        if not len(shop_rows):
+            return []
+        
+        today = timezone.localdate()
+        orders = {}
+        for i in np.unique(shop_rows):
+            shop_id = grid.shop_ids[i]
+            orders[i] = ShopOrder(
+                tenant_id=tenant_id,
+                order_number=f"SO-{today:%Y%m%d}-{str(uuid.uuid4())[:8].upper()}",
+                shop_id=shop_id,
+                store_id=pairs[shop_id],
+                auto_generated=True,
+                created_by=created_by,
+                notes=f'Drafted from {lookback_days} days of sales',
+            )
+        ShopOrder.objects.bulk_create(orders.values())
+        
+        items = []
+        for i, j in zip(shop_rows.tolist(), product_columns.tolist()):
+            cover = days_of_cover[i, j]
+            items.append(ShopOrderItem(
+                order=orders[i],
+                product_id=grid.product_ids[j],
+                quantity_ordered=int(suggested[i, j]),
+                notes=(
+                    f'Selling {velocity[i, j]:.2f}/day, {max(cover, 0):.1f} days of cover'
+                    if np.isfinite(cover) else 'At or below reorder point'
+                ),
+            ))
+        ShopOrderItem.objects.bulk_create(items, batch_size=1000)
+    return list(orders.values())
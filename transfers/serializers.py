@@ -61,12 +61,12 @@ class ShopOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShopOrder
         fields = ['id', 'tenant', 'order_number', 'shop', 'shop_name', 'store', 'store_name',
-                  'state', 'state_display', 'submitted_at', 'approved_at',
+                  'state', 'state_display', 'auto_generated', 'submitted_at', 'approved_at',
                   'expected_delivery_date', 'fulfilled_at', 'created_by',
                   'created_by_username', 'submitted_by', 'submitted_by_username',
                   'approved_by', 'approved_by_username', 'notes', 'items',
                   'created_at', 'updated_at']
-        read_only_fields = ['id', 'order_number', 'state', 'submitted_at', 'approved_at',
+        read_only_fields = ['id', 'order_number', 'state', 'auto_generated', 'submitted_at', 'approved_at',
                            'fulfilled_at', 'created_at', 'updated_at']
 
 
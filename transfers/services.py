@@ -3,10 +3,8 @@ Business logic services for transfers
 """
 from django.db import transaction
 from django.utils import timezone
-from decimal import Decimal
 from .models import Transfer, TransferItem, ShopOrder, ShopOrderItem
 from inventory.services import InventoryService
-from inventory.models import StockBalance
 
 
 class TransferService:
@@ -23,63 +21,62 @@ class TransferService:
         if transfer.state != 'draft':
             raise ValueError(f"Cannot send transfer in state: {transfer.state}")
         
-        # Check stock availability for all items
-        for item in transfer.items.all():
-            available, stock_balance = InventoryService.check_stock_availability(
-                transfer.from_location,
-                item.product,
-                item.quantity_ordered,
-                item.batch
-            )
-            
-            if not available:
+        # Lock source stock, then check availability for all items
+        items = list(transfer.items.select_related('product', 'batch'))
+        source_balances = InventoryService.lock_balances(
+            [(transfer.from_location, item.product, item.batch) for item in items]
+        )
+        for item in items:
+            stock_balance = source_balances[
+                InventoryService.balance_key(transfer.from_location, item.product, item.batch)
+            ]
+            if stock_balance.available_quantity < item.quantity_ordered:
                 raise ValueError(
                     f"Insufficient stock for {item.product.name}. "
-                    f"Available: {stock_balance.quantity_on_hand if stock_balance else 0}"
+                    f"Available: {stock_balance.quantity_on_hand}"
                 )
         
         # Move stock to in-transit
-        for item in transfer.items.all():
-            # Update stock balance to mark as in-transit
-            stock_balance, _ = StockBalance.objects.get_or_create(
-                tenant=transfer.tenant,
-                location=transfer.from_location,
-                product=item.product,
-                batch=item.batch,
-                defaults={'quantity_on_hand': Decimal('0'), 'quantity_in_transit': Decimal('0')}
-            )
+        movements = []
+        for item in items:
+            stock_balance = source_balances[
+                InventoryService.balance_key(transfer.from_location, item.product, item.batch)
+            ]
+            unit_cost = item.unit_cost or stock_balance.average_cost
+            if item.unit_cost is None and unit_cost is not None:
+                # Carried to the destination's average cost on receipt
+                item.unit_cost = unit_cost
+                item.save(update_fields=['unit_cost'])
             
-            # Create ledger entry for outbound
-            InventoryService.create_ledger_entry(
-                tenant=transfer.tenant,
-                location=transfer.from_location,
-                product=item.product,
-                batch=item.batch,
-                transaction_type='dispatch',
-                quantity_out=item.quantity_ordered,
-                unit_cost=item.unit_cost or stock_balance.average_cost,
-                reference_id=transfer.id,
-                reference_type='transfer',
-                quantity_in_transit=stock_balance.quantity_in_transit + item.quantity_ordered,
-                notes=f'Transfer {transfer.transfer_number} - dispatched',
-                created_by=sent_by_user
-            )
+            # Outbound at the source
+            movements.append({
+                'location': transfer.from_location,
+                'product': item.product,
+                'batch': item.batch,
+                'transaction_type': 'dispatch',
+                'quantity_out': item.quantity_ordered,
+                'unit_cost': unit_cost,
+                'reference_id': transfer.id,
+                'reference_type': 'transfer',
+                'notes': f'Transfer {transfer.transfer_number} - dispatched',
+                'created_by': sent_by_user,
+            })
             
-            # Create ledger entry for inbound at destination (in-transit)
-            InventoryService.create_ledger_entry(
-                tenant=transfer.tenant,
-                location=transfer.to_location,
-                product=item.product,
-                batch=item.batch,
-                transaction_type='transfer',
-                quantity_in=item.quantity_ordered,
-                unit_cost=item.unit_cost or stock_balance.average_cost,
-                reference_id=transfer.id,
-                reference_type='transfer',
-                quantity_in_transit=item.quantity_ordered,
-                notes=f'Transfer {transfer.transfer_number} - in transit',
-                created_by=sent_by_user
-            )
+            # At destination: in transit, not yet on hand
+            movements.append({
+                'location': transfer.to_location,
+                'product': item.product,
+                'batch': item.batch,
+                'transaction_type': 'transfer',
+                'unit_cost': unit_cost,
+                'reference_id': transfer.id,
+                'reference_type': 'transfer',
+                'quantity_in_transit': item.quantity_ordered,
+                'notes': f'Transfer {transfer.transfer_number} - in transit',
+                'created_by': sent_by_user,
+            })
+        
+        InventoryService.create_ledger_entries(transfer.tenant, movements, balances=source_balances)
         
         # Update transfer state
         transfer.send(sent_by_user)
@@ -101,41 +98,34 @@ class TransferService:
             received_items = {}
         
         all_received = True
-        for item in transfer.items.all():
+        movements = []
+        for item in transfer.items.select_related('product', 'batch'):
             quantity_received = received_items.get(str(item.id), item.quantity_ordered)
             item.quantity_received = quantity_received
             
             if quantity_received > 0:
-                # Get stock balance at destination
-                stock_balance, _ = StockBalance.objects.get_or_create(
-                    tenant=transfer.tenant,
-                    location=transfer.to_location,
-                    product=item.product,
-                    batch=item.batch,
-                    defaults={'quantity_on_hand': Decimal('0'), 'quantity_in_transit': Decimal('0')}
-                )
-                
                 # Move from in-transit to on-hand
-                InventoryService.create_ledger_entry(
-                    tenant=transfer.tenant,
-                    location=transfer.to_location,
-                    product=item.product,
-                    batch=item.batch,
-                    transaction_type='receive',
-                    quantity_in=quantity_received,
-                    unit_cost=item.unit_cost or stock_balance.average_cost,
-                    reference_id=transfer.id,
-                    reference_type='transfer',
-                    quantity_in_transit=stock_balance.quantity_in_transit - quantity_received,
-                    notes=f'Transfer {transfer.transfer_number} - received',
-                    created_by=received_by_user
-                )
+                movements.append({
+                    'location': transfer.to_location,
+                    'product': item.product,
+                    'batch': item.batch,
+                    'transaction_type': 'receive',
+                    'quantity_in': quantity_received,
+                    'unit_cost': item.unit_cost,
+                    'reference_id': transfer.id,
+                    'reference_type': 'transfer',
+                    'quantity_in_transit': -quantity_received,
+                    'notes': f'Transfer {transfer.transfer_number} - received',
+                    'created_by': received_by_user,
+                })
                 
                 item.save()
             
             if quantity_received < item.quantity_ordered:
                 all_received = False
         
+        InventoryService.create_ledger_entries(transfer.tenant, movements)
+        
         # Update transfer state
         if all_received:
             transfer.receive(received_by_user)
@@ -151,6 +141,17 @@ class ShopOrderService:
     Service class for shop order operations
     """
     
+    @staticmethod
+    def mark_edited(order_id):
+        """
+        Hand an auto-generated draft over to the manager editing it, so the
+        next replenishment run keeps it (as stock on order) instead of
+        replacing it
+        """
+        ShopOrder.objects.filter(id=order_id, state='draft', auto_generated=True).update(
+            auto_generated=False, updated_at=timezone.now()
+        )
+    
     @staticmethod
     @transaction.atomic
     def fulfill_order(order, fulfilled_items=None):
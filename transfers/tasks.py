@@ -0,0 +1,15 @@
+"""
+Background tasks for transfers
+"""
+from celery import shared_task
+from core.models import Tenant
+from .replenishment import draft_replenishment_orders as draft_orders
+
+
+@shared_task(ignore_result=True)
+def draft_replenishment_orders():
+    """
+    Redraft replenishment shop orders for every active tenant
+    """
+    tenant_ids = Tenant.objects.filter(is_active=True).values_list('id', flat=True)
+    return sum(len(draft_orders(tenant_id)) for tenant_id in tenant_ids)
@@ -0,0 +1,74 @@
+from decimal import Decimal
+from django.test import TestCase
+from config.models import SystemConfiguration
+from core.models import Location, Tenant, User
+from inventory.models import Product, StockBalance
+from inventory.services import InventoryService
+from .models import Transfer, TransferItem, TransferState
+from .services import TransferService
+
+
+class TransferServiceTests(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name='Shop', slug='shop')
+        SystemConfiguration.objects.create(tenant=self.tenant)
+        self.store = Location.objects.create(tenant=self.tenant, name='Store', code='ST', location_type='store')
+        self.shop = Location.objects.create(tenant=self.tenant, name='Shop', code='SH', location_type='shop')
+        self.user = User.objects.create_user(username='keeper', password='secret', tenant=self.tenant)
+        self.bread = Product.objects.create(tenant=self.tenant, name='Bread', sku='BREAD', track_batches=False)
+        InventoryService.create_ledger_entry(
+            tenant=self.tenant, location=self.store, product=self.bread, transaction_type='adjustment',
+            quantity_in=Decimal('10'), unit_cost=Decimal('2'), reference_type='test',
+        )
+        self.transfer = Transfer.objects.create(
+            tenant=self.tenant, transfer_number='TRF-1', from_location=self.store, to_location=self.shop,
+            created_by=self.user,
+        )
+        self.item = TransferItem.objects.create(transfer=self.transfer, product=self.bread, quantity_ordered=Decimal('6'))
+    
+    def balance(self, location):
+        return StockBalance.objects.get(location=location, product=self.bread, batch=None)
+    
+    def send(self):
+        return TransferService.send_transfer(Transfer.objects.get(id=self.transfer.id), self.user)
+    
+    def receive(self, received_items=None):
+        return TransferService.receive_transfer(Transfer.objects.get(id=self.transfer.id), self.user, received_items)
+    
+    def test_send_moves_stock_in_transit(self):
+        transfer = self.send()
+        
+        self.assertEqual(transfer.state, TransferState.SENT)
+        self.assertEqual(self.balance(self.store).quantity_on_hand, Decimal('4'))
+        shop = self.balance(self.shop)
+        self.assertEqual((shop.quantity_on_hand, shop.quantity_in_transit), (Decimal('0'), Decimal('6')))
+        self.assertEqual(TransferItem.objects.get(id=self.item.id).unit_cost, Decimal('2'))
+    
+    def test_receive_moves_stock_in_transit_on_hand(self):
+        self.send()
+        
+        transfer = self.receive()
+        
+        self.assertEqual(transfer.state, TransferState.RECEIVED)
+        shop = self.balance(self.shop)
+        self.assertEqual((shop.quantity_on_hand, shop.quantity_in_transit), (Decimal('6'), Decimal('0')))
+        self.assertEqual(shop.average_cost, Decimal('2'))
+    
+    def test_partial_receipt_leaves_the_rest_in_transit(self):
+        self.send()
+        
+        transfer = self.receive({str(self.item.id): Decimal('4')})
+        
+        self.assertEqual(transfer.state, TransferState.PARTIALLY_RECEIVED)
+        shop = self.balance(self.shop)
+        self.assertEqual((shop.quantity_on_hand, shop.quantity_in_transit), (Decimal('4'), Decimal('2')))
+    
+    def test_send_without_enough_stock_changes_nothing(self):
+        TransferItem.objects.filter(id=self.item.id).update(quantity_ordered=Decimal('11'))
+        
+        with self.assertRaisesMessage(ValueError, 'Insufficient stock for Bread'):
+            self.send()
+        
+        self.assertEqual(self.balance(self.store).quantity_on_hand, Decimal('10'))
+        self.assertFalse(StockBalance.objects.filter(location=self.shop).exists())
+        self.assertEqual(Transfer.objects.get(id=self.transfer.id).state, TransferState.DRAFT)
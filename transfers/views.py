@@ -15,6 +15,7 @@ from .serializers import (
 )
 from .services import TransferService, ShopOrderService
 from core.permissions import IsTenantMember, IsStoresManager, IsShopManager, IsShopAttendant
+from core.idempotency import idempotent
 from core.validators import TransferValidator, InventoryValidator
 from notifications.services import NotificationService
 
@@ -35,6 +36,7 @@ class TransferViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def send(self, request, pk=None):
         """Send a transfer"""
         transfer = self.get_object()
@@ -56,6 +58,7 @@ class TransferViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def receive(self, request, pk=None):
         """Receive a transfer"""
         transfer = self.get_object()
@@ -123,6 +126,10 @@ class ShopOrderViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'submitted_at', 'approved_at']
     ordering = ['-created_at']
     
+    def perform_update(self, serializer):
+        order = serializer.save()
+        ShopOrderService.mark_edited(order.id)
+    
     @action(detail=True, methods=['post'])
     def submit(self, request, pk=None):
         """Submit order for approval"""
@@ -176,6 +183,18 @@ class ShopOrderItemViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['order', 'product']
+    
+    def perform_create(self, serializer):
+        item = serializer.save()
+        ShopOrderService.mark_edited(item.order_id)
+    
+    def perform_update(self, serializer):
+        item = serializer.save()
+        ShopOrderService.mark_edited(item.order_id)
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        ShopOrderService.mark_edited(instance.order_id)
 
 
 class ReturnRequestViewSet(viewsets.ModelViewSet):